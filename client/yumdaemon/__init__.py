@@ -91,6 +91,10 @@ INTERFACE = ORG
 ORG_READONLY = 'org.baseurl.YumSession'
 INTERFACE_READONLY = ORG_READONLY
 
+# Version 2 of the DBus API (native DBus types), it is located on this path with
+# the interface name <interface>.v2
+PATH_V2 = '/v2'
+
 DBUS_ERR_RE = re.compile('^GDBus.Error:([\w\.]*): (.*)$')
 
 ###############################################################################
@@ -110,6 +114,9 @@ class YumLockedError(YumDaemonError):
 class YumTransactionError(YumDaemonError):
     'The yum transaction failed'
 
+class YumCancelledError(YumDaemonError):
+    'The method call was cancelled'
+
 ###############################################################################
 # Helper Classes
 ###############################################################################
@@ -161,6 +168,7 @@ class YumDaemonBase:
         self.dbus_org = org
         self.dbus_interface = interface
         self.daemon = self._get_daemon(bus, org, interface)
+        self.daemon_v2 = None
         logger.debug("%s daemon loaded - version :  %s" % (interface,self.daemon.GetVersion()))
 
     def _get_daemon(self,bus, org, interface):
@@ -173,6 +181,15 @@ class YumDaemonBase:
         except Exception as err:
             self._handle_dbus_error(err)
 
+    def _get_daemon_v2(self):
+        ''' Get the dbus proxy object for the version 2 API'''
+        if not self.daemon_v2:
+            try:
+                self.daemon_v2 = self.bus.get(self.dbus_org, PATH_V2, self.dbus_interface+'.v2')
+            except Exception as err:
+                self._handle_dbus_error(err)
+        return self.daemon_v2
+
     def _on_g_signal(self, proxy, sender, signal, params):
         '''
         DBUS signal Handler
@@ -206,6 +223,8 @@ class YumDaemonBase:
             raise YumLockedError(msg)
         elif exc == self.dbus_org+'.YumTransactionError':
             raise YumTransactionError(msg)
+        elif exc == self.dbus_org+'.YumCancelledError':
+            raise YumCancelledError(msg)
         elif exc == self.dbus_org+'.YumNotImplementedError':
             raise YumTransactionError(msg)
         else:
@@ -257,9 +276,26 @@ class YumDaemonBase:
         :param cmd: method to run
         :type cmd: string
         '''
+        return self._run_proxy_async(self.daemon, cmd, *args)
+
+    def _run_dbus_async_v2(self, cmd, *args):
+        '''
+        Make an async call to a DBus method in the version 2 API of the yumdaemon service
+        :param cmd: method to run
+        :type cmd: string
+        '''
+        return self._run_proxy_async(self._get_daemon_v2(), cmd, *args)
+
+    def _run_proxy_async(self, proxy, cmd, *args):
+        '''
+        Make an async call to a DBus method on a given proxy object
+        :param proxy: DBus proxy object
+        :param cmd: method to run
+        :type cmd: string
+        '''
         main_loop = GObject.MainLoop()
         data = {'main_loop': main_loop}
-        func = getattr(self.daemon,cmd)
+        func = getattr(proxy,cmd)
         func(*args, result_handler=self._return_handler, user_data=data, timeout=GObject.G_MAXINT) # timeout = infinite
         data['main_loop'].run()
         result = self._get_result(data)
@@ -336,6 +372,33 @@ class YumDaemonBase:
         except Exception as err:
             self._handle_dbus_error(err)
 
+    def SetProgressRate(self, rate):
+        '''
+        Set the max number of progress signals (UpdateProgress, RPMProgress) per second
+        for a file or package, the final progress signal is always sent.
+
+        :param rate: max signals per second (0 = no limit)
+        :type rate: integer (i)
+        :return: the new rate
+        '''
+        try:
+            return self.daemon.SetProgressRate("(i)", rate)
+        except Exception as err:
+            self._handle_dbus_error(err)
+
+    def Cancel(self):
+        '''
+        Cancel the pending method calls, made by this client.
+        It can be called while waiting for an async call (Ex. from a signal or GUI handler),
+        the cancelled calls will raise YumCancelledError.
+
+        :return: True if a pending call was found
+        '''
+        try:
+            return self.daemon.Cancel()
+        except Exception as err:
+            self._handle_dbus_error(err)
+
     def GetPackageWithAttributes(self, pkg_filter, fields):
         '''
         Get a list of pkg list for a given package filter
@@ -351,6 +414,61 @@ class YumDaemonBase:
         return json.loads(result)
 
 
+    def OpenPackageCursor(self, pkg_filter, fields):
+        '''
+        Open a cursor to get the result of GetPackageWithAttributes in chunks using FetchNext
+
+        :param pkg_filter: package filter ('installed','available','updates','obsoletes','recent','extras')
+        :type pkg_filter: string
+        :param fields: yum package objects attributes to get.
+        :type fields: list of strings
+        :return: (cursor id, number of packages)
+        '''
+        return self._run_dbus_async('OpenPackageCursor','(sas)',pkg_filter, fields)
+
+    def FetchNext(self, cursor, num):
+        '''
+        Get the next chunk of pkg lists from a cursor, opened with OpenPackageCursor
+
+        :param cursor: cursor id
+        :param num: max number of packages to get
+        :return: list of [pkg_id, field,....] lists, empty when there is no more packages
+        '''
+        return json.loads(self._run_dbus_async('FetchNext','(ii)',cursor, num))
+
+    def CloseCursor(self, cursor):
+        '''
+        Close a cursor, opened with OpenPackageCursor, before all packages is fetched
+
+        :param cursor: cursor id
+        '''
+        return self._run_dbus_async('CloseCursor','(i)',cursor)
+
+    def GetPackageWithAttributesChunked(self, pkg_filter, fields, chunk_size=500):
+        '''
+        Same as GetPackageWithAttributes, but the packages is fetched from the daemon in chunks,
+        so the first packages can be used before the whole list is received.
+        it is a generator returning a list of pkg lists for each chunk
+
+        :param pkg_filter: package filter ('installed','available','updates','obsoletes','recent','extras')
+        :type pkg_filter: string
+        :param fields: yum package objects attributes to get.
+        :type fields: list of strings
+        :param chunk_size: max number of packages in each chunk
+        :type chunk_size: integer
+        '''
+        cursor, total = self.OpenPackageCursor(pkg_filter, fields)
+        try:
+            while True:
+                chunk = self.FetchNext(cursor, chunk_size)
+                if not chunk:
+                    cursor = None
+                    break
+                yield chunk
+        finally:
+            if cursor is not None:
+                self.CloseCursor(cursor)
+
     def GetRepositories(self, repo_filter):
         '''
         Get a list of repository ids where name matches a filter
@@ -408,6 +526,28 @@ class YumDaemonBase:
             result = json.loads(result)
         return result
 
+    def GetAttributes(self, pkg_ids, attrs):
+        '''
+        Get a list of yum package attributes for a list of packages in one call
+
+        :param pkg_ids: list of pkg_ids to get attributes from
+        :param attrs: list of attribute names to get (summary, size, action etc.)
+        :return: list with a row of attribute values (in same order as attrs) for each pkg_id,
+                 the value is None if the package or attribute is not found
+        '''
+        result = self._run_dbus_async('GetAttributes','(asas)',pkg_ids, attrs)
+        return json.loads(result)
+
+    def GetActions(self, pkg_ids):
+        '''
+        Get the available action (install, update, remove etc) for a list of packages
+        in one call, it is the same as GetAttribute(pkg_id, 'action') for each pkg_id
+
+        :param pkg_ids: list of pkg_ids to get actions for
+        :return: list of actions, in same order as pkg_ids ('' if the package was not found)
+        '''
+        return self._run_dbus_async('GetActions','(as)',pkg_ids)
+
     def GetUpdateInfo(self, pkg_id):
         '''
         Get Updateinfo for a package
@@ -442,6 +582,45 @@ class YumDaemonBase:
         return self._run_dbus_async('GetPackagesByName','(sb)',name, newest_only)
 
 
+    def GetCacheStats(self):
+        '''
+        Get the usage of the daemon caches (Ex. the search result cache)
+
+        :return: dict with cache name -> {'entries', 'size', 'max_entries', 'max_size', 'hits', 'misses'}
+        '''
+        return json.loads(self._run_dbus_async('GetCacheStats'))
+
+    def GetStats(self):
+        '''
+        Get the statistics for the daemon methods (number of calls, errors and latency),
+        the latency is split in total, compute, json and marshal (DBus) time.
+
+        :return: dict with method name -> {'count', 'errors', 'total', 'compute', 'json', 'marshal'}
+                 where each time is a dict with {'sum', 'p50', 'p95', 'p99'} (secs)
+        '''
+        try:
+            return json.loads(self.daemon.GetStats())
+        except Exception as err:
+            self._handle_dbus_error(err)
+
+    def StartProfiling(self, mode):
+        '''
+        Start profiling the daemon method calls, the results is written by StopProfiling
+
+        :param mode: 'cprofile' (a .prof file per method) or 'sample' (collapsed stacks per method)
+        :type mode: string
+        :return: the directory the results is written to
+        '''
+        return self._run_dbus_async('StartProfiling', '(s)', mode)
+
+    def StopProfiling(self):
+        '''
+        Stop profiling the daemon method calls and write the results
+
+        :return: list of the files written
+        '''
+        return self._run_dbus_async('StopProfiling')
+
     def GetGroups(self):
         '''
         Get list of Groups
@@ -457,6 +636,15 @@ class YumDaemonBase:
         '''
         return self._run_dbus_async('GetGroupPackages', '(ss)', grp_id, grp_flt)
 
+    def GetAllGroupPackages(self, grp_flt):
+        '''
+        Get packages in all groups in one call
+
+        :param grp_flt: the filter ('all' = all packages ,'default' = packages to be installed, before the group is installed)
+        :return: dict with group id as key and a list of package ids as value
+        '''
+        return json.loads(self._run_dbus_async('GetAllGroupPackages', '(s)', grp_flt))
+
 
     def Search(self, fields, keys, match_all, newest_only, tags):
         '''
@@ -483,6 +671,110 @@ class YumDaemonBase:
         '''
         self._run_dbus_async('Exit')
 
+###############################################################################
+# API Methods (Version 2 API)
+#
+# packages is (name, epoch, ver, rel, arch, repo_id) tuples and
+# attributes, config & repo settings is returned as dicts
+###############################################################################
+
+    def GetPackagesV2(self, pkg_filter):
+        '''
+        Get a list of packages for a given filter (installed, updates ..)
+
+        :param pkg_filter: package filter ('installed','available','updates','obsoletes','recent','extras')
+        :type pkg_filter: string
+        :return: list of (n, e, v, r, a, repo_id) tuples
+        '''
+        return self._run_dbus_async_v2('GetPackages','(s)',pkg_filter)
+
+    def GetPackageWithAttributesV2(self, pkg_filter, fields):
+        '''
+        Get a list of (package, attributes) pairs for a given package filter
+
+        :param pkg_filter: package filter ('installed','available','updates','obsoletes','recent','extras')
+        :type pkg_filter: string
+        :param fields: yum package objects attributes to get.
+        :type fields: list of strings
+        :return: list of ((n, e, v, r, a, repo_id), {field: value, ...}) pairs
+        '''
+        return self._run_dbus_async_v2('GetPackageWithAttributes','(sas)',pkg_filter, fields)
+
+    def GetPackagesByNameV2(self, name, newest_only=True):
+        '''
+        Get a list of packages for starts with name
+
+        :param name: name prefix to match
+        :type name: string
+        :param newest_only: show only the newest match or every match.
+        :type newest_only: boolean
+        :return: list of (n, e, v, r, a, repo_id) tuples
+        '''
+        return self._run_dbus_async_v2('GetPackagesByName','(sb)',name, newest_only)
+
+    def SearchV2(self, fields, keys, match_all, newest_only, tags):
+        '''
+        Search for packages where keys is matched in fields (see Search)
+
+        :return: list of (n, e, v, r, a, repo_id) tuples
+        '''
+        return self._run_dbus_async_v2('Search','(asasbbb)',fields, keys, match_all, newest_only, tags)
+
+    def GetAttributesV2(self, pkgs, attrs):
+        '''
+        Get a dict of yum package attributes for each package in a list
+
+        :param pkgs: list of (n, e, v, r, a, repo_id) tuples
+        :param attrs: list of attribute names to get (summary, size, action etc.)
+        :return: list of {attr: value, ...} dicts, attributes not found is left out
+        '''
+        return self._run_dbus_async_v2('GetAttributes','(a(ssssss)as)',pkgs, attrs)
+
+    def GetActionsV2(self, pkgs):
+        '''
+        Get the available action (install, update, remove etc) for a list of packages
+
+        :param pkgs: list of (n, e, v, r, a, repo_id) tuples
+        :return: list of actions, in same order as pkgs ('' if the package was not found)
+        '''
+        return self._run_dbus_async_v2('GetActions','(a(ssssss))',pkgs)
+
+    def GetUpdateInfoV2(self, pkg):
+        '''
+        Get Updateinfo for a package
+
+        :param pkg: (n, e, v, r, a, repo_id) tuple
+        :return: list of update notice dicts
+        '''
+        return self._run_dbus_async_v2('GetUpdateInfo','((ssssss))',pkg)
+
+    def GetGroupsV2(self):
+        '''
+        Get list of Groups
+
+        :return: list of ((cat_id, cat_name, cat_desc), [(grp_id, grp_name, grp_desc, installed), ...]) pairs
+        '''
+        return self._run_dbus_async_v2('GetGroups')
+
+    def GetConfigV2(self, setting):
+        '''
+        Read config settings from yum.conf
+
+        :param setting: setting to read ('*' = all settings)
+        :type setting: string
+        :return: dict with {setting: value}, empty if setting is not found
+        '''
+        return self._run_dbus_async_v2('GetConfig','(s)',setting)
+
+    def GetRepoV2(self, repo_id):
+        '''
+        Get a dictionary of information about a given repo id.
+
+        :param repo_id: repo id to get information from
+        :return: dictionary with repo info, empty if the repo is not found
+        '''
+        return self._run_dbus_async_v2('GetRepo','(s)',repo_id)
+
 ###############################################################################
 # Helper methods
 ###############################################################################
@@ -492,6 +784,10 @@ class YumDaemonBase:
         (n, e, v, r, a, repo_id)  = str(id).split(',')
         return (n, e, v, r, a, repo_id)
 
+    def to_pkg_id(self, pkg):
+        ''' join a (n, e, v, r, a, repo_id) tuple from the version 2 API into a pkg_id'''
+        return ",".join(pkg)
+
     def to_txmbr_tuple(self, id):
         ''' split the txmbr_id into a tuple'''
         (n, e, v, r, a, repo_id, ts_state)  = str(id).split(',')
@@ -651,6 +947,23 @@ class YumDaemonClient(YumDaemonBase):
         return self._run_dbus_async('RunTransaction')
 
 
+    def GetTransactionV2(self):
+        '''
+        Get the current transaction (Version 2 API)
+
+        :return: list of ((n, e, v, r, a, repo_id), ts_state) pairs
+        '''
+        return self._run_dbus_async_v2('GetTransaction')
+
+    def BuildTransactionV2(self):
+        '''
+        Depsolve the current transaction (Version 2 API)
+
+        :return: (rc, error messages, [(action, [(pkg, size, [obsoleted pkg, ...]), ...]), ...]),
+                 rc = 2 is ok, else failure and the error messages is set
+        '''
+        return self._run_dbus_async_v2('BuildTransaction')
+
     def GetHistoryByDays(self, start_days, end_days):
         '''
         Get History transaction in a interval of days from today
@@ -665,6 +978,23 @@ class YumDaemonClient(YumDaemonBase):
         value = self._run_dbus_async('GetHistoryByDays','(ii)', start_days, end_days)
         return json.loads(value)
 
+    def GetHistoryByDaysPaged(self, start_days, end_days, offset, limit):
+        '''
+        Get a page of the History transaction in a interval of days from today
+
+        :param start_days: start of interval in days from now (0 = today)
+        :type start_days: integer
+        :param end_days:end of interval in days from now
+        :type end_days: integer
+        :param offset: number of transactions to skip (newest first)
+        :type offset: integer
+        :param limit: max. number of transactions to return (0 = no limit)
+        :type limit: integer
+        :return: a list of (transaction is, date-time) pairs
+        '''
+        value = self._run_dbus_async('GetHistoryByDaysPaged','(iiii)', start_days, end_days, offset, limit)
+        return json.loads(value)
+
     def HistorySearch(self, pattern):
         '''
         Search the history for transaction matching a pattern
@@ -689,6 +1019,34 @@ class YumDaemonClient(YumDaemonBase):
         value = self._run_dbus_async('GetHistoryPackages','(i)',tid)
         return json.loads(value)
 
+    def GetHistoryPackagesBulk(self, tids, offset=0, limit=0):
+        '''
+        Get packages from a list of yum history transaction ids, in one call
+
+        :param tids: list of history transaction ids
+        :type tids: list (integers)
+        :param offset: number of packages to skip
+        :type offset: integer
+        :param limit: max. number of packages to return (0 = no limit)
+        :type limit: integer
+        :return: list of (tid, pkg_id, state, installed), newest transaction first
+        :rtype: list
+        '''
+        value = self._run_dbus_async('GetHistoryPackagesBulk','(aiii)', tids, offset, limit)
+        return json.loads(value)
+
+    def GetHistoryPackagesSummary(self, tids):
+        '''
+        Get the number of packages in each state for a list of yum history transaction ids
+
+        :param tids: list of history transaction ids
+        :type tids: list (integers)
+        :return: list of (tid, {state : number of packages}) pairs
+        :rtype: list
+        '''
+        value = self._run_dbus_async('GetHistoryPackagesSummary','(ai)', tids)
+        return json.loads(value)
+
     def ConfirmGPGImport(self, hexkeyid, confirmed):
         '''
         Confirm import of at GPG Key by yum
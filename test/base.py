@@ -3,9 +3,219 @@ import os.path
 sys.path.insert(0,os.path.abspath('client'))
 import unittest
 from datetime import date
-from yumdaemon import YumDaemonClient,YumDaemonReadOnlyClient
+from gi.repository import GObject
+from yumdaemon import YumDaemonClient,YumDaemonReadOnlyClient,YumCancelledError
 
-class TestBase(unittest.TestCase, YumDaemonClient):
+class ApiChecks:
+    '''
+    Checks shared by the session & system API tests
+    '''
+
+    def _check_get_actions(self):
+        '''
+        Check GetActions gives the same actions as GetAttribute
+        '''
+        pkgs = self.GetPackagesByName('yum', newest_only=False)
+        self.assertIsInstance(pkgs, list)
+        actions = self.GetActions(pkgs)
+        self.assertIsInstance(actions, list)
+        self.assertEqual(len(actions), len(pkgs))
+        for pkg_id, action in zip(pkgs, actions):
+            print("  %s : %s" % (pkg_id, action))
+            self.assertEqual(action, self.GetAttribute(pkg_id, 'action'))
+        # a package not found should give an empty action
+        actions = self.GetActions(['notfound,0,1,1,noarch,notfound'])
+        self.assertEqual(actions, [''])
+
+    def _check_get_attributes(self):
+        '''
+        Check GetAttributes gives the same values as GetAttribute
+        '''
+        pkgs = self.GetPackagesByName('yum', newest_only=False)
+        attrs = ['summary', 'size', 'action', 'notfound']
+        result = self.GetAttributes(pkgs, attrs)
+        self.assertIsInstance(result, list)
+        self.assertEqual(len(result), len(pkgs))
+        for pkg_id, row in zip(pkgs, result):
+            print("  %s : %s" % (pkg_id, row[:3]))
+            self.assertEqual(len(row), len(attrs))
+            self.assertEqual(row[0], self.GetAttribute(pkg_id, 'summary'))
+            self.assertEqual(row[2], self.GetAttribute(pkg_id, 'action'))
+            self.assertIsNone(row[3]) # attribute not found
+        # a package not found should give a row of None
+        result = self.GetAttributes(['notfound,0,1,1,noarch,notfound'], attrs)
+        self.assertEqual(result, [[None] * len(attrs)])
+
+    def _check_package_cursor(self):
+        '''
+        Check the cursor chunks gives the same packages as GetPackageWithAttributes,
+        with the same package ids as GetPackages
+        '''
+        fields = ['summary','size']
+        expected = self.GetPackageWithAttributes('installed', fields)
+        result = []
+        for chunk in self.GetPackageWithAttributesChunked('installed', fields, chunk_size=100):
+            self.assertIsInstance(chunk, list)
+            self.assertLessEqual(len(chunk), 100)
+            result.extend(chunk)
+        print("  Got %i packages" % len(result))
+        self.assertEqual(sorted(result), sorted(expected))
+        self.assertEqual([row[0] for row in result], list(self.GetPackages('installed')))
+        # close a cursor before all packages is fetched
+        cursor, total = self.OpenPackageCursor('installed', fields)
+        self.assertEqual(total, len(expected))
+        chunk = self.FetchNext(cursor, 10)
+        self.assertEqual(len(chunk), min(10, total))
+        self.assertTrue(self.CloseCursor(cursor))
+        self.assertFalse(self.CloseCursor(cursor)) # not open anymore
+        self.assertEqual(self.FetchNext(cursor, 10), [])
+
+    def _check_v2_api(self):
+        '''
+        Check the V2 API gives the same results as the JSON API
+        '''
+        pkgs = self.GetPackagesByName('yum', newest_only=False)
+        pkgs_v2 = self.GetPackagesByNameV2('yum', newest_only=False)
+        self.assertEqual(sorted(pkgs), sorted([self.to_pkg_id(pkg) for pkg in pkgs_v2]))
+        for pkg in pkgs_v2:
+            print("  Package : %s" % repr(pkg))
+            self.assertEqual(len(pkg), 6)
+        attrs = self.GetAttributesV2(pkgs_v2, ['summary', 'action', 'notfound'])
+        self.assertEqual(len(attrs), len(pkgs_v2))
+        for pkg, values in zip(pkgs_v2, attrs):
+            self.assertIsInstance(values, dict)
+            self.assertNotIn('notfound', values)
+            self.assertEqual(values['summary'], self.GetAttribute(self.to_pkg_id(pkg), 'summary'))
+        actions = self.GetActionsV2(pkgs_v2)
+        self.assertEqual(actions, [values['action'] for values in attrs])
+        installed = self.GetPackagesV2('installed')
+        self.assertEqual(len(installed), len(self.GetPackages('installed')))
+        groups = self.GetGroupsV2()
+        self.assertEqual(len(groups), len(self.GetGroups()))
+        skip_broken = self.GetConfigV2('skip_broken')
+        self.assertIn(skip_broken['skip_broken'], [True, False])
+        self.assertEqual(self.GetConfigV2('not_found'), {})
+        self.assertEqual(self.GetRepoV2('XYZCYZ'), {})
+
+    def _check_search_cache(self):
+        '''
+        Check a repeated Search is a search cache hit and the cache is inside the limits
+        '''
+        fields = ['name','summary']
+        keys = ['yum','plugin']
+        pkgs = self.Search(fields, keys ,True,True,False)
+        stats = self.GetCacheStats()['search']
+        print("  cache stats : %s" % stats)
+        pkgs_cached = self.Search(fields, keys ,True,True,False)
+        self.assertEqual(pkgs, pkgs_cached)
+        stats_after = self.GetCacheStats()['search']
+        print("  cache stats : %s" % stats_after)
+        self.assertEqual(stats_after['hits'], stats['hits'] + 1)
+        self.assertLessEqual(stats_after['entries'], stats_after['max_entries'])
+        self.assertLessEqual(stats_after['size'], stats_after['max_size'])
+
+    def _check_all_group_packages(self):
+        '''
+        Check GetAllGroupPackages gives the same packages as GetGroupPackages
+        '''
+        result = self.GetAllGroupPackages('default')
+        self.assertIsInstance(result, dict)
+        print("  # of groups : %i" % len(result))
+        for cat, grps in self.GetGroups():
+            for grp in grps:
+                grp_id = grp[0]
+                if grp_id in result:
+                    self.assertEqual(sorted(result[grp_id]), sorted(self.GetGroupPackages(grp_id,'default')))
+
+    def _check_downgrades(self):
+        '''
+        Check the downgrades of an installed package has the downgrade action
+        '''
+        pkgs = self.GetPackagesByName('yum', newest_only=False)
+        for pkg_id in pkgs:
+            downgrades = self.GetAttribute(pkg_id, 'downgrades')
+            self.assertIsInstance(downgrades, list)
+            print("  %s : %s" % (pkg_id, downgrades))
+            if self.GetAttribute(pkg_id, 'action') == 'remove': # installed, the downgrades must be older
+                for down_id in downgrades:
+                    self.assertEqual(self.GetAttribute(down_id, 'action'), 'downgrade')
+
+    def _check_cancel(self):
+        '''
+        Check Cancel without pending calls
+        '''
+        # there is no pending calls from this client, so nothing to cancel
+        self.assertFalse(self.Cancel())
+        # the daemon must still work after a cancel
+        self.assertIsInstance(self.GetPackagesByName('yum'), list)
+
+    def _check_cancel_async(self):
+        '''
+        Check Cancel stops the calls started async, the cancelled calls raises YumCancelledError
+        '''
+        # multi word keys can not be searched in the index, so the searches is slow and
+        # the last ones is still waiting in the daemon, when Cancel is called
+        calls = []
+        for key in ['yum utils', 'python lib', 'gnome shell', 'kernel module']:
+            data = {'main_loop': GObject.MainLoop()}
+            self.daemon.Search('(asasbbb)', ['name', 'summary', 'description'], [key], False, False, False,
+                               result_handler=self._return_handler, user_data=data, timeout=GObject.G_MAXINT)
+            calls.append(data)
+        self.assertTrue(self.Cancel())
+        cancelled = 0
+        for data in calls:
+            if not 'error' in data: # wait for the call to end
+                data['main_loop'].run()
+            try:
+                self.assertIsInstance(self._get_result(data), list)
+            except YumCancelledError:
+                cancelled += 1
+        print("  %i of %i calls cancelled" % (cancelled, len(calls)))
+        self.assertTrue(cancelled > 0)
+        # the daemon must still work after a cancel
+        self.assertIsInstance(self.GetPackagesByName('yum'), list)
+
+    def _check_progress_rate(self):
+        '''
+        Check SetProgressRate returns the new rate (negative = no limit)
+        '''
+        self.assertEqual(self.SetProgressRate(5), 5)
+        self.assertEqual(self.SetProgressRate(-1), 0) # negative rates is no limit
+        self.assertEqual(self.SetProgressRate(10), 10)
+
+    def _check_stats(self):
+        '''
+        Check GetStats counts the calls and the latency percentiles is ordered
+        '''
+        self.GetPackages('installed')
+        self.GetPackages('installed')
+        stats = self.GetStats()
+        print(stats['GetPackages'])
+        self.assertTrue(stats['GetPackages']['count'] >= 2)
+        for part in ('total', 'compute', 'json', 'marshal'):
+            times = stats['GetPackages'][part]
+            self.assertTrue(times['p50'] <= times['p95'] <= times['p99'])
+
+    def _check_profiling(self):
+        '''
+        Check StartProfiling & StopProfiling writes the result files for both modes
+        '''
+        directory = self.StartProfiling('cprofile')
+        print(directory)
+        self.GetPackages('installed')
+        files = self.StopProfiling()
+        print(files)
+        self.assertTrue(files[0].startswith(os.path.join(directory, 'yumdaemon-')))
+        self.assertTrue([fn for fn in files if fn.endswith('-GetPackages.prof')])
+        # the sample mode only writes files for the methods there was running, when a sample was taken
+        self.StartProfiling('sample')
+        self.GetPackages('available')
+        files = self.StopProfiling()
+        print(files)
+        self.assertEqual([fn for fn in files if not fn.endswith('.folded')], [])
+
+
+class TestBase(unittest.TestCase, YumDaemonClient, ApiChecks):
     def __init__(self, methodName='runTest'):
         unittest.TestCase.__init__(self, methodName)
         YumDaemonClient.__init__(self)
@@ -149,7 +359,7 @@ class TestBase(unittest.TestCase, YumDaemonClient):
         print "received signal : GPGImport%s" % (repr(values))
 
 
-class TestBaseReadonly(unittest.TestCase, YumDaemonReadOnlyClient):
+class TestBaseReadonly(unittest.TestCase, YumDaemonReadOnlyClient, ApiChecks):
     def __init__(self, methodName='runTest'):
         unittest.TestCase.__init__(self, methodName)
         YumDaemonReadOnlyClient.__init__(self)
@@ -0,0 +1,160 @@
+import sys, os
+sys.path.insert(0,os.path.abspath('client'))
+import argparse
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+from synthrepo import make_repo, write_yum_config
+
+"""
+Benchmark suite for the yumdaemon session service API, using synthetic repositories
+
+For each repo size, a synthetic repo (primary, filelists, comps & updateinfo) is made
+and the session daemon is started on a private session bus (dbus-run-session) with a
+yum config only using the synthetic repo and an empty installroot.
+The latency and throughput of GetPackages, Search, GetAttribute, GetGroups and GetUpdateInfo
+is measured and written as JSON, together with the daemon's own stats (GetStats),
+so the results for two versions can be compared.
+
+use 'python test/bench-api.py -s 1000,10000,50000 -o bench-api.json' to run the benchmark
+use '-b fake' to run it with the in-memory fake backend of the daemon, instead of yum & synthetic repos
+(needs dbus-run-session and a python with yum for the daemon)
+"""
+
+DAEMON = os.path.abspath('yumdaemon/yumdaemon-session.py')
+
+def summary(name, timings, items):
+    '''
+    return a dict with the stats for a benchmark
+    :param timings: list of timings (secs) for each round
+    :param items: number of items (packages, calls) handled in a round
+    '''
+    avg = sum(timings) / len(timings)
+    return {'method' : name, 'rounds' : timings, 'first' : timings[0], 'min' : min(timings),
+            'avg' : avg, 'max' : max(timings), 'items' : items,
+            'throughput' : items / avg if avg else 0.0}
+
+def measure(name, func, rounds, items=None):
+    '''
+    Run func a number of rounds, items is the number of items a round is handling
+    (None = the length of the result)
+    '''
+    timings = []
+    for i in range(rounds):
+        start = time.time()
+        result = func()
+        timings.append(time.time() - start)
+    if items is None:
+        items = len(result)
+    stats = summary(name, timings, items)
+    print("    %-14s first %8.3f s  min %8.3f s  avg %8.3f s  %10.1f items/s" %
+          (name, stats['first'], stats['min'], stats['avg'], stats['throughput']))
+    return stats
+
+def connect(timeout=60):
+    '''
+    Connect to the session daemon, retry until it is started
+    '''
+    from yumdaemon import YumDaemonReadOnlyClient
+    end = time.time() + timeout
+    while True:
+        try:
+            return YumDaemonReadOnlyClient()
+        except Exception as err:
+            if time.time() > end:
+                raise
+            time.sleep(0.2)
+
+def run_benchmarks(args):
+    '''
+    Run the benchmarks against a session daemon, started on the current (private) session bus
+    '''
+    cmd = [args.daemon_python, DAEMON, '--notimeout']
+    if args.backend == 'fake':
+        cmd += ['--backend', 'fake', '--fake-packages', str(args.size)]
+    else:
+        cmd += ['--yumconf', args.yumconf]
+    daemon = subprocess.Popen(cmd)
+    try:
+        client = connect()
+        client.Lock()
+        results = []
+        rounds = args.rounds
+        results.append(measure('GetPackages', lambda: client.GetPackages('available'), rounds))
+        pkg_ids = client.GetPackages('available')
+        sample = pkg_ids[::max(1, len(pkg_ids) // args.calls)][:args.calls]
+        update_ids = [pkg_id for pkg_id in pkg_ids if ',1.1,' in pkg_id][:args.calls] # the synthetic updates is version 1.1
+        results.append(measure('Search', lambda: client.Search(['name', 'summary'], ['editor', 'library'], True, True, False), rounds))
+        results.append(measure('GetAttribute', lambda: [client.GetAttribute(pkg_id, 'description') for pkg_id in sample],
+                               rounds, len(sample)))
+        results.append(measure('GetGroups', client.GetGroups, rounds))
+        results.append(measure('GetUpdateInfo', lambda: [client.GetUpdateInfo(pkg_id) for pkg_id in update_ids],
+                               rounds, len(update_ids)))
+        server_stats = client.GetStats()
+        client.Unlock()
+        client.Exit()
+    finally:
+        if daemon.poll() is None:
+            time.sleep(1)
+            if daemon.poll() is None:
+                daemon.terminate()
+        daemon.wait()
+    return {'packages' : len(pkg_ids), 'results' : results, 'server_stats' : server_stats}
+
+def run_size(args, size):
+    '''
+    Make a synthetic repo with size packages and run the benchmarks on a private session bus
+    (the fake backend makes the packages in memory, so no repo is needed)
+    '''
+    topdir = tempfile.mkdtemp(prefix='yumdaemon-bench-')
+    try:
+        output = os.path.join(topdir, 'result.json')
+        cmd = ['dbus-run-session', '--', sys.executable, os.path.abspath(__file__), '--run',
+               '--output', output, '--rounds', str(args.rounds), '--size', str(size),
+               '--calls', str(args.calls), '--daemon-python', args.daemon_python, '--backend', args.backend]
+        if args.backend == 'yum':
+            repodir = os.path.join(topdir, 'repo')
+            start = time.time()
+            make_repo(repodir, size)
+            print("  repo with %i packages made in %.1f s" % (size, time.time() - start))
+            cmd += ['--yumconf', write_yum_config(topdir, 'synthrepo-%i' % size, repodir)]
+        subprocess.check_call(cmd)
+        result = json.load(open(output))
+        result['size'] = size
+        result['backend'] = args.backend
+        return result
+    finally:
+        shutil.rmtree(topdir, True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the yumdaemon session service API with synthetic repos')
+    parser.add_argument('-s', '--sizes', default='1000,10000,50000', help='list of repo sizes (packages)')
+    parser.add_argument('-r', '--rounds', type=int, default=3)
+    parser.add_argument('-c', '--calls', type=int, default=100, help='number of calls in a round for the per package methods')
+    parser.add_argument('-o', '--output', default='bench-api.json', help='file to write the results to (JSON)')
+    parser.add_argument('--daemon-python', default='python', help='python used to run the daemon')
+    parser.add_argument('-b', '--backend', choices=['yum', 'fake'], default='yum',
+                        help='daemon backend, fake = in-memory packages (measures the daemon overhead without yum)')
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS) # run the benchmarks on the current bus
+    parser.add_argument('--yumconf', help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        result = run_benchmarks(args)
+        json.dump(result, open(args.output, 'w'))
+        return
+    results = {'date' : time.strftime('%Y-%m-%d %H:%M:%S'), 'host' : platform.node(),
+               'python' : platform.python_version(), 'sizes' : []}
+    for size in [int(size) for size in args.sizes.split(',')]:
+        print("Repo size : %i" % size)
+        results['sizes'].append(run_size(args, size))
+    f = open(args.output, 'w')
+    json.dump(results, f, indent=2, sort_keys=True)
+    f.close()
+    print("results written to %s" % args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+import sys, os
+sys.path.insert(0,os.path.abspath('yumdaemon'))
+import argparse
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+import BaseHTTPServer
+import SimpleHTTPServer
+import SocketServer
+import yum
+from common import DownloadCallback, MultiDownloadCallback, ProgressThrottle
+
+"""
+Benchmark for the parallel downloads in the yumdaemon services
+
+It builds a synthetic repository (a number of noarch packages with a random payload),
+serves it from a local http server with an extra latency on each request and measures
+the time used to download the metadata and all the packages with a given number of
+parallel downloads, using the same download setup & callbacks as the daemon.
+
+use 'python test/bench-download.py -n 50 -s 256 -l 50 -p 1,3,5,10' to run the benchmark
+(needs rpm-build and createrepo)
+"""
+
+SPEC_HEADER = """
+Name:       synthrepo
+Version:    1.0
+Release:    1
+Summary:    Synthetic packages for the yumdaemon download benchmark
+License:    GPLv2+
+BuildArch:  noarch
+
+%%description
+Synthetic packages for the yumdaemon download benchmark
+
+%%install
+mkdir -p %%{buildroot}/usr/share/synthrepo
+for i in $(seq 1 %(num)i); do
+    head -c %(size)i /dev/urandom > %%{buildroot}/usr/share/synthrepo/payload-$i
+done
+"""
+
+SPEC_PACKAGE = """
+%%package -n synth-pkg%(i)i
+Summary:    Synthetic package %(i)i
+
+%%description -n synth-pkg%(i)i
+Synthetic package %(i)i
+
+%%files -n synth-pkg%(i)i
+/usr/share/synthrepo/payload-%(i)i
+"""
+
+def build_repo(topdir, num, size):
+    '''
+    Build a repository with num packages with a payload of size bytes, return the repo dir
+    '''
+    spec = os.path.join(topdir, 'synthrepo.spec')
+    f = open(spec, 'w')
+    f.write(SPEC_HEADER % {'num' : num, 'size' : size})
+    for i in range(1, num+1):
+        f.write(SPEC_PACKAGE % {'i' : i})
+    f.close()
+    repodir = os.path.join(topdir, 'repo')
+    subprocess.check_call(['rpmbuild', '-bb', '--quiet',
+                           '--define', '_topdir %s' % os.path.join(topdir, 'rpmbuild'),
+                           '--define', '_rpmdir %s' % repodir,
+                           '--define', '_binary_payload w0.ufdio', spec])
+    subprocess.check_call(['createrepo', '--quiet', repodir])
+    return repodir
+
+
+class LatencyHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    '''
+    Serve the files in the current dir, with an extra latency on each request
+    '''
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        SimpleHTTPServer.SimpleHTTPRequestHandler.do_GET(self)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadedHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def start_server(repodir, latency):
+    '''
+    Start a http server serving repodir in a thread, return the url of the repo
+    '''
+    os.chdir(repodir)
+    LatencyHandler.latency = latency
+    server = ThreadedHTTPServer(('127.0.0.1', 0), LatencyHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return 'http://127.0.0.1:%i/' % server.server_address[1]
+
+
+class BenchBase:
+    '''
+    Stand-in for the daemon, counting the progress signals sent by the download callbacks
+    '''
+    def __init__(self, yumbase):
+        self._yumbase = yumbase
+        self._progress_throttle = ProgressThrottle(10)
+        self.logger = yumbase.logger
+        self.files = set()
+        self.signals = 0
+
+    def _check_cancel(self):
+        pass
+
+    def UpdateProgress(self, name, frac, fread, ftime):
+        self.files.add(name)
+        self.signals += 1
+
+
+def run_download(url, cachedir, parallel):
+    '''
+    Download the metadata and all the packages from the repo, return (metadata secs, package secs, base)
+    '''
+    yb = yum.YumBase()
+    yb.preconf.init_plugins = False
+    yb.preconf.errorlevel = 0
+    yb.preconf.debuglevel = 0
+    yb.setCacheDir(force=True, reuse=False, tmpdir=cachedir)
+    for repo in yb.repos.repos.values():
+        yb.repos.disableRepo(repo.id)
+    yb.add_enable_repo('synthrepo', baseurls=[url], gpgcheck=False)
+    base = BenchBase(yb)
+    # same setup as YumDaemonBase._setup_downloads
+    yb.repos.setProgressBar(DownloadCallback(base), MultiDownloadCallback(base))
+    yb.conf.max_parallel_downloads = parallel
+    for repo in yb.repos.listEnabled():
+        repo._async = parallel != 1
+    start = time.time()
+    pkgs = yb.pkgSack.returnPackages()
+    md_time = time.time() - start
+    start = time.time()
+    yb.downloadPkgs(pkgs)
+    pkg_time = time.time() - start
+    yb.close()
+    return md_time, pkg_time, base
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the parallel downloads in the yumdaemon services')
+    parser.add_argument('-n', '--packages', type=int, default=50, help='number of packages in the repo')
+    parser.add_argument('-s', '--size', type=int, default=256, help='payload size of a package (KB)')
+    parser.add_argument('-l', '--latency', type=int, default=50, help='extra latency on each request (ms)')
+    parser.add_argument('-p', '--parallel', default='1,3,5,10', help='list of max parallel downloads to test')
+    parser.add_argument('-r', '--rounds', type=int, default=3)
+    args = parser.parse_args()
+    topdir = tempfile.mkdtemp(prefix='yumdaemon-bench-')
+    try:
+        print("Building synthetic repo : %i packages of %i KB" % (args.packages, args.size))
+        repodir = build_repo(topdir, args.packages, args.size * 1024)
+        url = start_server(repodir, args.latency / 1000.0)
+        print("Serving %s with %i ms latency" % (url, args.latency))
+        for parallel in [int(p) for p in args.parallel.split(',')]:
+            timings = []
+            for i in range(args.rounds):
+                cachedir = tempfile.mkdtemp(dir=topdir)
+                md_time, pkg_time, base = run_download(url, cachedir, parallel)
+                shutil.rmtree(cachedir, True)
+                timings.append(pkg_time)
+                print("  parallel %2i round %i : metadata %.3f s, packages %.3f s (%i files, %i signals)" %
+                      (parallel, i+1, md_time, pkg_time, len(base.files), base.signals))
+            print("parallel %2i : min %.3f s, avg %.3f s" % (parallel, min(timings), sum(timings) / len(timings)))
+    finally:
+        os.chdir('/')
+        shutil.rmtree(topdir, True)
+
+if __name__ == '__main__':
+    main()
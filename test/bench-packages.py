@@ -0,0 +1,66 @@
+import sys, os
+sys.path.insert(0,os.path.abspath('client'))
+import argparse
+import time
+from yumdaemon import YumDaemonReadOnlyClient
+
+"""
+Benchmark for the GetPackages api in the yumdaemon session service
+
+It measures the latency of GetPackages(<filter>) using the daemon found on the
+session bus, so run it against the version before and after a change to compare.
+
+use 'python test/bench-packages.py -f available -r 5' to run the benchmark
+
+To compare two versions, start the session daemon from a checkout of each version
+(with the real yum backend, the fake backend is not found in older versions) and run
+the benchmark against it, Ex. for the baseline:
+
+  git worktree add /tmp/yumdaemon-base <baseline commit>
+  python /tmp/yumdaemon-base/yumdaemon/yumdaemon-session.py --notimeout &
+  python test/bench-packages.py -f installed -r 5
+  python test/bench-packages.py -f available -r 5
+
+the 'first' timing is the cold call (package lists & indexes build), 'min' is the warm one.
+"""
+
+class BenchClient(YumDaemonReadOnlyClient):
+
+    def __init__(self):
+        YumDaemonReadOnlyClient.__init__(self)
+
+    def on_UpdateProgress(self,name,frac,fread,ftime):
+        pass
+
+
+def run_benchmark(client, pkg_filter, rounds):
+    '''
+    Run GetPackages(pkg_filter) a number of times and return a list of timings (in secs)
+    '''
+    timings = []
+    for i in range(rounds):
+        start = time.time()
+        pkgs = client.GetPackages(pkg_filter)
+        timings.append(time.time() - start)
+        print("  round %i : %i packages in %.3f s" % (i+1, len(pkgs), timings[-1]))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark GetPackages in the yumdaemon session service')
+    parser.add_argument('-f', '--filter', default='available')
+    parser.add_argument('-r', '--rounds', type=int, default=5)
+    args = parser.parse_args()
+    client = BenchClient()
+    client.Lock()
+    try:
+        print("GetPackages('%s')" % args.filter)
+        timings = run_benchmark(client, args.filter, args.rounds)
+    finally:
+        client.Unlock()
+    print("first : %.3f s" % timings[0])
+    print("min   : %.3f s" % min(timings))
+    print("avg   : %.3f s" % (sum(timings) / len(timings)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+import sys, os
+import gzip
+import time
+import random
+import hashlib
+import argparse
+from xml.sax.saxutils import escape, quoteattr
+
+"""
+Generator for synthetic yum repositories, used by the benchmarks
+
+It writes the repodata (primary, filelists, comps & updateinfo) for a given number of
+packages directly, without building any rpms, so repos with 50k packages can be made in seconds.
+The packages have dependency chains, files, a summary & description made from a small vocabulary
+(for Search), about 10 % of the packages has a newer version with an update notice,
+and the packages is split in groups of 50 packages in categories of 10 groups.
+
+use 'python test/synthrepo.py -n 10000 /tmp/synthrepo' to make a repo
+"""
+
+WORDS = ['alpha', 'beta', 'gamma', 'delta', 'editor', 'viewer', 'library', 'daemon', 'python', 'perl',
+         'network', 'audio', 'video', 'image', 'font', 'devel', 'tools', 'server', 'client', 'plugin',
+         'kernel', 'driver', 'theme', 'game', 'office', 'mail', 'web', 'shell', 'terminal', 'database']
+ARCHS = ['noarch', 'x86_64']
+FILES_PER_PKG = 5
+GROUP_SIZE = 50
+CATEGORY_SIZE = 10
+UPDATE_RATIO = 10 # every 10th package has an update
+
+REPO_NS = 'xmlns="http://linux.duke.edu/metadata/repo" xmlns:rpm="http://linux.duke.edu/metadata/rpm"'
+COMMON_NS = 'xmlns="http://linux.duke.edu/metadata/common" xmlns:rpm="http://linux.duke.edu/metadata/rpm"'
+FILELISTS_NS = 'xmlns="http://linux.duke.edu/metadata/filelists"'
+
+
+class SynthPackage:
+
+    def __init__(self, num, version, rnd):
+        self.num = num
+        self.name = 'synth-%06i' % num
+        self.version = version
+        self.release = '1'
+        self.arch = ARCHS[num % len(ARCHS)]
+        self.words = rnd.sample(WORDS, 3)
+        self.requires = ['synth-%06i' % (num // 2)] if num > 1 else []
+        self.pkgid = hashlib.sha256(('%s-%s' % (self.name, version)).encode('utf-8')).hexdigest()
+
+    @property
+    def nevra(self):
+        return '%s-%s-%s.%s' % (self.name, self.version, self.release, self.arch)
+
+    @property
+    def files(self):
+        files = ['/usr/bin/%s' % self.name]
+        for i in range(1, FILES_PER_PKG):
+            files.append('/usr/share/%s/%s-%i.dat' % (self.name, self.words[i % 3], i))
+        return files
+
+    def primary_xml(self):
+        entry = '<rpm:entry name=%s flags="EQ" epoch="0" ver="%s" rel="%s"/>' % (quoteattr(self.name), self.version, self.release)
+        requires = ''
+        if self.requires:
+            requires = '<rpm:requires>%s</rpm:requires>' % ''.join(['<rpm:entry name=%s/>' % quoteattr(req) for req in self.requires])
+        return '''<package type="rpm">
+  <name>%(name)s</name>
+  <arch>%(arch)s</arch>
+  <version epoch="0" ver="%(version)s" rel="%(release)s"/>
+  <checksum type="sha256" pkgid="YES">%(pkgid)s</checksum>
+  <summary>%(summary)s</summary>
+  <description>%(description)s</description>
+  <packager>yumdaemon benchmark</packager>
+  <url>http://example.com/%(name)s</url>
+  <time file="1380000000" build="1380000000"/>
+  <size package="10240" installed="40960" archive="41000"/>
+  <location href="Packages/%(nevra)s.rpm"/>
+  <format>
+    <rpm:license>GPLv2+</rpm:license>
+    <rpm:group>Unspecified</rpm:group>
+    <rpm:buildhost>localhost</rpm:buildhost>
+    <rpm:sourcerpm>%(name)s-%(version)s-%(release)s.src.rpm</rpm:sourcerpm>
+    <rpm:header-range start="880" end="4000"/>
+    <rpm:provides>%(entry)s</rpm:provides>
+    %(requires)s
+    <file>/usr/bin/%(name)s</file>
+  </format>
+</package>
+''' % {'name' : self.name, 'arch' : self.arch, 'version' : self.version, 'release' : self.release,
+       'pkgid' : self.pkgid, 'nevra' : self.nevra, 'entry' : entry, 'requires' : requires,
+       'summary' : escape('%s %s %s' % tuple(self.words)),
+       'description' : escape('The %s package is a synthetic %s package with %s' % (self.name, self.words[0], ' '.join(self.words)))}
+
+    def filelists_xml(self):
+        files = ''.join(['<file>%s</file>' % escape(fn) for fn in self.files])
+        return '<package pkgid="%s" name="%s" arch="%s"><version epoch="0" ver="%s" rel="%s"/>%s</package>\n' % \
+            (self.pkgid, self.name, self.arch, self.version, self.release, files)
+
+
+def make_packages(num, seed=0):
+    '''
+    return a list of num synthetic packages (+ the newer versions for the updates)
+    '''
+    rnd = random.Random(seed)
+    pkgs = []
+    for i in range(1, num+1):
+        pkgs.append(SynthPackage(i, '1.0', rnd))
+        if i % UPDATE_RATIO == 0:
+            pkgs.append(SynthPackage(i, '1.1', rnd))
+    return pkgs
+
+def comps_xml(num):
+    groups = []
+    categories = []
+    num_groups = (num + GROUP_SIZE - 1) // GROUP_SIZE
+    for grp in range(num_groups):
+        reqs = []
+        for i in range(grp * GROUP_SIZE + 1, min(num, (grp + 1) * GROUP_SIZE) + 1):
+            pkg_type = 'mandatory' if i % 5 == 0 else 'default' if i % 5 == 1 else 'optional'
+            reqs.append('<packagereq type="%s">synth-%06i</packagereq>' % (pkg_type, i))
+        groups.append('''<group>
+  <id>synth-group-%(grp)i</id>
+  <name>Synthetic group %(grp)i</name>
+  <description>Synthetic packages %(first)i - %(last)i</description>
+  <default>false</default>
+  <uservisible>true</uservisible>
+  <packagelist>%(reqs)s</packagelist>
+</group>
+''' % {'grp' : grp, 'first' : grp * GROUP_SIZE + 1, 'last' : min(num, (grp + 1) * GROUP_SIZE), 'reqs' : ''.join(reqs)})
+    for cat in range((num_groups + CATEGORY_SIZE - 1) // CATEGORY_SIZE):
+        grps = ''.join(['<groupid>synth-group-%i</groupid>' % grp
+                        for grp in range(cat * CATEGORY_SIZE, min(num_groups, (cat + 1) * CATEGORY_SIZE))])
+        categories.append('''<category>
+  <id>synth-category-%(cat)i</id>
+  <name>Synthetic category %(cat)i</name>
+  <description>Synthetic category %(cat)i</description>
+  <grouplist>%(grps)s</grouplist>
+</category>
+''' % {'cat' : cat, 'grps' : grps})
+    return '<?xml version="1.0" encoding="UTF-8"?>\n<comps>\n%s%s</comps>\n' % (''.join(groups), ''.join(categories))
+
+def updateinfo_xml(pkgs):
+    notices = []
+    types = ['bugfix', 'security', 'enhancement']
+    for pkg in pkgs:
+        if pkg.version != '1.1':
+            continue
+        notices.append('''<update from="yumdaemon@example.com" status="stable" type="%(type)s" version="1.0">
+  <id>SYNTH-2013-%(num)06i</id>
+  <title>%(name)s update</title>
+  <issued date="2013-09-01 00:00:00"/>
+  <updated date="2013-09-02 00:00:00"/>
+  <description>Update of %(name)s to %(version)s</description>
+  <references><reference href="http://example.com/bug/%(num)i" id="%(num)i" type="bugzilla" title="synthetic bug %(num)i"/></references>
+  <pkglist><collection short="synth"><name>Synthetic</name>
+    <package name="%(name)s" version="%(version)s" release="%(release)s" epoch="0" arch="%(arch)s" src="%(name)s-%(version)s-%(release)s.src.rpm">
+      <filename>%(nevra)s.rpm</filename>
+    </package>
+  </collection></pkglist>
+</update>
+''' % {'type' : types[pkg.num % len(types)], 'num' : pkg.num, 'name' : pkg.name, 'version' : pkg.version,
+       'release' : pkg.release, 'arch' : pkg.arch, 'nevra' : pkg.nevra})
+    return '<?xml version="1.0" encoding="UTF-8"?>\n<updates>\n%s</updates>\n' % ''.join(notices)
+
+def _write_data(repodir, mdtype, filename, data, compress=True):
+    '''
+    Write a metadata file, return the <data> element for repomd.xml
+    '''
+    data = data.encode('utf-8')
+    path = os.path.join(repodir, 'repodata', filename)
+    if compress:
+        path += '.gz'
+        f = gzip.open(path, 'wb')
+    else:
+        f = open(path, 'wb')
+    f.write(data)
+    f.close()
+    content = open(path, 'rb').read()
+    open_checksum = ''
+    if compress:
+        open_checksum = '<open-checksum type="sha256">%s</open-checksum><open-size>%i</open-size>' % \
+            (hashlib.sha256(data).hexdigest(), len(data))
+    return '''<data type="%s"><checksum type="sha256">%s</checksum>%s<location href="repodata/%s"/><timestamp>%i</timestamp><size>%i</size></data>
+''' % (mdtype, hashlib.sha256(content).hexdigest(), open_checksum, os.path.basename(path), int(time.time()), len(content))
+
+def make_repo(repodir, num, seed=0):
+    '''
+    Write a synthetic repo with num packages to repodir
+    return the number of packages in the repo (num + the newer versions)
+    '''
+    mddir = os.path.join(repodir, 'repodata')
+    if not os.path.isdir(mddir):
+        os.makedirs(mddir)
+    pkgs = make_packages(num, seed)
+    primary = '<?xml version="1.0" encoding="UTF-8"?>\n<metadata %s packages="%i">\n%s</metadata>\n' % \
+        (COMMON_NS, len(pkgs), ''.join([pkg.primary_xml() for pkg in pkgs]))
+    filelists = '<?xml version="1.0" encoding="UTF-8"?>\n<filelists %s packages="%i">\n%s</filelists>\n' % \
+        (FILELISTS_NS, len(pkgs), ''.join([pkg.filelists_xml() for pkg in pkgs]))
+    data = [_write_data(repodir, 'primary', 'primary.xml', primary),
+            _write_data(repodir, 'filelists', 'filelists.xml', filelists),
+            _write_data(repodir, 'group', 'comps.xml', comps_xml(num), compress=False),
+            _write_data(repodir, 'updateinfo', 'updateinfo.xml', updateinfo_xml(pkgs))]
+    f = open(os.path.join(mddir, 'repomd.xml'), 'w')
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n<repomd %s>\n<revision>%i</revision>\n%s</repomd>\n' % \
+            (REPO_NS, int(time.time()), ''.join(data)))
+    f.close()
+    return len(pkgs)
+
+def write_yum_config(topdir, repo_id, repodir):
+    '''
+    Write a yum.conf using only the synthetic repo and an empty installroot, return the path
+    '''
+    root = os.path.join(topdir, 'root')
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    path = os.path.join(topdir, 'yum.conf')
+    f = open(path, 'w')
+    f.write('''[main]
+cachedir=%(topdir)s/cache
+installroot=%(root)s
+reposdir=%(topdir)s/repos.d
+keepcache=0
+gpgcheck=0
+plugins=0
+metadata_expire=0
+
+[%(repo_id)s]
+name=Synthetic repository (%(repo_id)s)
+baseurl=file://%(repodir)s
+enabled=1
+gpgcheck=0
+''' % {'topdir' : topdir, 'root' : root, 'repo_id' : repo_id, 'repodir' : repodir})
+    f.close()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Make a synthetic yum repository')
+    parser.add_argument('-n', '--packages', type=int, default=1000)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('repodir')
+    args = parser.parse_args()
+    start = time.time()
+    num = make_repo(os.path.abspath(args.repodir), args.packages, args.seed)
+    print("%i packages written to %s in %.1f s" % (num, args.repodir, time.time() - start))
+
+if __name__ == '__main__':
+    main()
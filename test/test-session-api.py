@@ -212,4 +212,87 @@ class TestAPI(TestBase):
                 self.assertIsInstance(result[1], list) # cat is a list
                 self.assertEqual(len(result[1]),3)
 
+    def test_GetActions(self):
+        '''
+        Session: GetActions
+        '''
+        print()
+        self._check_get_actions()
+
+    def test_GetAttributes(self):
+        '''
+        Session: GetAttributes
+        '''
+        print()
+        self._check_get_attributes()
+
+    def test_PackageCursor(self):
+        '''
+        Session: OpenPackageCursor, FetchNext & CloseCursor
+        '''
+        print()
+        self._check_package_cursor()
+
+    def test_V2API(self):
+        '''
+        Session: Version 2 API (GetPackagesV2, GetAttributesV2, GetActionsV2, GetGroupsV2, GetConfigV2)
+        '''
+        print()
+        self._check_v2_api()
+
+    def test_SearchCache(self):
+        '''
+        Session: Search result cache (GetCacheStats)
+        '''
+        print()
+        self._check_search_cache()
+
+    def test_GetAllGroupPackages(self):
+        '''
+        Session: GetAllGroupPackages
+        '''
+        print()
+        self._check_all_group_packages()
+
+    def test_Downgrades(self):
+        '''
+        Session: downgrades attribute
+        '''
+        print()
+        self._check_downgrades()
+
+    def test_Cancel(self):
+        '''
+        Session: Cancel
+        '''
+        print()
+        self._check_cancel()
+
+    def test_CancelAsync(self):
+        '''
+        Session: Cancel async calls
+        '''
+        print()
+        self._check_cancel_async()
+
+    def test_SetProgressRate(self):
+        '''
+        Session: SetProgressRate
+        '''
+        print()
+        self._check_progress_rate()
+
+    def test_GetStats(self):
+        '''
+        Session: GetStats
+        '''
+        print()
+        self._check_stats()
+
+    def test_Profiling(self):
+        '''
+        Session: StartProfiling & StopProfiling
+        '''
+        print()
+        self._check_profiling()
 
@@ -373,6 +373,102 @@ class TestAPI(TestBase):
                 self.assertEqual(len(result[1]),3)
 
 
+    def test_GetActions(self):
+        '''
+        System: GetActions
+        '''
+        print()
+        self._check_get_actions()
+
+
+    def test_GetAttributes(self):
+        '''
+        System: GetAttributes
+        '''
+        print()
+        self._check_get_attributes()
+
+
+    def test_PackageCursor(self):
+        '''
+        System: OpenPackageCursor, FetchNext & CloseCursor
+        '''
+        print()
+        self._check_package_cursor()
+
+
+    def test_V2API(self):
+        '''
+        System: Version 2 API (GetPackagesV2, GetAttributesV2, GetActionsV2, GetGroupsV2, GetConfigV2)
+        '''
+        print()
+        self._check_v2_api()
+
+
+    def test_SearchCache(self):
+        '''
+        System: Search result cache (GetCacheStats)
+        '''
+        print()
+        self._check_search_cache()
+
+
+    def test_GetAllGroupPackages(self):
+        '''
+        System: GetAllGroupPackages
+        '''
+        print()
+        self._check_all_group_packages()
+
+
+    def test_Downgrades(self):
+        '''
+        System: downgrades attribute
+        '''
+        print()
+        self._check_downgrades()
+
+
+    def test_Cancel(self):
+        '''
+        System: Cancel
+        '''
+        print()
+        self._check_cancel()
+
+
+    def test_CancelAsync(self):
+        '''
+        System: Cancel async calls
+        '''
+        print()
+        self._check_cancel_async()
+
+
+    def test_SetProgressRate(self):
+        '''
+        System: SetProgressRate
+        '''
+        print()
+        self._check_progress_rate()
+
+
+    def test_GetStats(self):
+        '''
+        System: GetStats
+        '''
+        print()
+        self._check_stats()
+
+
+    def test_Profiling(self):
+        '''
+        System: StartProfiling & StopProfiling
+        '''
+        print()
+        self._check_profiling()
+
+
     def test_History(self):
         '''
         System: History
@@ -391,6 +487,44 @@ class TestAPI(TestBase):
                 self.assertIsInstance(state, unicode)
                 self.assertIsInstance(is_installed, bool)
                 
+    def test_HistoryPaged(self):
+        '''
+        System: History (paged)
+        '''
+        result = self.GetHistoryByDays(0, 30)
+        self.assertIsInstance(result, list)
+        pages = []
+        offset = 0
+        while True:
+            page = self.GetHistoryByDaysPaged(0, 30, offset, 5)
+            self.assertIsInstance(page, list)
+            self.assertTrue(len(page) <= 5)
+            if not page:
+                break
+            pages.extend(page)
+            offset += len(page)
+        self.assertEqual(pages, result)
+        self.assertEqual(self.GetHistoryByDaysPaged(0, 30, 0, 0), result)
+
+    def test_HistoryPackagesBulk(self):
+        '''
+        System: History packages (bulk & summary)
+        '''
+        tids = [tid for tid, dt in self.GetHistoryByDays(0, 30)][:10]
+        expected = []
+        for tid in tids:
+            expected.extend([[tid] + pkg for pkg in self.GetHistoryPackages(tid)])
+        result = self.GetHistoryPackagesBulk(tids)
+        self.assertIsInstance(result, list)
+        self.assertEqual(sorted(result), sorted(expected))
+        if result:
+            self.assertEqual(self.GetHistoryPackagesBulk(tids, 1, 2), result[1:3])
+        summary = self.GetHistoryPackagesSummary(tids)
+        self.assertEqual([tid for tid, counts in summary], tids)
+        for tid, counts in summary:
+            self.assertIsInstance(counts, dict)
+            self.assertEqual(sum(counts.values()), len([pkg for pkg in expected if pkg[0] == tid]))
+
     def test_GPGKeyInstall(self):
         '''
         System: GPG Key installation
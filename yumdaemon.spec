@@ -79,6 +79,8 @@ fi
 %{_datadir}/polkit-1/actions/%{yum_org}*
 # this should not be edited by the user, so no %%config
 %{_sysconfdir}/dbus-1/system.d/%{yum_org}*
+%dir %{_sysconfdir}/%{name}
+%config(noreplace) %{_sysconfdir}/%{name}/%{name}.conf
 
 
 %changelog
@@ -19,25 +19,95 @@
 Common stuff for the yumdaemon dbus services
 """
 import dbus
+import dbus.lowlevel
 import dbus.service
 import dbus.glib
 import gobject
 import json
+import os
 import logging
+import threading
+import time
+import Queue
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import cmp_to_key
 from datetime import datetime
 import yum
 import yum.Errors as Errors
 from yum.callbacks import *
 from yum.constants import *
-from yum.update_md import UpdateMetadata
 from yum.Errors import *
 from yum.packageSack import packagesNewestByNameArch, packagesNewestByName
 
 from rpmUtils.arch import canCoinstall
+from rpmUtils.miscutils import compareEVR
+from urlgrabber.progress import MultiFileMeter, format_number, format_time
+
+import searchindex
+import updateinfo
+import daemonconfig
+import snapshot
+import stats
+import profiler
 
 FAKE_ATTR = ['downgrades','action','pkgtags']
 NONE = json.dumps(None)
 
+# DBus methods there is answered in the main loop, when the worker thread is used
+MAIN_LOOP_METHODS = ['GetVersion', 'SetWatchdogState', 'SetProgressRate', 'Cancel', 'GetStats']
+
+# number of loops between the cancel checkpoints in package loops
+CANCEL_CHECK_INTERVAL = 100
+
+# statistics for the DBus method calls (GetStats)
+call_stats = stats.CallStats()
+
+# profiler for the DBus method calls (StartProfiling)
+call_profiler = profiler.Profiler()
+
+
+def to_dbus_value(value):
+    '''
+    Convert a python value to a value with explicit DBus types, so it can be send as a DBus variant (v)
+    None can not be send in DBus, so it is converted to an empty string
+    lists & tuples is converted to arrays of variants (av) and dicts to (a{sv})
+    :param value: value to convert
+    '''
+    if value is None:
+        return ''
+    elif isinstance(value, bool):
+        return dbus.Boolean(value)
+    elif isinstance(value, (int, long)):
+        return dbus.Int64(value)
+    elif isinstance(value, float):
+        return dbus.Double(value)
+    elif isinstance(value, basestring):
+        return value
+    elif isinstance(value, dict):
+        return dbus.Dictionary([(str(k), to_dbus_value(v)) for k, v in value.items()], signature='sv')
+    elif isinstance(value, (list, tuple, set)):
+        return dbus.Array([to_dbus_value(v) for v in value], signature='v')
+    else:
+        return str(value)
+
+def to_json(value):
+    '''
+    Encode a value as JSON, the time used is added to the JSON time of the current method call
+    :param value: value to encode
+    '''
+    start = time.time()
+    result = json.dumps(value)
+    call_stats.add_json(time.time() - start)
+    return result
+
+def to_dbus_dict(values):
+    '''
+    Convert a dict to a DBus dict (a{sv}), the items with a None value is left out
+    :param values: dict to convert
+    '''
+    return dbus.Dictionary([(str(k), to_dbus_value(v)) for k, v in values.items() if v is not None], signature='sv')
+
 
 #------------------------------------------------------------------------------ Callback handlers
 class DownloadCallback(  DownloadBaseCallback ):
@@ -57,19 +127,236 @@ class DownloadCallback(  DownloadBaseCallback ):
         :param fread: formated string containing BytesRead
         :param ftime : formated string containing remaining or elapsed time
         '''
+        self.base._check_cancel() # a cancelled download is aborted here
         # send a DBus signal with progress info
-        self.base.UpdateProgress(name,frac,fread,ftime)
+        if self.base._progress_throttle.should_send(name, frac >= 1.0):
+            self.base.UpdateProgress(name,frac,fread,ftime)
+
+class MultiDownloadCallback( MultiFileMeter ):
+    '''
+    Yum Download callback handler class for parallel downloads
+    the progress of each of the files being downloaded is sent as UpdateProgress signals
+    '''
+    def __init__(self,base):
+        MultiFileMeter.__init__(self, threaded=False)
+        self.base = base
+
+    def _do_update_meter(self, meter, now):
+        self._update(meter, meter.re.fraction_read() or 0.0, meter.re.remaining_time())
+
+    def _do_end_meter(self, meter, now):
+        self._update(meter, 1.0, meter.re.elapsed_time())
+
+    def _do_failure_meter(self, meter, message, now):
+        self.base.logger.debug('download failed : %s : %s' % (meter.basename, message))
+
+    def _update(self, meter, frac, secs):
+        self.base._check_cancel() # a cancelled download is aborted here
+        name = meter.basename
+        if self.base._progress_throttle.should_send(name, frac >= 1.0):
+            self.base.UpdateProgress(name, frac, format_number(meter.last_amount_read), format_time(secs))
+
+class ProgressThrottle:
+    '''
+    Limit the progress signals to max_rate updates per second for each key (file, package),
+    the updates in between is dropped, but the final update is always sent.
+    '''
+    def __init__(self, max_rate=10):
+        self.max_rate = max_rate    # max updates per second for a key (0 = no limit)
+        self._last = {}             # key -> time of the last update sent
+
+    def should_send(self, key, done=False):
+        '''
+        Check if a progress update should be sent
+        :param key: the file/package the update is for
+        :param done: True if it is the final update for the key
+        '''
+        if done:
+            self._last.pop(key, None)
+            return True
+        if not self.max_rate:
+            return True
+        now = time.time()
+        last = self._last.get(key)
+        if last is None or now - last >= 1.0 / self.max_rate:
+            self._last[key] = now
+            return True
+        return False
+
+class DepSolveCallback:
+    '''
+    Yum depsolve callback handler class
+    it is only used as a cancel checkpoint, yum calls it for every package/requirement processed
+    '''
+    def __init__(self, base):
+        self.base = base
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self._checkpoint
+
+    def _checkpoint(self, *args, **kwargs):
+        self.base._check_cancel()
+
+
+class LRUCache:
+    '''
+    Least recently used cache, limited by the number of entries and the total size of the values
+    '''
+    def __init__(self, max_entries=100, max_size=8*1024*1024):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict() # key -> (value, size), the oldest used first
+
+    def get(self, key):
+        '''
+        Get a value from the cache, return None if not found
+        '''
+        if key in self._data:
+            self.hits += 1
+            value = self._data.pop(key)
+            self._data[key] = value # mark as the newest used
+            return value[0]
+        self.misses += 1
+        return None
+
+    def put(self, key, value, size):
+        '''
+        Add a value to the cache, the oldest used values is removed if the limits is exceeded
+        :param size: size of the value in bytes (estimated)
+        '''
+        if key in self._data:
+            self.size -= self._data.pop(key)[1]
+        if size > self.max_size or self.max_entries < 1:
+            return
+        self._data[key] = (value, size)
+        self.size += size
+        while len(self._data) > self.max_entries or self.size > self.max_size:
+            oldest_key, (oldest, oldest_size) = self._data.popitem(last=False)
+            self.size -= oldest_size
+
+    def clear(self):
+        self._data.clear()
+        self.size = 0
+
+    def get_stats(self):
+        '''
+        return a dict with the cache usage
+        '''
+        return {'entries' : len(self._data), 'size' : self.size,
+                'max_entries' : self.max_entries, 'max_size' : self.max_size,
+                'hits' : self.hits, 'misses' : self.misses}
+
+def _compare_po_evr(po1, po2):
+    return compareEVR((po1.epoch, po1.version, po1.release), (po2.epoch, po2.version, po2.release))
+
+class VersionLadder:
+    '''
+    All builds (available & installed) of a package name, sorted by version (oldest first)
+    builds with the same version get the same rank, so a version compare is a compare of the ranks
+    '''
+    def __init__(self, apkgs, ipkgs, multi_install=False):
+        self.multi_install = multi_install  # name is allowed to be installed in multiple versions (ex. kernel)
+        self.installed = ipkgs              # installed builds
+        self.ranks = {}                     # pkgtup -> rank
+        self.pkgs = sorted(apkgs + ipkgs, key=cmp_to_key(_compare_po_evr))
+        self._rank_list = []
+        rank = 0
+        for i, po in enumerate(self.pkgs):
+            if i and _compare_po_evr(self.pkgs[i-1], po) != 0:
+                rank += 1
+            self.ranks[po.pkgtup] = rank
+            self._rank_list.append(rank)
+        self._installed_tups = set([po.pkgtup for po in ipkgs])
+        self.installed_rank = max([self.ranks[po.pkgtup] for po in ipkgs] or [-1])
+
+    def older(self, po):
+        '''
+        return the available builds with a lower version than po
+        '''
+        rank = self.ranks.get(po.pkgtup)
+        if rank is None:
+            return []
+        return [apo for apo in self.pkgs[:bisect_left(self._rank_list, rank)]
+                if not apo.pkgtup in self._installed_tups]
+
+    def is_older_than_installed(self, po):
+        '''
+        Check if po has a lower version than the newest installed build
+        '''
+        rank = self.ranks.get(po.pkgtup)
+        return rank is not None and rank < self.installed_rank
 
 
 logger = logging.getLogger('yumdaemon.service')
 
+class CancelledError(dbus.DBusException):
+    '''
+    Raised in a cancel checkpoint, when the running method call is cancelled
+    '''
+    _dbus_error_name = 'org.baseurl.Yum.CancelledError'
+
+class YumWorker(threading.Thread):
+    '''
+    Worker thread, running the DBus method calls there is using yum, one at the time.
+    So the main loop is free to answer the other calls and the YumBase is only used by one thread.
+    '''
+
+    def __init__(self):
+        threading.Thread.__init__(self, name='yumdaemon-worker')
+        self.setDaemon(True)
+        self._queue = Queue.Queue()
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    def add(self, func, *args):
+        '''
+        Add a job to the queue
+        :param func: function to call in the worker thread
+        :param args: arguments for the function
+        '''
+        with self._pending_lock:
+            self._pending += 1
+        self._queue.put((func, args))
+
+    def is_busy(self):
+        '''
+        Check if there is jobs running or waiting in the queue
+        '''
+        with self._pending_lock:
+            return self._pending > 0
+
+    def run(self):
+        while True:
+            func, args = self._queue.get()
+            try:
+                func(*args)
+            except Exception, e: # dont let a failing job stop the worker
+                logger.exception('worker job failed : %s' % str(e))
+            with self._pending_lock:
+                self._pending -= 1
+
 def Logger(func):
     """
     This decorator catch yum exceptions and send fatal signal to frontend
+    it also records the time used by the method in the call stats and profiles the method, when profiling is started
     """
     def newFunc(*args, **kwargs):
         logger.debug("%s started args: %s " % (func.__name__, repr(args[1:])))
-        rc = func(*args, **kwargs)
+        start = time.time()
+        call_profiler.call_started(func.__name__)
+        try:
+            rc = func(*args, **kwargs)
+        except:
+            call_profiler.call_ended(func.__name__)
+            call_stats.method_ended(func.__name__, time.time() - start, error=True)
+            raise
+        call_profiler.call_ended(func.__name__)
+        call_stats.method_ended(func.__name__, time.time() - start)
         logger.debug("%s ended" % func.__name__)
         return rc
 
@@ -78,30 +365,166 @@ def Logger(func):
     newFunc.__dict__.update(func.__dict__)
     return newFunc
 
+def get_memory_usage():
+    '''
+    return the resident memory used by the daemon in MB (0 if it can't be found)
+    '''
+    try:
+        pages = int(open('/proc/self/statm').read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (IOError, IndexError, ValueError, OSError):
+        return 0
+
+def get_memory_available():
+    '''
+    return the available system memory in MB (None if it can't be found)
+    '''
+    try:
+        for line in open('/proc/meminfo'):
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) / 1024
+    except (IOError, IndexError, ValueError):
+        pass
+    return None
+
 class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
 
-    def __init__(self, mainloop):
+    def __init__(self, mainloop, config_files=[daemonconfig.SYSTEM_CONFIG]):
         DownloadBaseCallback.__init__(self)
         self.logger = logging.getLogger('yumdaemon.base')
         self.mainloop = mainloop # use to terminate mainloop
-        self.authorized_sender = set()
         self._lock = None
         self._yumbase = None
         self._can_quit = True
         self._is_working = False
         self._watchdog_count = 0
         self._watchdog_disabled = False
-        self._timeout_idle = 20         # time to daemon is closed when unlocked
-        self._timeout_locked = 600      # time to daemon is closed when locked and not working
-        self._updateMetadata = None     # Cache for yum UpdateMetadata object
+        self._config = daemonconfig.read_config(config_files)
+        self._timeout_idle = self._config['timeout_idle']       # time to daemon is closed when unlocked
+        self._timeout_locked = self._config['timeout_locked']   # time to daemon is closed when locked and not working
+        self._keep_warm = self._config['keep_warm']             # keep the YumBase when idle (without yum lock & rpmdb)
+        self._warm_released = False     # the YumBase is kept, but the yum lock & rpmdb is released
+        self._warm_rpmdb_version = None # rpmdb version when the YumBase was released
+        self._yumbase_changed = False   # the YumBase setup has been changed by a client (repos, config)
+        self._updateinfo_indexes = None # Cache for the updateinfo indexes of the enabled repos
+        self._group_cache_key = None    # comps checksums & rpmdb version the group caches is valid for
+        self._group_tree = None         # Cache for the category/group tree
+        self._group_pkgs = {}           # Cache for group packages ((grp_id, grp_flt) -> pkg_ids)
         self._updates_list = None       # Cache for updates
         self._obsoletes_list = None     # Cache for obsoletes
+        self._updates_tups = set()      # Cache for pkgtups of updates
+        self._obsoletes_tups = set()    # Cache for pkgtups of obsoletes
+        self._po_index = LRUCache(self._config['po_index_entries']) # Cache for pkg_id -> yum package object
+        self._installed_index = None    # Cache for installed packages (pkgtup -> po, name -> newest po)
+        self._ladders = {}              # Cache for version ladders (name -> VersionLadder)
+        self._snapshot = None           # Snapshot of the installed, updates & obsoletes package lists
+        self._cursors = {}              # Open package cursors (cursor id -> cursor state)
+        self._cursor_count = 0          # Last used cursor id
+        self._cursor_max_chunk = 1000   # Max number of packages returned by a FetchNext call
+        self._search_indexes = None     # Cache for the search indexes [(repo_id, index), ...]
+        self._repo_po_maps = {}         # Cache for pkgtup -> yum package object dicts (repo_id -> dict)
+        self._generation = 0            # Incremented when the YumBase is changed (repos, metadata, rpmdb)
+        self._search_cache_entries = self._config['search_cache_entries']       # max number of search results in search cache
+        self._search_cache_size = self._config['search_cache_size'] * 1024 * 1024 # max size of the search results in search cache (bytes)
+        self._search_cache = LRUCache(self._search_cache_entries, self._search_cache_size)
+        self._progress_throttle = ProgressThrottle(self._config['progress_rate'])
+        self._worker = None             # worker thread for the method calls using yum (None = run in the main loop)
+        self._calls = {}                # method calls in the worker ((sender, serial) -> cancelled)
+        self._calls_lock = threading.Lock()
+        self._current_call = None       # (sender, serial) of the method call running in the worker
+        self._cancelled_error = CancelledError  # exception raised for cancelled calls
+        self._backend = 'yum'           # backend used for new YumBase objects (yum or fake)
+        self._fake_packages = 10000     # number of packages in the fake backend
+
+    def _message_cb(self, connection, message):
+        '''
+        Called by dbus-python for incoming method calls
+        '''
+        self._dispatch(dbus.service.Object._message_cb, self, connection, message)
+
+    def _dispatch(self, message_cb, obj, connection, message):
+        '''
+        Handle a method call in the worker thread, if it is enabled. The reply is sent from the worker,
+        when the method is done. Calls to the standard DBus interfaces (Introspect etc.) and the
+        methods in MAIN_LOOP_METHODS is handled in the main loop right away.
+        :param message_cb: dbus-python message handler (dbus.service.Object._message_cb)
+        :param obj: DBus object the call is for
+        '''
+        interface = message.get_interface() or ''
+        if self._worker and not interface.startswith('org.freedesktop.DBus') and \
+           not message.get_member() in MAIN_LOOP_METHODS:
+            with self._calls_lock:
+                self._calls[(message.get_sender(), message.get_serial())] = False
+            self._worker.add(self._run_call, message_cb, obj, connection, message)
+        else:
+            call_stats.begin()
+            message_cb(obj, connection, message)
+            call_stats.end()
+
+    def _run_call(self, message_cb, obj, connection, message):
+        '''
+        Handle a method call in the worker thread, a call cancelled before it is started
+        is answered with an error right away.
+        '''
+        call = (message.get_sender(), message.get_serial())
+        try:
+            with self._calls_lock:
+                cancelled = self._calls.get(call, False)
+            if cancelled:
+                error = self._cancelled_error('%s was cancelled' % message.get_member())
+                connection.send_message(dbus.lowlevel.ErrorMessage(message, error._dbus_error_name, str(error)))
+            else:
+                self._current_call = call
+                call_stats.begin()
+                message_cb(obj, connection, message)
+                call_stats.end()
+        finally:
+            self._current_call = None
+            self._is_working = False # the call can end with an exception, before working_ended is called
+            with self._calls_lock:
+                self._calls.pop(call, None)
+
+    def _cancel(self, sender):
+        '''
+        Cancel the method calls from a sender
+        return True if a running or waiting call was found
+        :param sender: the sender of the calls
+        '''
+        found = False
+        with self._calls_lock:
+            for call in self._calls:
+                if call[0] == sender:
+                    self._calls[call] = True
+                    found = True
+        if found:
+            self.logger.info('CANCEL: %s' % sender)
+        return found
+
+    def _check_cancel(self):
+        '''
+        Cancel checkpoint, raise the cancelled error, if the running method call is cancelled
+        '''
+        call = self._current_call
+        if call:
+            with self._calls_lock:
+                cancelled = self._calls.get(call, False)
+            if cancelled:
+                raise self._cancelled_error('the method call was cancelled')
+
+    def _setup_worker(self):
+        '''
+        Setup the worker thread, the gobject & dbus thread support must be initialized first
+        '''
+        self._worker = YumWorker()
+        self._worker.start()
 
     @property
     def yumbase(self):
         '''
         yumbase property so we can auto initialize it if not defined
         '''
+        if self._yumbase and self._warm_released:
+            self._warm_up()
         if not self._yumbase:
             self._get_yumbase()
         return self._yumbase
@@ -123,13 +546,29 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         :param newest_only: return only the newest version of a package
         :param tags: seach pkgtags
         '''
-        result = []
-        for found in self.yumbase.searchGenerator(fields, keys, keys=True, searchtags=tags):
-            pkg = found[0]
-            fkeys = found[1]
-            if match_all and not len(fkeys) == len(keys): # skip the result if not all keys matches
-                continue
-            result.append(pkg)
+        cache_key = (tuple(fields), tuple(keys), bool(match_all), bool(newest_only), bool(tags), self._generation)
+        result = self._search_cache.get(cache_key)
+        if result is None:
+            result = self._do_search(fields, keys, match_all, newest_only, tags)
+            self._search_cache.put(cache_key, result, sum([len(id) + 40 for id in result]))  # 40 bytes overhead pr. id
+        return list(result)
+
+    def _do_search(self, fields, keys, match_all, newest_only, tags):
+        '''
+        Search for for packages, where given fields contain given key words
+        (the search done by _search, when it is not found in the cache)
+        '''
+        result = self._search_index(fields, keys, match_all, tags)
+        if result is None: # the search can not be done using the search indexes
+            result = []
+            for i, found in enumerate(self.yumbase.searchGenerator(fields, keys, keys=True, searchtags=tags)):
+                if i % CANCEL_CHECK_INTERVAL == 0:
+                    self._check_cancel()
+                pkg = found[0]
+                fkeys = found[1]
+                if match_all and not len(fkeys) == len(keys): # skip the result if not all keys matches
+                    continue
+                result.append(pkg)
         pkgs = self._limit_package_list(result, skip_old=not match_all) # remove dupes and optional old ones
         if newest_only:
             pkgs = packagesNewestByName(pkgs)
@@ -138,6 +577,117 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
 
 
 
+    def _search_index(self, fields, keys, match_all, tags):
+        '''
+        Search for packages using the search indexes for the enabled repos and the installed packages
+        return a list of matching packages or None if the search can not be done using the indexes
+        (searching pkgtags, in other fields than name, summary, description & url or for keys
+        with more than one word)
+        '''
+        if tags or not keys or not fields:
+            return None
+        for field in fields:
+            if not field in searchindex.SEARCH_FIELDS:
+                return None
+        for key in keys:
+            if not searchindex.is_token(key):
+                return None
+        found = None
+        for key in keys:
+            key_found = set()
+            for source, index in self._get_search_indexes():
+                key_found.update([(source, pkgtup) for pkgtup in index.search(fields, key)])
+            if found is None:
+                found = key_found
+            elif match_all:
+                found &= key_found
+            else:
+                found |= key_found
+        result = []
+        installed = self._get_installed_index()[0]
+        for source, pkgtup in found:
+            if source is None:
+                po = installed.get(pkgtup)
+            else:
+                po = self._get_repo_po_map(source).get(pkgtup)
+            if po:
+                result.append(po)
+        return result
+
+    def _get_search_indexes(self):
+        '''
+        return a list of (repo_id, search index) pairs for the enabled repositories
+        and (None, search index) for the installed packages
+        '''
+        if self._search_indexes is None:
+            indexes = []
+            populate = lambda: self.yumbase.pkgSack # setup the repo sacks, if an index must be build
+            for repo in self.yumbase.repos.listEnabled():
+                indexes.append((repo.id, searchindex.get_repo_index(repo, populate)))
+            installed = self._get_installed_index()[0]
+            indexes.append((None, searchindex.get_packages_index(installed.values())))
+            self._search_indexes = indexes
+        return self._search_indexes
+
+    def _get_repo_po_map(self, repo_id):
+        '''
+        return a pkgtup -> yum package object dict for the packages in a repository
+        '''
+        if not repo_id in self._repo_po_maps:
+            repo = self.yumbase.repos.getRepo(repo_id)
+            self._repo_po_maps[repo_id] = dict([(po.pkgtup, po) for po in repo.sack.returnPackages()])
+        return self._repo_po_maps[repo_id]
+
+    def _get_cache_stats(self):
+        '''
+        return a dict with the usage of the daemon caches (cache name -> stats)
+        '''
+        return {'search' : self._search_cache.get_stats(), 'po_index' : self._po_index.get_stats()}
+
+    def _get_stats(self):
+        '''
+        return a dict with the statistics for the DBus methods (method name -> stats)
+        the stats is written to the stats_file (Prometheus format) too, if it is set in the config
+        '''
+        self._export_stats()
+        return call_stats.get_stats()
+
+    def _export_stats(self):
+        '''
+        Write the method call statistics to the stats_file in the config (if set)
+        '''
+        if self._config['stats_file']:
+            call_stats.write_prometheus(self._config['stats_file'])
+
+    def _setup_stats_export(self):
+        '''
+        Setup a timer writing the stats_file every stats_interval secs (if the stats_file is set)
+        it is independent of the watchdog, so the stats is written with --notimeout too
+        '''
+        if self._config['stats_file']:
+            gobject.timeout_add_seconds(max(1, self._config['stats_interval']), self._stats_timer)
+
+    def _stats_timer(self):
+        self._export_stats()
+        return True
+
+    def _start_profiling(self, mode):
+        '''
+        Start profiling the method calls, the results is written to profile_dir from the config
+        return the directory the results is written to
+        :param mode: cprofile (a .prof file per method) or sample (collapsed stacks per method)
+        '''
+        directory = self._config['profile_dir'] or profiler.get_default_dir()
+        call_profiler.start(mode, directory)
+        return directory
+
+    def _stop_profiling(self):
+        '''
+        Stop profiling the method calls and write the results
+        return the list of files written
+        '''
+        return call_profiler.stop()
+
     def _get_packages_by_name(self, name, newest_only):
         '''
         Get a list of packages from a name pattern
@@ -163,6 +713,16 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         This is the old way of yum groups, where a group is a collection of mandatory, default and optional pacakges
         and the group is installed when all mandatory & default packages is installed.
         '''
+        return to_json(self._get_group_tree())
+
+    def _get_group_tree(self):
+        '''
+        make a list of (category, [group, ...]) pairs
+        category is (id, name, description) and group is (id, name, description, installed)
+        '''
+        self._check_group_cache()
+        if self._group_tree is not None:
+            return self._group_tree
         all_groups = []
         comps = self.yumbase.comps
         # this is the old way, so grp.installed is set if all mandatory/default packages is installed.
@@ -181,7 +741,8 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         except Errors.GroupsError, e:
             print str(e)
         all_groups.sort()
-        return json.dumps(all_groups)
+        self._group_tree = all_groups
+        return all_groups
 
     def _get_repositories(self, filter):
         '''
@@ -204,14 +765,25 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         :param setting: name of setting (debuglevel etc..)
         '''
         if setting == '*': # Return all config
-            cfg = self.yumbase.conf
-            all_conf = dict([(c,getattr(cfg,c)) for c in cfg.iterkeys()])
-            value =  json.dumps(all_conf)
+            value =  to_json(self._get_config_dict(setting))
         elif hasattr(self.yumbase.conf, setting):
-            value = json.dumps(getattr(self.yumbase.conf, setting))
+            value = to_json(getattr(self.yumbase.conf, setting))
         else:
-            value = json.dumps(None)
+            value = to_json(None)
         return value
+
+    def _get_config_dict(self, setting):
+        '''
+        Get a dict with yum config settings
+        :param setting: name of setting (debuglevel etc..), '*' = all settings
+        '''
+        cfg = self.yumbase.conf
+        if setting == '*':
+            return dict([(c,getattr(cfg,c)) for c in cfg.iterkeys()])
+        elif hasattr(cfg, setting):
+            return {setting : getattr(cfg, setting)}
+        else:
+            return {}
     
     def _get_repo(self, repo_id ):
         '''
@@ -219,38 +791,122 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         the repo setting will be returned as dictionary in JSON format
         :param repo_id:
         '''
+        return to_json(self._get_repo_dict(repo_id))
+
+    def _get_repo_dict(self, repo_id):
+        '''
+        Get the settings for a given repo_id as a dict (None if the repo is not found)
+        :param repo_id:
+        '''
         try:
             repo = self.yumbase.repos.getRepo(repo_id)
-            repo_conf = dict([(c,getattr(repo,c)) for c in repo.iterkeys()])
-            value = json.dumps(repo_conf)
+            return dict([(c,getattr(repo,c)) for c in repo.iterkeys()])
         except Errors.RepoError:
-            value = json.dumps(None)
-        return value
+            return None
     
     def _get_packages(self, pkg_filter):
         '''
         Get a list of package ids, based on a package pkg_filterer
         :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
         '''
-        if pkg_filter in ['installed','available','updates','obsoletes','recent','extras']:
-            yh = self.yumbase.doPackageLists(pkgnarrow=pkg_filter)
-            pkgs = getattr(yh,pkg_filter)
-            value = self._to_package_id_list(pkgs)
-        else:
-            value = []
-        return value
+        if pkg_filter in snapshot.FILTERS:
+            snap = self._get_snapshot(pkg_filter)
+            if snap:
+                return snap.get_list(pkg_filter)
+            return sorted(self._to_package_id_list(self._get_package_list(pkg_filter)))
+        pkgs = self._get_package_list(pkg_filter)
+        return self._to_package_id_list(pkgs)
     
     def _get_package_with_attributes(self, pkg_filter, fields):
         '''
         Get a list of package ids, based on a package pkg_filterer
         :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
         '''
-        value = []
+        pkgs = self._get_package_list(pkg_filter)
+        return [self._get_po_list(po,fields) for po in pkgs]
+
+    def _get_package_list(self, pkg_filter):
+        '''
+        Get a list of yum package objects, based on a package pkg_filterer
+        :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
+        '''
         if pkg_filter in ['installed','available','updates','obsoletes','recent','extras']:
             yh = self.yumbase.doPackageLists(pkgnarrow=pkg_filter)
-            pkgs = getattr(yh,pkg_filter)
-            value = [self._get_po_list(po,fields) for po in pkgs]
-        return value
+            self._check_cancel()
+            return getattr(yh,pkg_filter)
+        else:
+            return []
+
+    def _open_cursor(self, sender, pkg_filter, fields):
+        '''
+        Open a cursor for getting the result of GetPackageWithAttributes in chunks,
+        the cursor returns the same package ids as GetPackages.
+        return a (cursor id, number of packages) pair
+        :param sender: the owner of the cursor
+        :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
+        :param fields: yum package objects attributes to get.
+        '''
+        ids = list(self._get_packages(pkg_filter))
+        self._cursor_count += 1
+        cursor = self._cursor_count
+        self._cursors[cursor] = {'sender' : sender, 'ids' : ids, 'fields' : fields, 'pos' : 0}
+        return cursor, len(ids)
+
+    def _fetch_next(self, sender, cursor, num):
+        '''
+        Get the next chunk of [pkg_id, field,...] lists from a cursor
+        an empty list is returned and the cursor is closed, when there is no more packages
+        :param sender: the owner of the cursor
+        :param cursor: cursor id
+        :param num: max number of packages to return (limited by _cursor_max_chunk)
+        '''
+        if not self._is_cursor_owner(sender, cursor):
+            return []
+        num = max(1, min(num, self._cursor_max_chunk))
+        cur = self._cursors.get(cursor)
+        if cur is None: # closed, when the owner disconnected
+            return []
+        ids = cur['ids'][cur['pos']:cur['pos']+num]
+        cur['pos'] += len(ids)
+        if not ids:
+            self._cursors.pop(cursor, None)
+        result = []
+        for id in ids:
+            po = self._get_po(id)
+            if po:
+                result.append([id] + [getattr(po, field) for field in cur['fields'] if hasattr(po, field)])
+        return result
+
+    def _close_cursor(self, sender, cursor):
+        '''
+        Close a cursor
+        :param sender: the owner of the cursor
+        :param cursor: cursor id
+        '''
+        if self._is_cursor_owner(sender, cursor):
+            return self._cursors.pop(cursor, None) is not None
+        return False
+
+    def _is_cursor_owner(self, sender, cursor):
+        cur = self._cursors.get(cursor)
+        return cur is not None and cur['sender'] == sender
+
+    def _watch_clients(self):
+        '''
+        Watch for the clients disconnecting from the bus (self.bus), so their state can be removed
+        '''
+        self.bus.add_signal_receiver(self._on_name_owner_changed, signal_name='NameOwnerChanged',
+                                     dbus_interface='org.freedesktop.DBus', bus_name='org.freedesktop.DBus',
+                                     path='/org/freedesktop/DBus')
+
+    def _on_name_owner_changed(self, name, old_owner, new_owner):
+        '''
+        Close the cursors of a client, when it disconnects from the bus
+        '''
+        if not new_owner:
+            for cursor, cur in self._cursors.items():
+                if cur['sender'] in (name, old_owner):
+                    self._cursors.pop(cursor, None)
 
     def _get_attribute(self, id, attr):
         '''
@@ -261,16 +917,41 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         '''
         po = self._get_po(id)
         if po:
-            if attr in FAKE_ATTR: # is this a fake attr:
-                value = json.dumps(self._get_fake_attributes(po, attr))
-            elif hasattr(po, attr):
-                value = json.dumps(getattr(po,attr))
-            else:
-                value = json.dumps(None)
+            value = to_json(self._get_po_attribute(po, attr))
         else:
-            value = json.dumps(None)
+            value = to_json(None)
         return value
 
+    def _get_attributes(self, ids, attrs):
+        '''
+        Get a list of attributes for a list of yum package ids
+        it will return a list with a row of attribute values for each id
+        (None for packages or attributes not found)
+        :param ids: list of yum package ids
+        :param attrs: list of attribute names (summary, size, description, changelog etc..)
+        '''
+        result = []
+        for id in ids:
+            po = self._get_po(id)
+            if po:
+                result.append([self._get_po_attribute(po, attr) for attr in attrs])
+            else:
+                result.append([None] * len(attrs))
+        return result
+
+    def _get_po_attribute(self, po, attr):
+        '''
+        Get the value of an attribute (including the fake ones) from a yum package object
+        :param po: yum package object
+        :param attr: name of attribute
+        '''
+        if attr in FAKE_ATTR: # is this a fake attr:
+            return self._get_fake_attributes(po, attr)
+        elif hasattr(po, attr):
+            return getattr(po,attr)
+        else:
+            return None
+
     def _get_updateInfo(self, id):
         '''
         Get an Update Infomation e from a yum package id
@@ -279,44 +960,141 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         '''
         po = self._get_po(id)
         if po:
-            md = self.update_metadata
-            notices = md.get_notices(po.name)
-            result = []
-            for notice in notices:
-                result.append(notice._md)
-            value = json.dumps(result)
+            value = to_json(self._get_update_notices(po))
         else:
-            value = json.dumps(None)
+            value = to_json(None)
         return value
 
+    def _get_update_notices(self, po):
+        '''
+        Get a list of update notices (as dicts) for a yum package object
+        :param po: yum package object
+        '''
+        result = []
+        found = set()
+        for index in self._get_updateinfo_indexes():
+            for notice in index.get_notices(po.name):
+                if not notice['update_id'] in found: # same notice can be in more repos
+                    found.add(notice['update_id'])
+                    result.append(notice)
+        return result
+
+    def _get_updateinfo_indexes(self):
+        '''
+        return a list of updateinfo indexes for the enabled repositories with updateinfo
+        '''
+        if self._updateinfo_indexes is None:
+            indexes = []
+            for repo in self.yumbase.repos.listEnabled():
+                index = updateinfo.get_repo_updateinfo(repo)
+                if index:
+                    indexes.append(index)
+            self._updateinfo_indexes = indexes
+        return self._updateinfo_indexes
+
 
 
     def _get_group_pkgs(self, grp_id, grp_flt):
         '''
         Get packages for a given grp_id and group filter
         '''
-        pkgs = []
+        self._check_group_cache()
+        key = (grp_id, grp_flt)
+        if key in self._group_pkgs:
+            return self._group_pkgs[key]
+        pkg_ids = []
         try:
             grp = self.yumbase.comps.return_group(grp_id)
             if grp:
-                if grp_flt == 'all':
-                    best_pkgs = self._group_names2aipkgs(grp.packages)
-                else:
-                    best_pkgs = self._group_names2aipkgs(grp.mandatory_packages.keys() + grp.default_packages.keys())
-                for key in best_pkgs:
-                    # Sort the matching packages and take the last one (the best match for current arch)
-                    (apkg, ipkg) = sorted(best_pkgs[key], key=lambda x: x[1] or x[0])[-1]
-                    if ipkg:
-                        pkgs.append(ipkg)
-                    else:
-                        pkgs.append(apkg)
-            else:
-                pass
+                pkg_names = self._get_group_pkg_names(grp, grp_flt)
+                best_pkgs = self._group_names2aipkgs(pkg_names)
+                pkg_ids = self._get_best_group_pkgs(pkg_names, best_pkgs)
         except Errors.GroupsError, e:
             print str(e)
-        pkg_ids = self._to_package_id_list(pkgs)
+        self._group_pkgs[key] = pkg_ids
         return pkg_ids
 
+    def _get_all_group_pkgs(self, grp_flt):
+        '''
+        Get packages for all groups, as a grp_id -> pkg_ids dict
+        the installed/available packages is only looked up once, for all the groups
+        :param grp_flt: Group Filter (all or default)
+        '''
+        self._check_group_cache()
+        result = {}
+        try:
+            grps = self.yumbase.comps.get_groups()
+            todo = []
+            all_names = set()
+            for grp in grps:
+                key = (grp.groupid, grp_flt)
+                if key in self._group_pkgs:
+                    result[grp.groupid] = self._group_pkgs[key]
+                else:
+                    pkg_names = self._get_group_pkg_names(grp, grp_flt)
+                    todo.append((grp.groupid, pkg_names))
+                    all_names.update(pkg_names)
+            if todo:
+                best_pkgs = self._group_names2aipkgs(list(all_names))
+                for grp_id, pkg_names in todo:
+                    pkg_ids = self._get_best_group_pkgs(pkg_names, best_pkgs)
+                    self._group_pkgs[(grp_id, grp_flt)] = pkg_ids
+                    result[grp_id] = pkg_ids
+        except Errors.GroupsError, e:
+            print str(e)
+        return result
+
+    def _get_group_pkg_names(self, grp, grp_flt):
+        '''
+        return the package names in a group matching the group filter
+        '''
+        if grp_flt == 'all':
+            return list(grp.packages)
+        else:
+            return grp.mandatory_packages.keys() + grp.default_packages.keys()
+
+    def _get_best_group_pkgs(self, pkg_names, best_pkgs):
+        '''
+        return the package ids for the best matching packages for a list of package names
+        :param pkg_names: list of package names
+        :param best_pkgs: dict returned by _group_names2aipkgs
+        '''
+        pkgs = []
+        for name in set(pkg_names):
+            if name in best_pkgs:
+                # Sort the matching packages and take the last one (the best match for current arch)
+                (apkg, ipkg) = sorted(best_pkgs[name], key=lambda x: x[1] or x[0])[-1]
+                if ipkg:
+                    pkgs.append(ipkg)
+                else:
+                    pkgs.append(apkg)
+        return self._to_package_id_list(pkgs)
+
+    def _check_group_cache(self):
+        '''
+        Clear the group caches, if the comps metadata or the rpmdb has changed since they were made
+        '''
+        key = self._get_group_cache_key()
+        if key != self._group_cache_key:
+            self._group_tree = None
+            self._group_pkgs = {}
+            self._group_cache_key = key
+
+    def _get_group_cache_key(self):
+        '''
+        return (comps checksums, rpmdb version) for the current state
+        '''
+        checksums = []
+        for repo in self.yumbase.repos.listEnabled():
+            for mdtype in ('group_gz', 'group'):
+                try:
+                    checksums.append(repo.repoXML.getData(mdtype).checksum[1])
+                    break
+                except Exception, e: # repo has no comps of this type
+                    pass
+        rpmdb_version = str(self.yumbase.rpmdb.simpleVersion(main_only=True)[0])
+        return (tuple(checksums), rpmdb_version)
+
 #===============================================================================
 # Helper methods
 #===============================================================================
@@ -330,8 +1108,7 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
 
     def _get_po_list(self, pkg, fields):
 
-        id = ",".join([pkg.name, pkg.epoch, pkg.ver, pkg.rel, pkg.arch, pkg.ui_from_repo])
-        po_list = [id]
+        po_list = [self._get_id(pkg)]
         for field in fields:
             if hasattr(pkg,field):
                 po_list.append(getattr(pkg,field))
@@ -378,13 +1155,14 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
 
     def _get_downgrades(self,pkg):
         pkg_ids = []
+        ladder = self._get_ladder(pkg.name)
         if self._is_installed(pkg): # is installed , we must find available downgrade
-            apkgs = self.yumbase.pkgSack.returnPackages(patterns=[pkg.name], ignore_case=False)
-            for po in apkgs:
-                if self._is_valid_downgrade(pkg, po):
-                    pkg_ids.append(self._get_id(po))
+            if not ladder.multi_install: # multiple installable packages (ex. kernels) can't be downgraded
+                for po in ladder.older(pkg):
+                    if not canCoinstall(pkg.arch, po.arch): # po must not be coinstallable with pkg
+                        pkg_ids.append(self._get_id(po))
         else: # Not installed, this is the package to downgrade to, find the installed one
-            ipkgs = self.yumbase.rpmdb.searchNevra(name=pkg.name, arch = pkg.arch)
+            ipkgs = [po for po in ladder.installed if po.arch == pkg.arch]
             if ipkgs:
                 pkg_ids.append(self._get_id(ipkgs[0]))
         return pkg_ids
@@ -407,27 +1185,7 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         Check if a package is installed
         :param po: package to check for
         '''
-        (n, a, e, v, r) = po.pkgtup
-        po = self.yumbase.rpmdb.searchNevra(name=n, arch=a, ver=v, rel=r, epoch=e)
-        if po:
-            return True
-        else:
-            return False
-
-    def _is_valid_downgrade(self, po, down_po):
-        '''
-        Check if down_po is a valid downgrade to po
-        @param po:
-        @param down_po:
-        '''
-        valid = True
-        if not po.verGT(down_po):   # po must be > down_po
-            valid = False
-        elif canCoinstall(po.arch, down_po.arch): # po must not be coinstallable with down_po
-            valid = False
-        elif self.yumbase.allowedMultipleInstalls(po): # po must not be a multiple installable (ex. kernels )
-            valid = False
-        return valid
+        return po.pkgtup in self._get_installed_index()[0]
 
     def _limit_package_list(self, pkgs, skip_old=False):
         '''
@@ -441,31 +1199,27 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         '''
         good_pkgs = set()
         good_tups = {}
-        for po in pkgs:
+        installed, newest_installed = self._get_installed_index()
+        if skip_old:
+            ladders = self._get_ladders([po.name for po in pkgs if po.name in newest_installed])
+        for i, po in enumerate(pkgs):
+            if i % CANCEL_CHECK_INTERVAL == 0:
+                self._check_cancel()
             valid = True
             if po.pkgtup in good_tups: # dont process the same po twice
                 continue
-            elif self.yumbase.rpmdb.contains(po=po): # if the po is installed, then return the installed po
-                (n, a, e, v, r) = po.pkgtup
-                po = self.yumbase.rpmdb.searchNevra(name=n, arch=a, ver=v, rel=r, epoch=e)[0]
+            elif po.pkgtup in installed: # if the po is installed, then return the installed po
+                po = installed[po.pkgtup]
                 self.logger.info("%s is installed " % str(po))
-            elif skip_old:
-                ipkgs = self.yumbase.rpmdb.searchNevra(name=po.name)
-                if ipkgs:
-                    ipkg = ipkgs[0]
-                    if ipkg.verGT(po) and not self.yumbase.allowedMultipleInstalls(po): # inst > po
-                        valid = False
+            elif skip_old and po.name in ladders:
+                ladder = ladders[po.name]
+                if ladder.is_older_than_installed(po) and not ladder.multi_install: # inst > po
+                    valid = False
             if valid:
                 good_pkgs.add(po)
                 good_tups[po.pkgtup] = 1
         return good_pkgs
 
-    @property
-    def update_metadata(self):
-        if not self._updateMetadata:
-            self._updateMetadata = UpdateMetadata(self.yumbase.repos.listEnabled())
-        return self._updateMetadata
-    
 
     def _to_package_id_list(self, pkgs):
         '''
@@ -474,50 +1228,204 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         :param pkgs:
         '''
         result = set()
-        for po in sorted(pkgs):
-            if self.yumbase.rpmdb.contains(po=po): # if the po is installed, then return the installed po
-                (n, a, e, v, r) = po.pkgtup
-                po = self.yumbase.rpmdb.searchNevra(name=n, arch=a, ver=v, rel=r, epoch=e)[0]
+        installed = self._get_installed_index()[0]
+        for i, po in enumerate(sorted(pkgs)):
+            if i % CANCEL_CHECK_INTERVAL == 0:
+                self._check_cancel()
+            if po.pkgtup in installed: # if the po is installed, then return the installed po
+                po = installed[po.pkgtup]
             result.add(self._get_id(po))
         return result
 
+    def _get_installed_index(self):
+        '''
+        return the index of installed packages as a (pkgtup -> installed po, name -> newest installed po)
+        pair, the index is build once for the current rpmdb
+        '''
+        if self._installed_index is None:
+            by_tup = {}
+            by_name = {}
+            for po in self.yumbase.rpmdb.returnPackages():
+                by_tup[po.pkgtup] = po
+                if not po.name in by_name or po.verGT(by_name[po.name]):
+                    by_name[po.name] = po
+            self._installed_index = (by_tup, by_name)
+        return self._installed_index
+
+    def _get_ladder(self, name):
+        '''
+        return the version ladder for a package name
+        '''
+        return self._get_ladders([name])[name]
+
+    def _get_ladders(self, names):
+        '''
+        return a name -> version ladder dict for a list of package names
+        ladders not in the cache are build using a single lookup in the package sack & rpmdb
+        '''
+        todo = set([name for name in names if not name in self._ladders])
+        if todo:
+            apkgs = {}
+            ipkgs = {}
+            for po in self.yumbase.pkgSack.searchNames(list(todo)):
+                apkgs.setdefault(po.name, {})[po.pkgtup] = po
+            for po in self.yumbase.rpmdb.searchNames(list(todo)):
+                ipkgs.setdefault(po.name, []).append(po)
+            for name in todo:
+                inst = ipkgs.get(name, [])
+                inst_tups = set([po.pkgtup for po in inst])
+                avail = [po for tup, po in apkgs.get(name, {}).iteritems() if not tup in inst_tups]
+                pkgs = inst + avail
+                multi_install = bool(pkgs) and self.yumbase.allowedMultipleInstalls(pkgs[0])
+                self._ladders[name] = VersionLadder(avail, inst, multi_install)
+        return dict([(name, self._ladders[name]) for name in set(names)])
+
     def _get_po(self,id):
-        ''' find the real package from an package id'''
+        '''
+        find the real package from an package id
+        the package ids handed out by the daemon is kept in an index, so
+        the lookup is only done in the rpmdb/sack the first time an id is seen
+        '''
+        po = self._po_index.get(id)
+        if po is not None:
+            return po
         n, e, v, r, a, repo_id = id.split(',')
         if repo_id == 'installed' or repo_id.startswith('@'):
             pkgs = self.yumbase.rpmdb.searchNevra(n, e, v, r, a)
         else:
-            repo = self.yumbase.repos.getRepo(repo_id) # Used the repo sack, it will be faster
-            if repo:
+            try:
+                repo = self.yumbase.repos.getRepo(repo_id) # Used the repo sack, it will be faster
                 pkgs = repo.sack.searchNevra(n, e, v, r, a)
-            else: # fallback to the use the pkgSack, just in case
-                pkgs = self.pkgSack.searchNevra(n, e, v, r, a)
+            except Errors.RepoError: # fallback to the use the pkgSack, just in case
+                pkgs = self.yumbase.pkgSack.searchNevra(n, e, v, r, a)
         if pkgs:
+            self._po_index.put(id, pkgs[0], 0)
             return pkgs[0]
         else:
             return None
 
+    def _get_pkg_tuple(self, id):
+        '''
+        convert a package id string to a (n,e,v,r,a,repo) tuple
+        :param id: package id
+        '''
+        return tuple(id.split(','))
+
+    def _get_po_from_tuple(self, pkg):
+        '''
+        find the real package from an (n,e,v,r,a,repo) tuple
+        :param pkg: (n,e,v,r,a,repo) tuple
+        '''
+        return self._get_po(",".join(pkg))
+
+    def _get_attribute_dict(self, po, attrs):
+        '''
+        Get a DBus dict (a{sv}) with the attributes (including the fake ones) of a yum package object
+        attributes not found is left out.
+        :param po: yum package object
+        :param attrs: list of attribute names
+        '''
+        values = dict([(attr, self._get_po_attribute(po, attr)) for attr in attrs])
+        return to_dbus_dict(values)
+
     def _get_id(self,pkg):
         '''
         convert a yum package obejct to an id string containing (n,e,v,r,a,repo)
+        the id is added to the package index, so _get_po can find it again fast
         :param pkg:
         '''
         values = [pkg.name, pkg.epoch, pkg.ver, pkg.rel, pkg.arch, pkg.ui_from_repo]
-        return ",".join(values)
+        id = ",".join(values)
+        self._po_index.put(id, pkg, 0)
+        return id
 
 
     def _get_updates(self):
-        if not self._updates_list:
+        if self._updates_list is None:
             ygh = self.yumbase.doPackageLists(pkgnarrow='updates')
             self._updates_list = ygh.updates
+            self._updates_tups = set([po.pkgtup for po in self._updates_list])
         return self._updates_list
 
     def _get_obsoletes(self):
-        if not self._obsoletes_list:
+        if self._obsoletes_list is None:
             ygh = self.yumbase.doPackageLists(pkgnarrow='obsoletes')
             self._obsoletes_list = ygh.obsoletes
+            self._obsoletes_tups = set([po.pkgtup for po in self._obsoletes_list])
         return self._obsoletes_list
 
+    def _get_actions(self, ids):
+        '''
+        Return the available actions for a list of package ids
+        an empty string is returned for ids there is not found
+        :param ids: list of package ids
+        '''
+        result = []
+        snap = self._load_snapshot() # use the snapshot, so the updates & obsoletes dont have to be found
+        if snap and not snap.is_complete():
+            snap = None
+        for id in ids:
+            po = self._get_po(id)
+            if po:
+                if snap:
+                    result.append(snap.get_action(id))
+                else:
+                    result.append(self._get_action(po))
+            else:
+                result.append('')
+        return result
+
+    def _get_snapshot_key(self):
+        '''
+        return the state key for the snapshot of the current YumBase (None = no snapshot can be used)
+        '''
+        return snapshot.get_state_key(self.yumbase.conf, self.yumbase.repos.listEnabled(), self._yumbase_changed)
+
+    def _load_snapshot(self):
+        '''
+        return the snapshot of the package lists, if it is made from the current rpmdb, repo metadata & config
+        else None, the snapshot can be missing some of the lists (see Snapshot.is_complete)
+        '''
+        key = self._get_snapshot_key()
+        if key is None:
+            self._snapshot = None
+        elif self._snapshot is None or self._snapshot.key != key:
+            filename = os.path.join(self.yumbase.conf.cachedir, snapshot.SNAPSHOT_FILE)
+            self._snapshot = snapshot.Snapshot.load(filename, key)
+        return self._snapshot
+
+    def _get_snapshot(self, pkg_filter=None):
+        '''
+        return the snapshot of the package lists, the list for pkg_filter (all lists if None)
+        is made and the snapshot is saved, if it is not in the snapshot already.
+        return None if the state for a snapshot can't be found
+        :param pkg_filter: installed, updates, obsoletes or None
+        '''
+        snap = self._load_snapshot()
+        if not snap:
+            key = self._get_snapshot_key()
+            if key is None:
+                return None
+            snap = snapshot.Snapshot(key)
+        if pkg_filter:
+            missing = [pkg_filter] if not pkg_filter in snap.lists else []
+        else:
+            missing = [flt for flt in snapshot.FILTERS if not flt in snap.lists]
+        for flt in missing:
+            if flt == 'installed':
+                installed, newest_installed = self._get_installed_index()
+                snap.set_list('installed', sorted(self._to_package_id_list(installed.values())))
+                for name, po in newest_installed.iteritems():
+                    snap.names[name] = (po.epoch, po.version, po.release, bool(self.yumbase.allowedMultipleInstalls(po)))
+            elif flt == 'updates':
+                snap.set_list('updates', sorted(self._to_package_id_list(self._get_updates())))
+            else:
+                snap.set_list('obsoletes', sorted(self._to_package_id_list(self._get_obsoletes())))
+        if missing:
+            snap.save(os.path.join(self.yumbase.conf.cachedir, snapshot.SNAPSHOT_FILE))
+            self._snapshot = snap
+        return snap
+
     def _get_action(self, po):
         '''
         Return the available action for a given pkg_id
@@ -530,24 +1438,22 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         :return: action (remove, install, update, downgrade, obsolete)
         :rtype: string
         '''
-        updates = self._get_updates()
-        obsoletes = self._get_obsoletes()
+        self._get_updates()
+        self._get_obsoletes()
+        installed, newest_installed = self._get_installed_index()
         action = 'install'
-        if self.yumbase.rpmdb.contains(po=po): # if the best po is installed, then return the installed po
-            (n, a, e, v, r) = po.pkgtup
-            po = self.yumbase.rpmdb.searchNevra(name=n, arch=a, ver=v, rel=r, epoch=e)[0]
+        if po.pkgtup in installed: # if the best po is installed, then return the installed po
             action = 'remove'
         else:
-            if po in updates:
+            if po.pkgtup in self._updates_tups:
                 action = 'update'
-            elif po in obsoletes:
+            elif po.pkgtup in self._obsoletes_tups:
                 action = 'obsolete'
             else:
                 # Check if po is and older version of a installed package
-                ipkgs = self.yumbase.rpmdb.searchNevra(name=po.name)
-                if ipkgs:
-                    ipkg = ipkgs[0]
-                    if ipkg.verGT(po) and not self.yumbase.allowedMultipleInstalls(po): # inst > po
+                if po.name in newest_installed:
+                    ladder = self._get_ladder(po.name)
+                    if ladder.is_older_than_installed(po) and not ladder.multi_install: # inst > po
                         action = 'downgrade'
         return action
 
@@ -556,23 +1462,71 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         '''
         Get a YumBase object to work with
         '''
-        self._yumbase = yum.YumBase()
+        if self._yumbase: # close the current YumBase, so its rpmdb & files is released
+            self._reset_yumbase()
+        self._reset_caches()
+        self._warm_released = False
+        self._yumbase = self._create_yumbase()
         # make yum silent
         self._yumbase.preconf.errorlevel=0
         self._yumbase.preconf.debuglevel=0
         self._yumbase.setCacheDir()
-        # setup the download callback handler
-        self._yumbase.repos.setProgressBar( DownloadCallback(self) )
-        # Disable parallel down for this repo, we dont support it
-        for repo in self._yumbase.repos.listEnabled():
-            repo._async = False
+        # setup the download callback handlers and parallel downloads
+        self._setup_downloads()
         self.logger.debug(' --> YUM LOCKED: Lockfile = %s' % self._yumbase._lockfile)
 
 
+    def _create_yumbase(self):
+        '''
+        return a new YumBase object from the selected backend
+        ('yum' = yum.YumBase, 'fake' = in-memory fake packages, repos & rpmdb for benchmarks and tests)
+        '''
+        if self._backend == 'fake':
+            import fakebackend # only used for benchmarks & tests, it is not installed
+            return fakebackend.FakeYumBase(self._fake_packages)
+        return yum.YumBase()
+
+    def _setup_downloads(self):
+        '''
+        Setup the download callback handlers and the parallel downloads for the current YumBase
+        (call it after the enabled repos is setup)
+        '''
+        self._yumbase.repos.setProgressBar(DownloadCallback(self), MultiDownloadCallback(self))
+        max_downloads = self._config['max_parallel_downloads']
+        if max_downloads:
+            self._yumbase.conf.max_parallel_downloads = max_downloads
+        if max_downloads == 1: # download one file at the time, else the async setting of the repos is used
+            for repo in self._yumbase.repos.listEnabled():
+                repo._async = False
+
+    def _reset_caches(self):
+        '''
+        Clear the caches depending on the current YumBase object
+        '''
+        self._updateinfo_indexes = None
+        self._group_cache_key = None
+        self._group_tree = None
+        self._group_pkgs = {}
+        self._updates_list = None
+        self._obsoletes_list = None
+        self._updates_tups = set()
+        self._obsoletes_tups = set()
+        self._po_index.clear()
+        self._installed_index = None
+        self._ladders = {}
+        self._snapshot = None
+        self._cursors = {}
+        self._search_indexes = None
+        self._repo_po_maps = {}
+        self._generation += 1
+
     def _reset_yumbase(self):
         '''
         destroy the current YumBase object
         '''
+        self._reset_caches()
+        self._warm_released = False
+        self._yumbase_changed = False
         if self._yumbase:
             self._yumbase.close()
             self._yumbase.closeRpmDB()
@@ -581,6 +1535,93 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
             del self._yumbase
             self._yumbase = None
 
+    def _unlock_yumbase(self):
+        '''
+        Called when the client releases the lock
+        in keep warm mode, the YumBase is kept without the yum lock and rpmdb,
+        else (or if the YumBase setup is changed by the client) it is destroyed
+        '''
+        if self._keep_warm and self._yumbase and not self._yumbase_changed:
+            self._release_yumbase()
+        else:
+            self._reset_yumbase()
+
+    def _release_yumbase(self):
+        '''
+        release the yum lock and the rpmdb, but keep the YumBase with the loaded metadata and caches
+        '''
+        if self._yumbase and not self._warm_released:
+            self._yumbase._tsInfo = None # the transaction belongs to the client
+            self._cursors = {}
+            self._warm_rpmdb_version = str(self._yumbase.rpmdb.simpleVersion(main_only=True)[0])
+            self._yumbase.closeRpmDB()
+            # the yum lock can be taken more than once (when the YumBase is made and by Lock)
+            for i in range(getattr(self._yumbase, '_lock_refcount', 1)):
+                self._yumbase.doUnlock()
+            self._warm_released = True
+            self.logger.debug(' --> YUM RELEASED : rpmdb version = %s' % self._warm_rpmdb_version)
+
+    def _warm_up(self):
+        '''
+        Reopen the rpmdb of a released YumBase, if the rpmdb has been changed
+        since it was released, the YumBase is destroyed, so a new one will be made.
+        return True if the YumBase is reused
+        '''
+        self._warm_released = False
+        rpmdb_version = str(self._yumbase.rpmdb.simpleVersion(main_only=True)[0])
+        if rpmdb_version != self._warm_rpmdb_version:
+            self.logger.debug(' --> YUM WARMUP : rpmdb changed (%s -> %s)' % (self._warm_rpmdb_version, rpmdb_version))
+            self._reset_yumbase()
+            return False
+        self.logger.debug(' --> YUM WARMUP : rpmdb version = %s' % rpmdb_version)
+        return True
+
+    def _must_release_memory(self):
+        '''
+        Check if a warm daemon must release its memory (terminate)
+        that is when the warm timeout has expired, the daemon uses more memory than
+        the memory budget or the system is low on available memory
+        '''
+        timeout_warm = self._config['timeout_warm']
+        if timeout_warm and self._watchdog_count > self._timeout_idle + timeout_warm:
+            return True
+        memory_budget = self._config['memory_budget']
+        if memory_budget and get_memory_usage() > memory_budget:
+            self.logger.debug('Watchdog : memory budget (%i MB) exceeded' % memory_budget)
+            return True
+        min_available = self._config['min_mem_available']
+        if min_available:
+            available = get_memory_available()
+            if available is not None and available < min_available:
+                self.logger.debug('Watchdog : low on available memory (%i MB)' % available)
+                return True
+        return False
+
+    def _setup_preload(self):
+        '''
+        Setup the preload of the yum metadata, to run when the daemon is idle after startup
+        '''
+        if self._worker:
+            self._worker.add(self._preload)
+        else:
+            gobject.idle_add(self._preload)
+
+    def _preload(self):
+        '''
+        Load the metadata, package lists and search indexes, before the first client needs them
+        the yum lock and rpmdb is released afterwards, like in keep warm mode
+        '''
+        if self._yumbase or self._lock: # a client is already using the daemon
+            return False
+        self.logger.debug('Preload : loading yum metadata')
+        self._get_installed_index()
+        self._get_updates()
+        self._get_obsoletes()
+        self._get_snapshot()
+        self._get_search_indexes()
+        self._release_yumbase()
+        self.logger.debug('Preload : done')
+        return False
 
     def _setup_watchdog(self):
         '''
@@ -592,9 +1633,16 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         terminate = False
         if self._watchdog_disabled or self._is_working: # is working
             return True
+        if self._worker and self._worker.is_busy(): # method calls running or waiting in the worker
+            self._watchdog_count = 0
+            return True
         if not self._lock: # is locked
             if self._watchdog_count > self._timeout_idle:
-                terminate = True
+                if self._keep_warm and self._yumbase and not self._yumbase_changed:
+                    self._release_yumbase()
+                    terminate = self._must_release_memory()
+                else:
+                    terminate = True
         else:
             if self._watchdog_count > self._timeout_locked:
                 terminate = True
@@ -634,6 +1682,200 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         return ret
         
 
+def create_v2_class(interface, path):
+    '''
+    Create the class for the version 2 DBus API of a daemon
+    (the DBus interface name must be known, when the methods is declared)
+    :param interface: DBus interface name of the version 2 API
+    :param path: object path of the version 2 API
+    '''
+    class YumDaemonV2(dbus.service.Object):
+        '''
+        Version 2 of the DBus API, served on the given path next to the legacy API.
+        it uses native DBus types, package ids is (n,e,v,r,a,repo_id) structs (ssssss)
+        and attributes, config & repo settings is DBus dicts (a{sv}) instead of JSON strings.
+        The work is done by the main YumDaemon object, the calls is dispatched (and authorized) by it.
+        '''
+
+        def __init__(self, daemon, bus_name):
+            dbus.service.Object.__init__(self, bus_name, path)
+            self.daemon = daemon
+
+        def _message_cb(self, connection, message):
+            '''
+            Called by dbus-python for incoming method calls, the call is handled like the calls to the main object
+            '''
+            self.daemon._dispatch(dbus.service.Object._message_cb, self, connection, message)
+
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='s',
+                                              out_signature='a(ssssss)',
+                                              sender_keyword='sender')
+        def GetPackages(self, pkg_filter, sender=None):
+            '''
+            Get a list of packages, based on a package pkg_filterer
+            :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
+            :param sender:
+            '''
+            self.daemon.working_start(sender)
+            value = [self.daemon._get_pkg_tuple(id) for id in self.daemon._get_packages(pkg_filter)]
+            return self.daemon.working_ended(value)
+
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='sas',
+                                              out_signature='a((ssssss)a{sv})',
+                                              sender_keyword='sender')
+        def GetPackageWithAttributes(self, pkg_filter, fields, sender=None):
+            '''
+            Get a list of (package, attributes) pairs, based on a package pkg_filterer
+            :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
+            :param fields: yum package objects attributes to get.
+            :param sender:
+            '''
+            self.daemon.working_start(sender)
+            value = []
+            for po in self.daemon._get_package_list(pkg_filter):
+                pkg = self.daemon._get_pkg_tuple(self.daemon._get_id(po))
+                value.append((pkg, self.daemon._get_attribute_dict(po, fields)))
+            return self.daemon.working_ended(value)
+
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='sb',
+                                              out_signature='a(ssssss)',
+                                              sender_keyword='sender')
+        def GetPackagesByName(self, name, newest_only, sender=None):
+            '''
+            Get a list of packages from a name pattern
+            :param name: name pattern
+            :param newest_only: True = get newest packages only
+            :param sender:
+            '''
+            self.daemon.working_start(sender)
+            value = [self.daemon._get_pkg_tuple(id) for id in self.daemon._get_packages_by_name(name, newest_only)]
+            return self.daemon.working_ended(value)
+
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='asasbbb',
+                                              out_signature='a(ssssss)',
+                                              sender_keyword='sender')
+        def Search(self, fields, keys, match_all, newest_only, tags, sender=None ):
+            '''
+            Search for for packages, where given fields contain given key words
+            :param fields: list of fields to search in
+            :param keys: list of keywords to search for
+            :param match_all: match all flag, if True return only packages matching all keys
+            :param newest_only: return only the newest version of a package
+            :param tags: seach pkgtags
+            '''
+            self.daemon.working_start(sender)
+            result = self.daemon._search(fields, keys, match_all, newest_only, tags)
+            value = [self.daemon._get_pkg_tuple(id) for id in result]
+            return self.daemon.working_ended(value)
+
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='a(ssssss)as',
+                                              out_signature='aa{sv}',
+                                              sender_keyword='sender')
+        def GetAttributes(self, pkgs, attrs, sender=None):
+            '''
+            Get a dict of attributes for each package in a list
+            attributes not found (or packages not found) is left out of the dicts
+            :param pkgs: list of packages
+            :param attrs: list of attribute names (summary, size, description, changelog etc..)
+            :param sender:
+            '''
+            self.daemon.working_start(sender)
+            value = []
+            for pkg in pkgs:
+                po = self.daemon._get_po_from_tuple(pkg)
+                if po:
+                    value.append(self.daemon._get_attribute_dict(po, attrs))
+                else:
+                    value.append(to_dbus_dict({}))
+            return self.daemon.working_ended(value)
+
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='a(ssssss)',
+                                              out_signature='as',
+                                              sender_keyword='sender')
+        def GetActions(self, pkgs, sender=None):
+            '''
+            Get the available actions for a list of packages ('' for packages not found)
+            :param pkgs: list of packages
+            :param sender:
+            '''
+            self.daemon.working_start(sender)
+            value = self.daemon._get_actions([",".join(pkg) for pkg in pkgs])
+            return self.daemon.working_ended(value)
+
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='(ssssss)',
+                                              out_signature='aa{sv}',
+                                              sender_keyword='sender')
+        def GetUpdateInfo(self, pkg, sender=None):
+            '''
+            Get the update notices for a package
+            :param pkg: package
+            :param sender:
+            '''
+            self.daemon.working_start(sender)
+            po = self.daemon._get_po_from_tuple(pkg)
+            value = []
+            if po:
+                value = [to_dbus_dict(notice) for notice in self.daemon._get_update_notices(po)]
+            return self.daemon.working_ended(value)
+
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='',
+                                              out_signature='a((sss)a(sssb))',
+                                              sender_keyword='sender')
+        def GetGroups(self, sender=None ):
+            '''
+            Return a category/group tree
+            '''
+            self.daemon.working_start(sender)
+            value = self.daemon._get_group_tree()
+            return self.daemon.working_ended(value)
+
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='s',
+                                              out_signature='a{sv}',
+                                              sender_keyword='sender')
+        def GetConfig(self, setting ,sender=None):
+            '''
+            Get a dict with the value of a yum config setting ('*' = all settings)
+            :param setting: name of setting (debuglevel etc..)
+            :param sender:
+            '''
+            self.daemon.working_start(sender)
+            value = to_dbus_dict(self.daemon._get_config_dict(setting))
+            return self.daemon.working_ended(value)
+
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='s',
+                                              out_signature='a{sv}',
+                                              sender_keyword='sender')
+        def GetRepo(self, repo_id ,sender=None):
+            '''
+            Get a dict with information about a give repo_id (empty if not found)
+            :param repo_id:
+            :param sender:
+            '''
+            self.daemon.working_start(sender)
+            value = to_dbus_dict(self.daemon._get_repo_dict(repo_id) or {})
+            return self.daemon.working_ended(value)
+    return YumDaemonV2
+
 def doTextLoggerSetup(logroot='yumdaemon', logfmt='%(asctime)s: %(message)s', loglvl=logging.INFO):
     ''' Setup Python logging  '''
     logger = logging.getLogger(logroot)
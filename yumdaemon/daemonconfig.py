@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# (C) 2013 - Tim Lauridsen <timlau@fedoraproject.org>
+
+"""
+Configuration of the yumdaemon services (timeouts, memory limits, caches, stats & profiling)
+read from /etc/yumdaemon/yumdaemon.conf (and ~/.config/yumdaemon/yumdaemon.conf for the session service)
+"""
+import os
+import logging
+import ConfigParser
+
+SYSTEM_CONFIG = '/etc/yumdaemon/yumdaemon.conf'
+USER_CONFIG = os.path.expanduser('~/.config/yumdaemon/yumdaemon.conf')
+
+# name -> (type, default value)
+OPTIONS = {
+    'timeout_idle' :         (int, 20),      # secs before the daemon is released/closed when unlocked
+    'timeout_locked' :       (int, 600),     # secs before the daemon is closed when locked and not working
+    'keep_warm' :            (bool, False),  # keep the loaded metadata in memory, when idle
+    'preload' :              (bool, False),  # load the metadata when the daemon is started
+    'timeout_warm' :         (int, 0),       # secs to stay warm before the daemon is closed (0 = no limit)
+    'memory_budget' :        (int, 0),       # max memory (MB) used by the daemon, when warm (0 = no limit)
+    'min_mem_available' :    (int, 64),      # min available system memory (MB), when warm (0 = no limit)
+    'search_cache_entries' : (int, 100),     # max number of results in the search cache
+    'search_cache_size' :    (int, 8),       # max size (MB) of the results in the search cache
+    'po_index_entries' :     (int, 20000),   # max number of package ids in the package object index
+    'progress_rate' :        (int, 10),      # max progress signals per second for a file/package (0 = no limit)
+    'max_parallel_downloads' : (int, 0),     # max parallel downloads (0 = yum default, 1 = no parallel downloads)
+    'stats_file' :           (str, ''),      # file to write the method call stats to (Prometheus format, '' = disabled)
+    'stats_interval' :       (int, 60),      # secs between the writes of the stats_file (min 1)
+    'profile_dir' :          (str, ''),      # directory for the profiling results ('' = default dir)
+    'auth_cache_ttl' :       (int, 300),     # secs a PolicyKit authorization is cached for a client (min 1)
+}
+
+logger = logging.getLogger('yumdaemon.config')
+
+def read_config(filenames):
+    '''
+    Read the [main] section of the config files, later files overrides the earlier ones.
+    return a dict with all the options in OPTIONS, the defaults is used for missing or bad values
+    :param filenames: list of config files
+    '''
+    parser = ConfigParser.RawConfigParser()
+    try:
+        parser.read(filenames)
+    except ConfigParser.Error, e:
+        logger.error('could not read config : %s' % str(e))
+    config = {}
+    for name, (opt_type, default) in OPTIONS.iteritems():
+        value = default
+        if parser.has_option('main', name):
+            try:
+                if opt_type is bool:
+                    value = parser.getboolean('main', name)
+                elif opt_type is str:
+                    value = parser.get('main', name)
+                else:
+                    value = parser.getint('main', name)
+            except ValueError, e:
+                logger.error('bad value for %s in config : %s' % (name, str(e)))
+        config[name] = value
+    return config
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# (C) 2013 - Tim Lauridsen <timlau@fedoraproject.org>
+
+"""
+In-memory fake backend with synthetic packages, repositories, rpmdb & groups.
+It implements the parts of yum.YumBase used by the read-only (session) API, so the daemon
+can be run and profiled without yum metadata, rpmdb, root or network (--backend fake)
+"""
+import os
+import shutil
+import fnmatch
+import tempfile
+import logging
+from yum.Errors import RepoError, RepoMDError, PackageSackError
+from rpmUtils.miscutils import compareEVR
+
+WORDS = ['alpha', 'beta', 'gamma', 'delta', 'editor', 'viewer', 'library', 'daemon', 'python', 'perl',
+         'network', 'audio', 'video', 'image', 'font', 'devel', 'tools', 'server', 'client', 'plugin',
+         'kernel', 'driver', 'theme', 'game', 'office', 'mail', 'web', 'shell', 'terminal', 'database']
+ARCHS = ('noarch', 'x86_64')
+UPDATE_RATIO = 10       # every 10th package has an update in the fake-updates repo
+INSTALLED_RATIO = 7     # every 7th package is installed
+GROUP_SIZE = 50         # packages in a group
+CATEGORY_SIZE = 10      # groups in a category
+PKG_LISTS = ('installed', 'available', 'updates', 'obsoletes', 'recent', 'extras')
+
+logger = logging.getLogger('yumdaemon.fakebackend')
+
+def _match(name, patterns, ignore_case):
+    if ignore_case:
+        name = name.lower()
+        patterns = [pat.lower() for pat in patterns]
+    for pat in patterns:
+        if name == pat or fnmatch.fnmatchcase(name, pat):
+            return True
+    return False
+
+class FakePackage(object):
+    '''
+    Package object with the attributes of a yum package object used by the daemon
+    '''
+    __slots__ = ('name', 'epoch', 'version', 'release', 'arch', 'repoid', 'summary', 'installed')
+
+    def __init__(self, name, epoch, version, release, arch, repoid, summary, installed=False):
+        self.name = name
+        self.epoch = epoch
+        self.version = version
+        self.release = release
+        self.arch = arch
+        self.repoid = repoid
+        self.summary = summary
+        self.installed = installed
+
+    ver = property(lambda self: self.version)
+    rel = property(lambda self: self.release)
+    pkgtup = property(lambda self: (self.name, self.arch, self.epoch, self.version, self.release))
+    description = property(lambda self: 'The %s package is a fake package (%s)' % (self.name, self.summary))
+    url = property(lambda self: 'http://example.com/%s' % self.name)
+    license = property(lambda self: 'GPLv2+')
+    group = property(lambda self: 'Unspecified')
+    packager = property(lambda self: 'yumdaemon fake backend')
+    buildtime = property(lambda self: 1380000000)
+    size = property(lambda self: 10240)
+    changelog = property(lambda self: [])
+    filelist = property(lambda self: ['/usr/bin/%s' % self.name, '/usr/share/doc/%s/README' % self.name])
+
+    @property
+    def ui_from_repo(self):
+        if self.installed:
+            return '@' + self.repoid
+        return self.repoid
+
+    def verGT(self, other):
+        return compareEVR((self.epoch, self.version, self.release), (other.epoch, other.version, other.release)) > 0
+
+    def __cmp__(self, other):
+        return cmp(self.name, other.name) or \
+               compareEVR((self.epoch, self.version, self.release), (other.epoch, other.version, other.release)) or \
+               cmp(self.arch, other.arch) or cmp(self.repoid, other.repoid)
+
+    def __hash__(self):
+        return hash((self.pkgtup, self.repoid))
+
+    def __str__(self):
+        return '%s-%s-%s.%s' % (self.name, self.version, self.release, self.arch)
+
+class FakeSack:
+    '''
+    Package sack with a name index
+    '''
+
+    def __init__(self, pkgs=[]):
+        self._pkgs = []
+        self._names = {} # name -> [po, ...]
+        for po in pkgs:
+            self.addPackage(po)
+
+    def __len__(self):
+        return len(self._pkgs)
+
+    def addPackage(self, po):
+        self._pkgs.append(po)
+        self._names.setdefault(po.name, []).append(po)
+
+    def returnPackages(self, repoid=None, patterns=None, ignore_case=False):
+        if not patterns:
+            return list(self._pkgs)
+        if not ignore_case and not [pat for pat in patterns if set('*?[') & set(pat)]: # only exact names
+            return self.searchNames(patterns)
+        return [po for po in self._pkgs if _match(po.name, patterns, ignore_case)]
+
+    def returnNewestByName(self, name=None, patterns=None, ignore_case=False):
+        if name:
+            pkgs = self.searchNames([name])
+        else:
+            pkgs = self.returnPackages(patterns=patterns, ignore_case=ignore_case)
+        if not pkgs:
+            raise PackageSackError('No Package Matching %s' % (name or patterns))
+        newest = {}
+        for po in pkgs:
+            if not po.name in newest or po.verGT(newest[po.name]):
+                newest[po.name] = po
+        return newest.values()
+
+    def searchNames(self, names=[]):
+        result = []
+        for name in set(names):
+            result.extend(self._names.get(name, []))
+        return result
+
+    def searchNevra(self, name=None, epoch=None, ver=None, rel=None, arch=None):
+        if name:
+            pkgs = self._names.get(name, [])
+        else:
+            pkgs = self._pkgs
+        return [po for po in pkgs if (epoch is None or po.epoch == epoch) and (ver is None or po.version == ver) and
+                (rel is None or po.release == rel) and (arch is None or po.arch == arch)]
+
+class FakeRpmDB(FakeSack):
+    '''
+    The installed packages
+    '''
+
+    def simpleVersion(self, main_only=False, groups={}):
+        return ('%i:fake' % len(self), {})
+
+    def simplePkgList(self):
+        return [po.pkgtup for po in self._pkgs]
+
+class FakeRepoMDData:
+
+    def __init__(self, checksum):
+        self.checksum = ('sha256', checksum)
+
+class FakeRepoMD:
+    '''
+    The repomd of a fake repo, it only has primary metadata
+    '''
+
+    def __init__(self, repo_id, pkgs):
+        self._primary = FakeRepoMDData('%s-%i' % (repo_id, len(pkgs)))
+
+    def getData(self, mdtype):
+        if mdtype != 'primary':
+            raise RepoMDError('requested datatype %s not available' % mdtype)
+        return self._primary
+
+class FakeRepo:
+
+    def __init__(self, repo_id, cachedir, pkgs):
+        self.id = repo_id
+        self.name = 'Fake repository (%s)' % repo_id
+        self.enabled = True
+        self.cachedir = os.path.join(cachedir, repo_id)
+        self.sack = FakeSack(pkgs)
+        self.repoXML = FakeRepoMD(repo_id, pkgs)
+        self._async = False
+
+    def iterkeys(self):
+        return iter(['id', 'name', 'enabled', 'cachedir'])
+
+class FakeRepos:
+
+    def __init__(self, repos):
+        self.repos = dict([(repo.id, repo) for repo in repos])
+
+    def listEnabled(self):
+        return [repo for repo in sorted(self.repos.values(), key=lambda repo: repo.id) if repo.enabled]
+
+    def getRepo(self, repo_id):
+        if not repo_id in self.repos:
+            raise RepoError('Error getting repository data for %s, repository not found' % repo_id)
+        return self.repos[repo_id]
+
+    def findRepos(self, pattern):
+        return [repo for repo in self.repos.values() if fnmatch.fnmatch(repo.id, pattern)]
+
+    def enableRepo(self, repo_id):
+        self.getRepo(repo_id).enabled = True
+
+    def disableRepo(self, repo_id):
+        self.getRepo(repo_id).enabled = False
+
+    def setProgressBar(self, obj, multi_obj=None):
+        pass
+
+class FakeGroup:
+
+    def __init__(self, groupid, names):
+        self.groupid = groupid
+        self.ui_name = 'Fake group %s' % groupid
+        self.ui_description = 'Fake packages %s - %s' % (names[0], names[-1])
+        self.installed = False
+        self.mandatory_packages = dict([(name, 1) for i, name in enumerate(names) if i % 5 == 0])
+        self.default_packages = dict([(name, 1) for i, name in enumerate(names) if i % 5 == 1])
+        self.optional_packages = dict([(name, 1) for i, name in enumerate(names) if i % 5 > 1])
+        self.packages = list(names)
+
+class FakeCategory:
+
+    def __init__(self, categoryid, groups):
+        self.categoryid = categoryid
+        self.ui_name = 'Fake category %s' % categoryid
+        self.ui_description = 'Fake category %s' % categoryid
+        self.groups = groups
+
+class FakeComps:
+
+    def __init__(self, groups, categories):
+        self._groups = dict([(grp.groupid, grp) for grp in groups])
+        self._categories = categories
+
+    def compile(self, pkgtuplist):
+        names = set([pkgtup[0] for pkgtup in pkgtuplist])
+        for grp in self._groups.values():
+            grp.installed = set(grp.mandatory_packages.keys() + grp.default_packages.keys()) <= names
+
+    def get_groups(self):
+        return self._groups.values()
+
+    def get_categories(self):
+        return self._categories
+
+    def has_group(self, grpid):
+        return grpid in self._groups
+
+    def return_group(self, grpid):
+        return self._groups.get(grpid)
+
+class FakePkgTags:
+
+    def search_names(self, name):
+        return {}
+
+class FakeHolder:
+    '''
+    Result of doPackageLists
+    '''
+    def __init__(self):
+        for pkg_list in PKG_LISTS:
+            setattr(self, pkg_list, [])
+
+class FakeConfig:
+
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+        self.installroot = cachedir # the rpmdb is in memory, so the host rpmdb is not used
+        self.debuglevel = 0
+        self.errorlevel = 0
+        self.max_parallel_downloads = 10
+        self.installonlypkgs = ['kernel']
+
+    def iterkeys(self):
+        return iter(sorted(self.__dict__.keys()))
+
+class FakePreConfig:
+
+    def __init__(self):
+        self.fn = None
+        self.errorlevel = 0
+        self.debuglevel = 0
+
+class FakeYumBase:
+    '''
+    In-memory replacement for yum.YumBase, with a number of synthetic packages in two repos
+    (fake & fake-updates), an rpmdb with every 7th package installed and groups of 50 packages
+    '''
+
+    def __init__(self, num_packages=10000):
+        self.preconf = FakePreConfig()
+        self.conf = FakeConfig(tempfile.mkdtemp(prefix='yumdaemon-fake-'))
+        # stamp file for the in-memory rpmdb, so the snapshot state can be found like with yum
+        rpmdir = os.path.join(self.conf.installroot, 'var/lib/rpm')
+        os.makedirs(rpmdir)
+        open(os.path.join(rpmdir, 'Packages'), 'w').close()
+        self.pkgtags = FakePkgTags()
+        self._lockfile = None
+        self._tsInfo = None
+        self._sack = None
+        self._sack_repos = None
+        base, updates, installed = [], [], []
+        names = []
+        for i in range(1, num_packages + 1):
+            name = 'fake-%07i' % i
+            names.append(name)
+            arch = ARCHS[i % len(ARCHS)]
+            summary = '%s %s %s' % (WORDS[i % len(WORDS)], WORDS[(i // 7) % len(WORDS)], WORDS[(i // 49) % len(WORDS)])
+            base.append(FakePackage(name, '0', '1.0', '1', arch, 'fake', summary))
+            if i % UPDATE_RATIO == 0:
+                updates.append(FakePackage(name, '0', '1.1', '1', arch, 'fake-updates', summary))
+            if i % INSTALLED_RATIO == 0:
+                installed.append(FakePackage(name, '0', '1.0', '1', arch, 'fake', summary, installed=True))
+        self.repos = FakeRepos([FakeRepo('fake', self.conf.cachedir, base),
+                                FakeRepo('fake-updates', self.conf.cachedir, updates)])
+        self.rpmdb = FakeRpmDB(installed)
+        groups = [FakeGroup('fake-group-%i' % (i // GROUP_SIZE), names[i:i + GROUP_SIZE])
+                  for i in range(0, len(names), GROUP_SIZE)]
+        categories = [FakeCategory('fake-category-%i' % (i // CATEGORY_SIZE), [grp.groupid for grp in groups[i:i + CATEGORY_SIZE]])
+                      for i in range(0, len(groups), CATEGORY_SIZE)]
+        self.comps = FakeComps(groups, categories)
+        logger.debug('fake backend with %i packages (%i installed)' % (len(base) + len(updates), len(installed)))
+
+    @property
+    def pkgSack(self):
+        '''
+        the packages in the enabled repos
+        '''
+        enabled = [repo.id for repo in self.repos.listEnabled()]
+        if self._sack is None or self._sack_repos != enabled:
+            self._sack = FakeSack()
+            for repo in self.repos.listEnabled():
+                for po in repo.sack.returnPackages():
+                    self._sack.addPackage(po)
+            self._sack_repos = enabled
+        return self._sack
+
+    def setCacheDir(self, force=False, tmpdir=None, reuse=True):
+        return True
+
+    def allowedMultipleInstalls(self, po):
+        return po.name in self.conf.installonlypkgs
+
+    def doPackageLists(self, pkgnarrow='all', patterns=None, showdups=None, ignore_case=False):
+        '''
+        Make the package lists like yum (only the list in pkgnarrow is made)
+        '''
+        lists = FakeHolder()
+        installed = self.rpmdb.returnPackages()
+        inst_tups = set([po.pkgtup for po in installed])
+        newest = {} # (name, arch) -> newest available po
+        if pkgnarrow in ('available', 'updates', 'extras', 'all'):
+            for po in self.pkgSack.returnPackages():
+                key = (po.name, po.arch)
+                if not key in newest or po.verGT(newest[key]):
+                    newest[key] = po
+        if pkgnarrow in ('installed', 'all'):
+            lists.installed = installed
+        if pkgnarrow in ('available', 'all'):
+            lists.available = [po for po in newest.values() if not po.pkgtup in inst_tups]
+        if pkgnarrow in ('updates', 'all'):
+            for po in installed:
+                avail = newest.get((po.name, po.arch))
+                if avail and avail.verGT(po):
+                    lists.updates.append(avail)
+        if pkgnarrow in ('extras', 'all'):
+            avail_tups = set([po.pkgtup for po in self.pkgSack.returnPackages()])
+            lists.extras = [po for po in installed if not po.pkgtup in avail_tups]
+        return lists
+
+    def searchGenerator(self, fields, criteria, showdups=True, keys=False, searchtags=True, searchrpmdb=True):
+        '''
+        yield (po, matched keys) for the packages where the criteria is found in one of the fields
+        '''
+        criteria = [(crit, crit.lower()) for crit in criteria]
+        pkgs = self.pkgSack.returnPackages()
+        if searchrpmdb:
+            pkgs += self.rpmdb.returnPackages()
+        for po in pkgs:
+            values = [str(getattr(po, field, '') or '').lower() for field in fields]
+            matched = [crit for crit, lcrit in criteria if [value for value in values if lcrit in value]]
+            if matched:
+                if keys:
+                    yield (po, matched, [])
+                else:
+                    yield (po, matched)
+
+    def doUnlock(self, lockfile=None):
+        pass
+
+    def closeRpmDB(self):
+        pass
+
+    def close(self):
+        shutil.rmtree(self.conf.cachedir, True)
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# (C) 2013 - Tim Lauridsen <timlau@fedoraproject.org>
+
+"""
+On-demand profiling of the DBus method calls, using cProfile (a .prof file for each method)
+or a sampling profiler (a .folded file with collapsed stacks for each method, for flamegraphs)
+"""
+import os
+import sys
+import stat
+import thread
+import logging
+import threading
+import cProfile
+
+MODES = ('cprofile', 'sample')
+SAMPLE_INTERVAL = 0.005 # secs between the stack samples
+
+logger = logging.getLogger('yumdaemon.profiler')
+
+def get_default_dir():
+    '''
+    return the default directory for the profiling results
+    '''
+    if os.getuid() == 0:
+        return '/var/lib/yumdaemon/profile'
+    return os.path.expanduser('~/.cache/yumdaemon/profile')
+
+def check_dir(directory):
+    '''
+    Check the directory for the profiling results is safe to write to,
+    it must be a real directory (not a symlink), owned by the daemon user and
+    not writable by group or others.
+    raise OSError, if it is not
+    :param directory: directory to check
+    '''
+    st = os.lstat(directory)
+    if stat.S_ISLNK(st.st_mode) or not stat.S_ISDIR(st.st_mode):
+        raise OSError('profile directory is not a directory : %s' % directory)
+    if st.st_uid != os.getuid():
+        raise OSError('profile directory is not owned by uid %i : %s' % (os.getuid(), directory))
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise OSError('profile directory is writable by group or others : %s' % directory)
+
+def _collapse_stack(frame):
+    '''
+    return the stack of a frame in the collapsed format (outer;...;inner)
+    '''
+    names = []
+    while frame:
+        code = frame.f_code
+        names.append('%s:%s' % (os.path.splitext(os.path.basename(code.co_filename))[0], code.co_name))
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
+
+class Profiler:
+    '''
+    Profile the method calls, the calls is started & ended by the Logger decorator
+    '''
+
+    def __init__(self):
+        self.mode = None            # current mode (None = not profiling)
+        self.directory = None       # directory to write the results to
+        self._prefix = ''           # prefix for the result files
+        self._lock = threading.Lock()
+        self._running = {}          # thread id -> method name, for the running calls
+        self._profiles = {}         # method name -> cProfile.Profile (cprofile mode)
+        self._enabled = {}          # thread id -> cProfile.Profile enabled for the running call (kept by stop)
+        self._stacks = {}           # method name -> {collapsed stack -> samples} (sample mode)
+        self._sampler = None
+        self._stop_sampler = threading.Event()
+
+    def start(self, mode, directory, prefix='yumdaemon'):
+        '''
+        Start profiling, a running profiling is stopped first
+        :param mode: cprofile or sample
+        :param directory: directory to write the results to
+        :param prefix: prefix for the result files
+        '''
+        if mode not in MODES:
+            raise ValueError('unknown profiling mode : %s' % mode)
+        if self.mode:
+            self.stop()
+        if not os.path.lexists(directory):
+            os.makedirs(directory, 0700)
+        check_dir(directory)
+        self.directory = directory
+        self._prefix = '%s-%i' % (prefix, os.getpid())
+        self._profiles = {}
+        self._stacks = {}
+        self.mode = mode
+        if mode == 'sample':
+            self._stop_sampler.clear()
+            self._sampler = threading.Thread(target=self._sample, name='yumdaemon-sampler')
+            self._sampler.setDaemon(True)
+            self._sampler.start()
+        logger.info('profiling started (%s) : %s' % (mode, directory))
+
+    def stop(self):
+        '''
+        Stop profiling and write the results
+        return a list of the files written
+        '''
+        mode = self.mode
+        if not mode:
+            return []
+        self.mode = None
+        if self._sampler:
+            self._stop_sampler.set()
+            self._sampler.join()
+            self._sampler = None
+        with self._lock:
+            self._running = {}
+            if mode == 'cprofile':
+                results = self._profiles
+                self._profiles = {}
+            else:
+                results = self._stacks
+                self._stacks = {}
+        files = []
+        try:
+            check_dir(self.directory)
+        except OSError, e:
+            logger.error('profiling results not written : %s' % str(e))
+            return files
+        for name, result in sorted(results.items()):
+            filename = os.path.join(self.directory, '%s-%s.%s' % (self._prefix, name, 'prof' if mode == 'cprofile' else 'folded'))
+            try:
+                if mode == 'cprofile':
+                    result.dump_stats(filename)
+                else:
+                    f = open(filename, 'w')
+                    for stack, count in sorted(result.items()):
+                        f.write('%s %i\n' % (stack, count))
+                    f.close()
+                files.append(filename)
+            except (IOError, OSError), e:
+                logger.error('could not write profile %s : %s' % (filename, str(e)))
+        logger.info('profiling stopped : %i files written' % len(files))
+        return files
+
+    def call_started(self, name):
+        '''
+        Called when a method call is started
+        :param name: method name
+        '''
+        mode = self.mode
+        if not mode:
+            return
+        with self._lock:
+            self._running[thread.get_ident()] = name
+            if mode == 'cprofile':
+                profile = self._profiles.setdefault(name, cProfile.Profile())
+                self._enabled[thread.get_ident()] = profile
+        if mode == 'cprofile':
+            profile.enable()
+
+    def call_ended(self, name):
+        '''
+        Called when a method call is ended, the profiler for the call is always disabled,
+        also when the profiling is stopped while the call is running
+        :param name: method name
+        '''
+        with self._lock:
+            self._running.pop(thread.get_ident(), None)
+            profile = self._enabled.pop(thread.get_ident(), None)
+        if profile:
+            profile.disable()
+
+    def _sample(self):
+        '''
+        Sample the stacks of the threads running a method call, until the profiling is stopped
+        '''
+        while not self._stop_sampler.is_set():
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, name in self._running.items():
+                    frame = frames.get(ident)
+                    if frame:
+                        stacks = self._stacks.setdefault(name, {})
+                        stack = _collapse_stack(frame)
+                        stacks[stack] = stacks.get(stack, 0) + 1
+            self._stop_sampler.wait(SAMPLE_INTERVAL)
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# (C) 2013 - Tim Lauridsen <timlau@fedoraproject.org>
+
+"""
+Inverted search index (token -> packages) for the yumdaemon Search method
+"""
+import os
+import re
+import logging
+import cPickle as pickle
+from array import array
+
+SEARCH_FIELDS = ('name', 'summary', 'description', 'url')
+INDEX_VERSION = 1
+INDEX_FILE = 'yumdaemon-search.idx'
+GRAM_SIZE = 3            # size of the n-grams used to find the tokens containing a key
+MATCH_CACHE_SIZE = 1000  # max. number of keys with the matching tokens cached
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+KEY_RE = re.compile(r'^\w+$', re.UNICODE)
+
+logger = logging.getLogger('yumdaemon.searchindex')
+
+def is_token(key):
+    '''
+    Check if a search key is a single token, only single token keys can be searched in the index
+    '''
+    return bool(KEY_RE.match(key))
+
+def _grams(token):
+    '''
+    return the set of n-grams (GRAM_SIZE) in a token
+    '''
+    return set([token[i:i + GRAM_SIZE] for i in range(len(token) - GRAM_SIZE + 1)])
+
+class SearchIndex:
+    '''
+    Inverted index of the tokens in the name, summary, description & url of a set of packages
+    A key is matching a package field, if it is a substring of one of the tokens in the field.
+    It is the same as the substring match done by yum, as long as the key is a single token.
+    '''
+
+    def __init__(self, checksum=None):
+        self.checksum = checksum # checksum of the metadata the index is build from
+        self.pkgs = []           # list of pkgtups (n, a, e, v, r)
+        self.fields = dict([(field, {}) for field in SEARCH_FIELDS]) # field -> token -> package numbers
+        self._vocab = None       # sorted list of the tokens in all fields (made by the first search)
+        self._grams = None       # n-gram -> numbers of the tokens in _vocab containing it
+        self._matches = {}       # key -> tokens containing the key (cache)
+
+    def add(self, pkgtup, values):
+        '''
+        Add a package to the index
+        :param pkgtup: package tuple (n, a, e, v, r)
+        :param values: field values, in the same order as SEARCH_FIELDS
+        '''
+        num = len(self.pkgs)
+        self.pkgs.append(pkgtup)
+        for field, value in zip(SEARCH_FIELDS, values):
+            if not value:
+                continue
+            tokens = self.fields[field]
+            for token in set(TOKEN_RE.findall(value.lower())):
+                tokens.setdefault(token, array('i')).append(num)
+        self._vocab = None
+        self._grams = None
+        self._matches = {}
+
+    def search(self, fields, key):
+        '''
+        return a set of pkgtups where the key is found in one of the fields
+        :param fields: list of fields to search in
+        :param key: key to search for (must be a single token)
+        '''
+        key = key.lower()
+        found = set()
+        for token in self._get_matching_tokens(key):
+            for field in fields:
+                nums = self.fields[field].get(token)
+                if nums:
+                    found.update(nums)
+        return set([self.pkgs[num] for num in found])
+
+    def _get_matching_tokens(self, key):
+        '''
+        return the tokens (in all fields) containing a key, the candidates is found by the
+        n-grams of the key, so only keys shorter than GRAM_SIZE needs a scan of all tokens
+        :param key: key to search for (lower case)
+        '''
+        tokens = self._matches.get(key)
+        if tokens is not None:
+            return tokens
+        if self._vocab is None:
+            self._build_grams()
+        if len(key) >= GRAM_SIZE:
+            candidates = None
+            for gram in sorted(_grams(key), key=lambda gram: len(self._grams.get(gram, ()))):
+                nums = self._grams.get(gram)
+                if not nums:
+                    candidates = set()
+                    break
+                if candidates is None:
+                    candidates = set(nums)
+                else:
+                    candidates.intersection_update(nums)
+            tokens = [self._vocab[num] for num in candidates if key in self._vocab[num]]
+        else:
+            tokens = [token for token in self._vocab if key in token]
+        if len(self._matches) >= MATCH_CACHE_SIZE:
+            self._matches = {}
+        self._matches[key] = tokens
+        return tokens
+
+    def _build_grams(self):
+        '''
+        Build the vocabulary of all tokens and the n-gram -> tokens map
+        '''
+        vocab = set()
+        for tokens in self.fields.itervalues():
+            vocab.update(tokens.iterkeys())
+        self._vocab = sorted(vocab)
+        self._grams = {}
+        for num, token in enumerate(self._vocab):
+            for gram in _grams(token):
+                self._grams.setdefault(gram, array('i')).append(num)
+
+    def save(self, filename):
+        '''
+        Save the index to a file
+        '''
+        data = (INDEX_VERSION, self.checksum, self.pkgs, self.fields)
+        tmpname = filename + '.tmp'
+        try:
+            f = open(tmpname, 'wb')
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+            f.close()
+            os.rename(tmpname, filename)
+        except (IOError, OSError), e:
+            logger.debug('could not save search index %s : %s' % (filename, str(e)))
+
+    @staticmethod
+    def load(filename, checksum):
+        '''
+        Load an index from a file, return None if the index is not found or not matching the checksum
+        '''
+        try:
+            f = open(filename, 'rb')
+            version, file_checksum, pkgs, fields = pickle.load(f)
+            f.close()
+        except Exception, e: # missing or broken index file
+            return None
+        if version != INDEX_VERSION or file_checksum != checksum:
+            return None
+        index = SearchIndex(checksum)
+        index.pkgs = pkgs
+        index.fields = fields
+        return index
+
+def get_repo_checksum(repo):
+    '''
+    return the checksum of the primary metadata for a repo (None if not found)
+    '''
+    try:
+        return repo.repoXML.getData('primary').checksum[1]
+    except Exception, e:
+        return None
+
+def get_repo_index(repo, populate=None):
+    '''
+    Get the search index for a repository
+    the index is stored in the repo cachedir and rebuild when the primary metadata checksum changes
+    :param repo: yum repository object
+    :param populate: function called to populate the repo sack, before the index is build
+    '''
+    checksum = get_repo_checksum(repo)
+    filename = os.path.join(repo.cachedir, INDEX_FILE)
+    index = None
+    if checksum:
+        index = SearchIndex.load(filename, checksum)
+    if not index:
+        logger.debug('building search index for %s' % repo.id)
+        if populate:
+            populate()
+        index = SearchIndex(checksum)
+        for (n, e, v, r, a, summary, description, url) in _get_repo_rows(repo):
+            index.add((n, a, e, v, r), (n, summary, description, url))
+        if checksum and index.pkgs: # an empty index can be from a sack there is not populated
+            index.save(filename)
+    return index
+
+def get_packages_index(pkgs):
+    '''
+    Build a search index (not stored) for a list of yum package objects (Ex. the installed packages)
+    :param pkgs: list of yum package objects
+    '''
+    index = SearchIndex()
+    for po in pkgs:
+        index.add(po.pkgtup, (po.name, po.summary, po.description, po.url))
+    return index
+
+def _get_repo_rows(repo):
+    '''
+    Get (n, e, v, r, a, summary, description, url) for all packages in a repo
+    the primary sqlite db is read directly if possible, it is a lot faster than using the package objects
+    '''
+    try:
+        db = repo.sack.primarydb[repo]
+    except (AttributeError, KeyError, TypeError):
+        db = None
+    if db is not None:
+        cur = db.cursor()
+        cur.execute('SELECT name, epoch, version, release, arch, summary, description, url FROM packages')
+        for row in cur:
+            yield row
+    else:
+        for po in repo.sack.returnPackages():
+            yield (po.name, po.epoch, po.version, po.release, po.arch, po.summary, po.description, po.url)
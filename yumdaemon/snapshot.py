@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# (C) 2013 - Tim Lauridsen <timlau@fedoraproject.org>
+
+"""
+Snapshot of the computed package lists (installed, updates, obsoletes), so a newly started
+daemon can answer GetPackages & GetActions without loading the rpmdb & package sacks
+"""
+import os
+import marshal
+import logging
+from rpmUtils.miscutils import compareEVR
+
+SNAPSHOT_VERSION = 3
+SNAPSHOT_FILE = 'yumdaemon-snapshot.dat'
+RPMDB_PACKAGES = 'var/lib/rpm/Packages' # relative to the installroot
+FILTERS = ('installed', 'updates', 'obsoletes')
+# yum config options changing the package lists
+CONFIG_OPTIONS = ('exclude', 'obsoletes', 'installonlypkgs', 'multilib_policy', 'exactarch')
+# repo options changing the package lists
+REPO_OPTIONS = ('exclude', 'includepkgs')
+
+logger = logging.getLogger('yumdaemon.snapshot')
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+        return (int(st.st_mtime), st.st_size)
+    except OSError:
+        return None
+
+def _options(obj, options):
+    '''
+    return the values of some options as a tuple (lists is converted to tuples, so it can be marshalled & compared)
+    '''
+    values = []
+    for option in options:
+        value = getattr(obj, option, None)
+        if isinstance(value, list):
+            value = tuple(value)
+        values.append(value)
+    return tuple(values)
+
+def _get_primary_checksum(repo):
+    '''
+    return the checksum of the primary metadata for a repo (None if not found)
+    the repomd is loaded by yum, so it is refreshed when the metadata is expired
+    '''
+    try:
+        return repo.repoXML.getData('primary').checksum[1]
+    except Exception, e:
+        return None
+
+def get_state_key(conf, repos, changed=False):
+    '''
+    return the key for the state a snapshot is made from, it is the (mtime, size)
+    of the rpmdb Packages file in the installroot, the primary metadata checksums of the enabled repos,
+    the config & repo options changing the package lists and the changed flag.
+    return None if the state can't be found (no rpmdb or repo metadata), then the snapshot can't be used
+    :param conf: yum config object
+    :param repos: list of enabled yum repository objects
+    :param changed: the yum setup has been changed by a client (repos, config)
+    '''
+    rpmdb = _stat(os.path.join(conf.installroot, RPMDB_PACKAGES))
+    if rpmdb is None:
+        return None
+    key = [rpmdb, _options(conf, CONFIG_OPTIONS), bool(changed)]
+    for repo in sorted(repos, key=lambda repo: repo.id):
+        checksum = _get_primary_checksum(repo)
+        if checksum is None:
+            return None
+        key.append((repo.id, checksum, _options(repo, REPO_OPTIONS)))
+    return tuple(key)
+
+def _nevra(pkg_id):
+    return pkg_id.rsplit(',', 1)[0]
+
+class Snapshot:
+    '''
+    The package ids of the installed packages, updates and obsoletes and
+    a name index of the installed packages (name -> (epoch, version, release, multi_install))
+    '''
+
+    def __init__(self, key):
+        self.key = key      # state key (see get_state_key)
+        self.lists = {}     # filter -> [pkg_id, ...]
+        self.names = {}     # name -> (epoch, version, release, multi_install) for the newest installed
+        self._nevras = None
+
+    def get_list(self, pkg_filter):
+        return self.lists.get(pkg_filter, [])
+
+    def set_list(self, pkg_filter, pkg_ids):
+        self.lists[pkg_filter] = pkg_ids
+        self._nevras = None
+
+    def is_complete(self):
+        '''
+        return True if the snapshot has all the package lists (needed by get_action)
+        '''
+        return not [pkg_filter for pkg_filter in FILTERS if not pkg_filter in self.lists]
+
+    def get_action(self, pkg_id):
+        '''
+        return the action for the id of an existing package (same result as YumDaemonBase._get_action)
+        '''
+        if self._nevras is None:
+            self._nevras = dict([(pkg_filter, set([_nevra(id) for id in self.get_list(pkg_filter)]))
+                                 for pkg_filter in FILTERS])
+        nevra = _nevra(pkg_id)
+        if nevra in self._nevras['installed']:
+            return 'remove'
+        elif nevra in self._nevras['updates']:
+            return 'update'
+        elif nevra in self._nevras['obsoletes']:
+            return 'obsolete'
+        n, e, v, r, a = nevra.split(',')
+        if n in self.names:
+            ie, iv, ir, multi_install = self.names[n]
+            if not multi_install and compareEVR((ie, iv, ir), (e, v, r)) > 0: # inst > po
+                return 'downgrade'
+        return 'install'
+
+    def save(self, filename):
+        data = (SNAPSHOT_VERSION, self.key, self.lists, self.names)
+        tmpname = filename + '.tmp'
+        try:
+            f = open(tmpname, 'wb')
+            marshal.dump(data, f)
+            f.close()
+            os.rename(tmpname, filename)
+        except (IOError, OSError, ValueError), e:
+            logger.debug('could not save snapshot %s : %s' % (filename, str(e)))
+
+    @staticmethod
+    def load(filename, key):
+        '''
+        Load a snapshot from a file, return None if the snapshot is not found or not made from the same state
+        '''
+        try:
+            f = open(filename, 'rb')
+            version, file_key, lists, names = marshal.load(f)
+            f.close()
+        except Exception, e: # missing or broken snapshot file
+            return None
+        if version != SNAPSHOT_VERSION or file_key != key:
+            return None
+        snap = Snapshot(key)
+        snap.lists = lists
+        snap.names = names
+        return snap
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# (C) 2013 - Tim Lauridsen <timlau@fedoraproject.org>
+
+"""
+Statistics for the DBus method calls (number of calls, errors and latency histograms),
+with the time split in compute, JSON encoding and DBus marshalling
+"""
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+
+# upper bounds (secs) of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# the parts the time of a call is split into
+PARTS = ('total', 'compute', 'json', 'marshal')
+QUANTILES = (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+
+logger = logging.getLogger('yumdaemon.stats')
+
+class Histogram:
+    '''
+    Latency histogram with fixed buckets (like a Prometheus histogram)
+    '''
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # the last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        '''
+        return the estimated q quantile (0 -> 1), interpolated inside the bucket it falls into
+        '''
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                if i == len(self.buckets): # +Inf bucket
+                    return self.buckets[-1]
+                lower = self.buckets[i-1] if i > 0 else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def get_stats(self):
+        stats = {'sum' : self.sum}
+        for name, q in QUANTILES:
+            stats[name] = self.quantile(q)
+        return stats
+
+class MethodStats:
+    '''
+    Number of calls, errors and latency histograms for a DBus method
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.histograms = dict([(part, Histogram()) for part in PARTS])
+
+    def add(self, times, error):
+        self.count += 1
+        if error:
+            self.errors += 1
+        for part in PARTS:
+            self.histograms[part].observe(max(times[part], 0.0))
+
+    def get_stats(self):
+        stats = {'count' : self.count, 'errors' : self.errors}
+        for part in PARTS:
+            stats[part] = self.histograms[part].get_stats()
+        return stats
+
+class CallStats:
+    '''
+    Statistics for all the DBus methods.
+    The dispatcher calls begin/end around the handling of a method call, the Logger decorator
+    calls method_ended with the time used in the method and the JSON encoding time is added
+    by add_json. The marshalling time is the time used by dbus-python outside the method.
+    '''
+
+    def __init__(self):
+        self._methods = {}          # method name -> MethodStats
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._changed = False       # changed since the last export
+
+    def begin(self):
+        self._local.start = time.time()
+        self._local.json = 0.0
+        self._local.method = None
+
+    def add_json(self, secs):
+        self._local.json = getattr(self._local, 'json', 0.0) + secs
+
+    def method_ended(self, name, secs, error=False):
+        self._local.method = (name, secs, error)
+
+    def end(self):
+        method = getattr(self._local, 'method', None)
+        if not method: # not a call to a daemon method (Introspect etc.)
+            return
+        name, secs, error = method
+        json_secs = self._local.json
+        total = time.time() - self._local.start
+        times = {'total' : total, 'compute' : secs - json_secs, 'json' : json_secs, 'marshal' : total - secs}
+        self._local.method = None
+        with self._lock:
+            self._methods.setdefault(name, MethodStats()).add(times, error)
+            self._changed = True
+
+    def get_stats(self):
+        '''
+        return a dict with method name -> stats (count, errors and sum, p50, p95, p99 for each part)
+        '''
+        with self._lock:
+            return dict([(name, method.get_stats()) for name, method in self._methods.items()])
+
+    def write_prometheus(self, filename):
+        '''
+        Write the statistics to a file in the Prometheus text exposition format
+        (for the node_exporter textfile collector), only if they have changed since the last write
+        '''
+        with self._lock:
+            if not self._changed:
+                return
+            self._changed = False
+            lines = ['# HELP yumdaemon_method_calls_total Number of DBus method calls',
+                     '# TYPE yumdaemon_method_calls_total counter']
+            names = sorted(self._methods)
+            for name in names:
+                lines.append('yumdaemon_method_calls_total{method="%s"} %i' % (name, self._methods[name].count))
+            lines += ['# HELP yumdaemon_method_errors_total Number of DBus method calls failed with an error',
+                      '# TYPE yumdaemon_method_errors_total counter']
+            for name in names:
+                lines.append('yumdaemon_method_errors_total{method="%s"} %i' % (name, self._methods[name].errors))
+            lines += ['# HELP yumdaemon_method_seconds Latency of the DBus method calls',
+                      '# TYPE yumdaemon_method_seconds histogram']
+            for name in names:
+                for part in PARTS:
+                    hist = self._methods[name].histograms[part]
+                    labels = 'method="%s",part="%s"' % (name, part)
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append('yumdaemon_method_seconds_bucket{%s,le="%g"} %i' % (labels, bound, cumulative))
+                    lines.append('yumdaemon_method_seconds_bucket{%s,le="+Inf"} %i' % (labels, hist.count))
+                    lines.append('yumdaemon_method_seconds_sum{%s} %f' % (labels, hist.sum))
+                    lines.append('yumdaemon_method_seconds_count{%s} %i' % (labels, hist.count))
+        tmpname = filename + '.tmp'
+        try:
+            f = open(tmpname, 'w')
+            f.write('\n'.join(lines) + '\n')
+            f.close()
+            os.rename(tmpname, filename)
+        except (IOError, OSError), e:
+            logger.debug('could not write stats %s : %s' % (filename, str(e)))
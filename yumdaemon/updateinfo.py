@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# (C) 2013 - Tim Lauridsen <timlau@fedoraproject.org>
+
+"""
+Persistent index of the update notices (updateinfo.xml) in a repository,
+so the updateinfo.xml dont have to be parsed every time the daemon is started
+"""
+import os
+import json
+import logging
+from yum.update_md import UpdateMetadata
+
+INDEX_VERSION = 1
+INDEX_FILE = 'yumdaemon-updateinfo.json'
+
+logger = logging.getLogger('yumdaemon.updateinfo')
+
+class UpdateInfoIndex:
+    '''
+    Update notices from a repository, indexed by update id and package name
+    '''
+
+    def __init__(self, checksum=None):
+        self.checksum = checksum # checksum of the updateinfo metadata the index is build from
+        self.notices = {}        # update_id -> notice (dict)
+        self.names = {}          # package name -> [update_id, ...]
+
+    def add(self, notice):
+        '''
+        Add a notice to the index
+        :param notice: update notice as a dict (UpdateNotice._md)
+        '''
+        update_id = notice['update_id']
+        if update_id in self.notices:
+            return
+        self.notices[update_id] = notice
+        names = set()
+        for coll in notice['pkglist']:
+            for pkg in coll['packages']:
+                names.add(pkg['name'])
+        for name in names:
+            self.names.setdefault(name, []).append(update_id)
+
+    def get_notices(self, name):
+        '''
+        return a list of update notices (dicts) for a package name
+        '''
+        return [self.notices[update_id] for update_id in self.names.get(name, [])]
+
+    def get_notice(self, update_id):
+        '''
+        return the update notice (dict) with a given update id (None if not found)
+        '''
+        return self.notices.get(update_id)
+
+    def save(self, filename):
+        data = {'version' : INDEX_VERSION, 'checksum' : self.checksum,
+                'notices' : self.notices, 'names' : self.names}
+        tmpname = filename + '.tmp'
+        try:
+            f = open(tmpname, 'w')
+            json.dump(data, f)
+            f.close()
+            os.rename(tmpname, filename)
+        except (IOError, OSError, ValueError), e:
+            logger.debug('could not save updateinfo index %s : %s' % (filename, str(e)))
+
+    @staticmethod
+    def load(filename, checksum):
+        '''
+        Load an index from a file, return None if the index is not found or not matching the checksum
+        '''
+        try:
+            f = open(filename, 'r')
+            data = json.load(f)
+            f.close()
+        except Exception, e: # missing or broken index file
+            return None
+        if data.get('version') != INDEX_VERSION or data.get('checksum') != checksum:
+            return None
+        index = UpdateInfoIndex(checksum)
+        index.notices = data['notices']
+        index.names = data['names']
+        return index
+
+def get_repo_updateinfo(repo):
+    '''
+    Get the updateinfo index for a repository (None if the repo has no updateinfo)
+    the index is stored in the repo cachedir and rebuild when the updateinfo checksum changes
+    :param repo: yum repository object
+    '''
+    try:
+        checksum = repo.repoXML.getData('updateinfo').checksum[1]
+    except Exception, e: # no updateinfo in repo
+        return None
+    filename = os.path.join(repo.cachedir, INDEX_FILE)
+    index = UpdateInfoIndex.load(filename, checksum)
+    if not index:
+        logger.debug('building updateinfo index for %s' % repo.id)
+        index = UpdateInfoIndex(checksum)
+        md = UpdateMetadata()
+        md.add(repo)
+        for notice in md.get_notices():
+            index.add(notice._md)
+        index.save(filename)
+    return index
@@ -35,12 +35,16 @@ from yum.packageSack import packagesNewestByName
 from yum.Errors import *
 
 import argparse
+import profiler
 
-from common import YumDaemonBase, doTextLoggerSetup, Logger, DownloadCallback, FAKE_ATTR, NONE
+from common import YumDaemonBase, create_v2_class, doTextLoggerSetup, Logger, to_dbus_dict, to_json, FAKE_ATTR, NONE
+from daemonconfig import SYSTEM_CONFIG, USER_CONFIG
 
 version = 902 #  (00.09.02) must be integer
 DAEMON_ORG = 'org.baseurl.YumSession'
 DAEMON_INTERFACE = DAEMON_ORG
+DAEMON_INTERFACE_V2 = DAEMON_ORG+'.v2'
+DAEMON_PATH_V2 = '/v2'
 FAKE_ATTR = ['downgrades','action','pkgtags']
 NONE = json.dumps(None)
 
@@ -54,6 +58,9 @@ class AccessDeniedError(dbus.DBusException):
 class YumLockedError(dbus.DBusException):
     _dbus_error_name = DAEMON_ORG+'.YumLockedError'
 
+class YumCancelledError(dbus.DBusException):
+    _dbus_error_name = DAEMON_ORG+'.YumCancelledError'
+
 class YumNotImplementedError(dbus.DBusException):
     _dbus_error_name = DAEMON_ORG+'.YumNotImplementedError'
 
@@ -64,10 +71,15 @@ logger = logging.getLogger('yumdaemon.session')
 class YumDaemon(YumDaemonBase):
 
     def __init__(self, mainloop):
-        YumDaemonBase.__init__(self,  mainloop)
+        YumDaemonBase.__init__(self,  mainloop, [SYSTEM_CONFIG, USER_CONFIG])
         self.logger = logging.getLogger('yumdaemon-session')
-        bus_name = dbus.service.BusName(DAEMON_ORG, bus = dbus.SessionBus())
+        self.bus = dbus.SessionBus()
+        bus_name = dbus.service.BusName(DAEMON_ORG, bus = self.bus)
         dbus.service.Object.__init__(self, bus_name, '/')
+        self._watch_clients()
+        self._v2 = YumDaemonV2(self, bus_name)
+        self._cancelled_error = YumCancelledError
+        self._yum_config = None # yum config file to use (None = /etc/yum.conf)
 
 #===============================================================================
 # DBus Methods
@@ -131,6 +143,35 @@ class YumDaemon(YumDaemonBase):
         self._watchdog_disabled = not state
         return state
 
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='i',
+                                          out_signature='i',
+                                          sender_keyword='sender')
+    def SetProgressRate(self, rate, sender=None):
+        '''
+        Set the max number of progress signals (UpdateProgress, RPMProgress) per second for a file or package
+        the final progress signal for a file or package is always sent
+        :param rate: max signals per second (0 = no limit)
+        :type rate: integer (i)
+        '''
+        self._progress_throttle.max_rate = max(0, rate)
+        return self._progress_throttle.max_rate
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='',
+                                          out_signature='b',
+                                          sender_keyword='sender')
+    def Cancel(self, sender=None):
+        '''
+        Cancel the running and waiting method calls from the sender
+        the running call is stopped at the next cancel checkpoint and returns a YumCancelledError
+        :param sender:
+        :return: True if a running or waiting call was found
+        '''
+        return self._cancel(sender)
+
 
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
@@ -162,6 +203,7 @@ class YumDaemon(YumDaemonBase):
         '''
         self.working_start(sender)
         self._get_yumbase(repo_ids) # we need a new instance of YumBase, with the selected repos
+        self._yumbase_changed = True
         return self.working_ended()
 
 
@@ -225,7 +267,56 @@ class YumDaemon(YumDaemonBase):
         '''
         self.working_start(sender)
         value = self._get_package_with_attributes(pkg_filter, fields)
-        return self.working_ended(json.dumps(value))
+        return self.working_ended(to_json(value))
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='sas',
+                                          out_signature='ii',
+                                          sender_keyword='sender')
+    def OpenPackageCursor(self, pkg_filter, fields, sender=None):
+        '''
+        Open a cursor to get the result of GetPackageWithAttributes in chunks using FetchNext
+        :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
+        :param fields: yum package objects attributes to get.
+        :param sender:
+        :return: (cursor id, number of packages)
+        '''
+        self.working_start(sender)
+        value = self._open_cursor(sender, pkg_filter, fields)
+        return self.working_ended(value)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='ii',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def FetchNext(self, cursor, num, sender=None):
+        '''
+        Get the next chunk of packages from a cursor
+        :param cursor: cursor id from OpenPackageCursor
+        :param num: max number of packages to get
+        :param sender:
+        :return: list of [pkg_id, field,....] lists (JSON), empty when there is no more packages
+        '''
+        self.working_start(sender)
+        value = to_json(self._fetch_next(sender, cursor, num))
+        return self.working_ended(value)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='i',
+                                          out_signature='b',
+                                          sender_keyword='sender')
+    def CloseCursor(self, cursor, sender=None):
+        '''
+        Close a cursor before all packages is fetched
+        :param cursor: cursor id from OpenPackageCursor
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = self._close_cursor(sender, cursor)
+        return self.working_ended(value)
 
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
@@ -261,6 +352,39 @@ class YumDaemon(YumDaemonBase):
         value = self._get_attribute( id, attr)
         return self.working_ended(value)
 
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='asas',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetAttributes(self, ids, attrs, sender=None):
+        '''
+        Get a list of attributes for a list of yum package ids
+        it will return a JSON encoded list with a row of attribute values for each id
+        :param ids: list of yum package ids
+        :param attrs: list of attribute names (summary, size, description, changelog etc..)
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = to_json(self._get_attributes(ids, attrs))
+        return self.working_ended(value)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='as',
+                                          out_signature='as',
+                                          sender_keyword='sender')
+    def GetActions(self, ids, sender=None):
+        '''
+        Get the available actions for a list of yum package ids
+        it is the same as GetAttribute(id, 'action') for each id, but in one call
+        :param ids: list of yum package ids
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = self._get_actions(ids)
+        return self.working_ended(value)
+
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -285,7 +409,7 @@ class YumDaemon(YumDaemonBase):
     def Unlock(self, sender=None):
         ''' release the lock'''
         if self.check_lock(sender):
-            self._reset_yumbase()
+            self._unlock_yumbase()
             self.logger.info('UNLOCK: Lock Release by %s' % self._lock)
             self._lock = None
             return True
@@ -308,6 +432,62 @@ class YumDaemon(YumDaemonBase):
         result = self._search(fields, keys, match_all, newest_only, tags)
         return self.working_ended(result)
 
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetCacheStats(self, sender=None):
+        '''
+        Get the usage (entries, size, hits, misses etc.) of the daemon caches
+        :param sender:
+        :return: dict with cache name -> cache stats (JSON)
+        '''
+        self.working_start(sender)
+        value = to_json(self._get_cache_stats())
+        return self.working_ended(value)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetStats(self, sender=None):
+        '''
+        Get the statistics for the DBus methods (number of calls, errors and latency)
+        :param sender:
+        :return: dict with method name -> stats (JSON)
+        '''
+        return to_json(self._get_stats())
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='s',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def StartProfiling(self, mode, sender=None):
+        '''
+        Start profiling the method calls, the results is written when StopProfiling is called
+        :param mode: cprofile (a .prof file per method) or sample (collapsed stacks per method)
+        :type mode: string (s)
+        :return: the directory the results is written to
+        '''
+        if not mode in profiler.MODES:
+            raise YumNotImplementedError('Profiling mode %s is not supported' % mode)
+        return self._start_profiling(mode)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='',
+                                          out_signature='as',
+                                          sender_keyword='sender')
+    def StopProfiling(self, sender=None):
+        '''
+        Stop profiling the method calls and write the results
+        :return: list of the files written
+        '''
+        return self._stop_profiling()
+
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='',
@@ -337,6 +517,22 @@ class YumDaemon(YumDaemonBase):
         pkg_ids = self._get_group_pkgs(grp_id, grp_flt)
         return self.working_ended(pkg_ids)
 
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='s',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetAllGroupPackages(self, grp_flt, sender=None ):
+        '''
+        Get packages in all groups by grp_flt
+        :param grp_flt: Group Filter (all or default)
+        :param sender:
+        :return: JSON string with a grp_id -> [pkg_id, ...] dict
+        '''
+        self.working_start(sender)
+        value = to_json(self._get_all_group_pkgs(grp_flt))
+        return self.working_ended(value)
+
 
 
 #
@@ -398,32 +594,26 @@ class YumDaemon(YumDaemonBase):
         '''
         Get a YumBase object to work with
         '''
-        self._yumbase = yum.YumBase()
+        if self._yumbase: # close the current YumBase, so its rpmdb & files is released
+            self._reset_yumbase()
+        self._reset_caches()
+        self._warm_released = False
+        self._yumbase = self._create_yumbase()
+        if self._yum_config:
+            self._yumbase.preconf.fn = self._yum_config
         # make yum silent
         self._yumbase.preconf.errorlevel=0
         self._yumbase.preconf.debuglevel=0
         self._yumbase.setCacheDir()
-        # setup the download callback handler
-        self._yumbase.repos.setProgressBar( DownloadCallback(self) )
         if repos:
             self._enable_repos_from_list(repos)                    
-        # Disable parallel down for this repo, we dont support it
-        for repo in self._yumbase.repos.listEnabled():
-            repo._async = False
+        # setup the download callback handlers and parallel downloads
+        self._setup_downloads()
         self.logger.debug(' --> YUM LOCKED: Lockfile = %s' % self._yumbase._lockfile)
 
 
-    def _reset_yumbase(self):
-        '''
-        destroy the current YumBase object
-        '''
-        if self._yumbase:
-            self._yumbase.close()
-            self._yumbase.closeRpmDB()
-            self._yumbase.doUnlock()
-            self.logger.debug(' --> YUM UNLOCKED : Lockfile = %s' % self._yumbase._lockfile)
-            del self._yumbase
-            self._yumbase = None
+#------------------------------------------------------------------------------ Version 2 interface
+YumDaemonV2 = create_v2_class(DAEMON_INTERFACE_V2, DAEMON_PATH_V2)
 
 
 def main():
@@ -431,6 +621,13 @@ def main():
     parser.add_argument('-v', '--verbose', action='store_true')
     parser.add_argument('-d', '--debug', action='store_true')
     parser.add_argument('--notimeout', action='store_true')
+    parser.add_argument('--noworker', action='store_true', help='handle the method calls in the main loop')
+    parser.add_argument('--preload', action='store_true', help='load the yum metadata at startup')
+    parser.add_argument('--profile', choices=profiler.MODES, help='profile the method calls (cprofile or sample)')
+    parser.add_argument('--yumconf', help='yum config file to use (Ex. for benchmarks with a synthetic repo)')
+    parser.add_argument('--backend', choices=['yum', 'fake'], default='yum',
+                        help='yum or an in-memory fake backend with synthetic packages (for benchmarks & tests)')
+    parser.add_argument('--fake-packages', type=int, default=10000, help='number of packages in the fake backend')
     args = parser.parse_args()
     if args.verbose:
         if args.debug:
@@ -439,12 +636,27 @@ def main():
             doTextLoggerSetup(logroot='yumdaemon')
 
     # setup the DBus mainloop
+    if not args.noworker:
+        gobject.threads_init()
+        dbus.mainloop.glib.threads_init()
     dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
     mainloop = gobject.MainLoop()
     yd = YumDaemon(mainloop)
+    yd._yum_config = args.yumconf
+    yd._backend = args.backend
+    yd._fake_packages = args.fake_packages
+    if not args.noworker:
+        yd._setup_worker()
+    if args.preload or yd._config['preload']:
+        yd._setup_preload()
+    if args.profile:
+        yd._start_profiling(args.profile)
     if not args.notimeout:
         yd._setup_watchdog()
+    yd._setup_stats_export()
     mainloop.run()
+    yd._stop_profiling() # write the results, if profiling is still running
+    yd._export_stats() # write the stats from the last calls
 
 if __name__ == '__main__':
     main()
@@ -17,11 +17,15 @@
 # (C) 2013 - Tim Lauridsen <timlau@fedoraproject.org>
 
 import dbus
+import dbus.lowlevel
 import dbus.service
 import dbus.glib
 import gobject
 import json
+import time
+import sqlite3
 import logging
+import threading
 from datetime import datetime
 import yum
 import yum.Errors as Errors
@@ -33,16 +37,42 @@ from yum.packageSack import packagesNewestByName
 from yum.Errors import *
 
 import argparse
+import profiler
 
-from common import YumDaemonBase, doTextLoggerSetup, Logger, DownloadCallback, NONE, FAKE_ATTR
+from common import YumDaemonBase, create_v2_class, doTextLoggerSetup, Logger, DepSolveCallback, to_dbus_dict, to_json, NONE, FAKE_ATTR
 
 version = 902 #  (00.09.02) must be integer
 DAEMON_ORG = 'org.baseurl.YumSystem'
 DAEMON_INTERFACE = DAEMON_ORG
+DAEMON_INTERFACE_V2 = DAEMON_ORG+'.v2'
+DAEMON_PATH_V2 = '/v2'
 
 def _(msg):
     return msg
 
+# methods there dont need PolicyKit authorization, the calls to all other methods
+# is authorized (async) before the call is handled
+NO_AUTH_METHODS = ['GetVersion', 'Cancel', 'GetStats']
+
+HISTORY_CACHE_SIZE = 32 # max. number of cached history date interval queries
+# yum history package states -> transaction states (the same mapping as the yum history uses)
+HISTORY_STATES = {'Update' : TS_UPDATE,
+                  'Downgrade' : TS_UPDATE,
+                  'Install' : TS_INSTALL,
+                  'True-Install' : TS_TRUEINSTALL,
+                  'Dep-Install' : TS_INSTALL,
+                  'Reinstall' : TS_INSTALL,
+                  'Erase' : TS_ERASE,
+                  'Dep-Erase' : TS_ERASE,
+                  'Obsoleted' : TS_OBSOLETED,
+                  'Obsoleting' : TS_OBSOLETING,
+                  'Updated' : TS_UPDATED,
+                  'Downgraded' : TS_UPDATED}
+
+# indexes added to the yum history database, used by the history queries
+HISTORY_INDEXES = ['i_trans_end_timestamp ON trans_end (timestamp)',
+                   'i_trans_data_pkgs_tid ON trans_data_pkgs (tid)']
+
 #------------------------------------------------------------------------------ DBus Exception
 class AccessDeniedError(dbus.DBusException):
     _dbus_error_name = DAEMON_ORG+'.AccessDeniedError'
@@ -50,6 +80,9 @@ class AccessDeniedError(dbus.DBusException):
 class YumLockedError(dbus.DBusException):
     _dbus_error_name = DAEMON_ORG+'.YumLockedError'
 
+class YumCancelledError(dbus.DBusException):
+    _dbus_error_name = DAEMON_ORG+'.YumCancelledError'
+
 class YumTransactionError(dbus.DBusException):
     _dbus_error_name = DAEMON_ORG+'.YumTransactionError'
 
@@ -103,6 +136,8 @@ class RPMCallback(RPMBaseCallback):
         :param ts_current: number of processes completed in whole transaction
         :param ts_total: total number of processes in the transaction.
         """
+        if not self.base._progress_throttle.should_send((str(package), action), te_current >= te_total):
+            return
         if not isinstance(package, str): # package can be both str or yum package object
             id = self.base._get_id(package)
         else:
@@ -146,9 +181,19 @@ class YumDaemon(YumDaemonBase):
     def __init__(self, mainloop):
         YumDaemonBase.__init__(self,  mainloop)
         self.logger = logging.getLogger('yumdaemon.system')
-        bus_name = dbus.service.BusName(DAEMON_ORG, bus = dbus.SystemBus())
+        self.bus = dbus.SystemBus()
+        bus_name = dbus.service.BusName(DAEMON_ORG, bus = self.bus)
         dbus.service.Object.__init__(self, bus_name, '/')
+        self._v2 = YumDaemonV2(self, bus_name)
+        self._cancelled_error = YumCancelledError
         self._gpg_confirm = {}
+        self._auth_ttl = max(1, self._config['auth_cache_ttl']) # secs an authorization is cached
+        self._auth_cache = {}           # (sender, action) -> time the authorization expires
+        self._auth_pending = {}         # (sender, action) -> [(reply_cb, error_cb), ...] waiting for PolicyKit
+        self._auth_call = threading.local() # sender of the authorized method call running in the thread
+        self._watch_clients()
+        self._history_cache = {}        # (start, end, offset, limit) -> (max tid, expire time, [(tid, timestamp), ...])
+        self._history_indexed = None    # the yum history the indexes is checked for
 
 #===============================================================================
 # DBus Methods
@@ -218,6 +263,36 @@ class YumDaemon(YumDaemonBase):
         self._watchdog_disabled = not state
         return state
 
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='i',
+                                          out_signature='i',
+                                          sender_keyword='sender')
+    def SetProgressRate(self, rate, sender=None):
+        '''
+        Set the max number of progress signals (UpdateProgress, RPMProgress) per second for a file or package
+        the final progress signal for a file or package is always sent
+        :param rate: max signals per second (0 = no limit)
+        :type rate: integer (i)
+        '''
+        self.check_permission(sender)
+        self._progress_throttle.max_rate = max(0, rate)
+        return self._progress_throttle.max_rate
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='',
+                                          out_signature='b',
+                                          sender_keyword='sender')
+    def Cancel(self, sender=None):
+        '''
+        Cancel the running and waiting method calls from the sender
+        the running call is stopped at the next cancel checkpoint and returns a YumCancelledError
+        :param sender:
+        :return: True if a running or waiting call was found
+        '''
+        return self._cancel(sender)
+
 
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
@@ -250,6 +325,7 @@ class YumDaemon(YumDaemonBase):
         '''
         self.working_start(sender)
         self._get_yumbase(repo_ids) # we need a new instance of YumBase, with the selected repos
+        self._yumbase_changed = True
         return self.working_ended()
 
 
@@ -329,7 +405,56 @@ class YumDaemon(YumDaemonBase):
         '''
         self.working_start(sender)
         value = self._get_package_with_attributes(pkg_filter, fields)
-        return self.working_ended(json.dumps(value))
+        return self.working_ended(to_json(value))
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='sas',
+                                          out_signature='ii',
+                                          sender_keyword='sender')
+    def OpenPackageCursor(self, pkg_filter, fields, sender=None):
+        '''
+        Open a cursor to get the result of GetPackageWithAttributes in chunks using FetchNext
+        :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
+        :param fields: yum package objects attributes to get.
+        :param sender:
+        :return: (cursor id, number of packages)
+        '''
+        self.working_start(sender)
+        value = self._open_cursor(sender, pkg_filter, fields)
+        return self.working_ended(value)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='ii',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def FetchNext(self, cursor, num, sender=None):
+        '''
+        Get the next chunk of packages from a cursor
+        :param cursor: cursor id from OpenPackageCursor
+        :param num: max number of packages to get
+        :param sender:
+        :return: list of [pkg_id, field,....] lists (JSON), empty when there is no more packages
+        '''
+        self.working_start(sender)
+        value = to_json(self._fetch_next(sender, cursor, num))
+        return self.working_ended(value)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='i',
+                                          out_signature='b',
+                                          sender_keyword='sender')
+    def CloseCursor(self, cursor, sender=None):
+        '''
+        Close a cursor before all packages is fetched
+        :param cursor: cursor id from OpenPackageCursor
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = self._close_cursor(sender, cursor)
+        return self.working_ended(value)
 
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
@@ -365,6 +490,39 @@ class YumDaemon(YumDaemonBase):
         value = self._get_attribute( id, attr)
         return self.working_ended(value)
 
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='asas',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetAttributes(self, ids, attrs, sender=None):
+        '''
+        Get a list of attributes for a list of yum package ids
+        it will return a JSON encoded list with a row of attribute values for each id
+        :param ids: list of yum package ids
+        :param attrs: list of attribute names (summary, size, description, changelog etc..)
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = to_json(self._get_attributes(ids, attrs))
+        return self.working_ended(value)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='as',
+                                          out_signature='as',
+                                          sender_keyword='sender')
+    def GetActions(self, ids, sender=None):
+        '''
+        Get the available actions for a list of yum package ids
+        it is the same as GetAttribute(id, 'action') for each id, but in one call
+        :param ids: list of yum package ids
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = self._get_actions(ids)
+        return self.working_ended(value)
+
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -397,7 +555,48 @@ class YumDaemon(YumDaemonBase):
         :rtype: json encoded string
         '''
         self.working_start(sender)
-        value = json.dumps(self._get_history_transaction_pkgs(tid))
+        value = to_json(self._get_history_transaction_pkgs(tid))
+        return self.working_ended(value)
+
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='aiii',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetHistoryPackagesBulk(self, tids, offset, limit, sender=None):
+        '''
+        Get packages from a list of yum history transaction ids, in one pass
+
+        :param tids: list of history transaction ids
+        :type tids: list of integers
+        :param offset: number of packages to skip
+        :type offset: integer
+        :param limit: max. number of packages to return (0 = no limit)
+        :type limit: integer
+        :return: list of (tid, pkg_id, state, installed), newest transaction first
+        :rtype: json encoded string
+        '''
+        self.working_start(sender)
+        value = to_json(self._get_history_packages_bulk(tids, max(0, offset), limit))
+        return self.working_ended(value)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='ai',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetHistoryPackagesSummary(self, tids, sender=None):
+        '''
+        Get the number of packages in each state for a list of yum history transaction ids
+
+        :param tids: list of history transaction ids
+        :type tids: list of integers
+        :return: list of (tid, {state : number of packages}) pairs
+        :rtype: json encoded string
+        '''
+        self.working_start(sender)
+        value = to_json(self._get_history_packages_summary(tids))
         return self.working_ended(value)
 
 
@@ -418,7 +617,31 @@ class YumDaemon(YumDaemonBase):
         :type sender: json encoded string
         '''
         self.working_start(sender)
-        value = json.dumps(self._get_history_by_days(start_days, end_days))
+        value = to_json(self._get_history_by_days(start_days, end_days))
+        return self.working_ended(value)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='iiii',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetHistoryByDaysPaged(self, start_days, end_days, offset, limit, sender=None):
+        '''
+        Get a page of the History transaction in a interval of days from today
+
+        :param start_days: start of interval in days from now (0 = today)
+        :type start_days: integer
+        :param end_days:end of interval in days from now
+        :type end_days: integer
+        :param offset: number of transactions to skip (newest first)
+        :type offset: integer
+        :param limit: max. number of transactions to return (0 = no limit)
+        :type limit: integer
+        :return: a list of (transaction is, date-time) pairs
+        :type sender: json encoded string
+        '''
+        self.working_start(sender)
+        value = to_json(self._get_history_by_days(start_days, end_days, max(0, offset), limit))
         return self.working_ended(value)
 
     @Logger
@@ -435,7 +658,7 @@ class YumDaemon(YumDaemonBase):
         :type sender: json encoded string
         '''
         self.working_start(sender)
-        value = json.dumps(self._history_search(pattern))
+        value = to_json(self._history_search(pattern))
         return self.working_ended(value)
 
 
@@ -448,7 +671,7 @@ class YumDaemon(YumDaemonBase):
         ''' release the lock'''
         self.check_permission(sender)
         if self.check_lock(sender):
-            self._reset_yumbase()
+            self._unlock_yumbase()
             self.logger.info('UNLOCK: Lock Release by %s' % self._lock)
             self._lock = None
             return True
@@ -633,14 +856,22 @@ class YumDaemon(YumDaemonBase):
         '''
         Resolve dependencies of current transaction
         '''
+        return to_json(self._build_transaction_result())
+
+    def _build_transaction_result(self):
+        '''
+        Resolve dependencies of current transaction
+        return a (rc, transaction list) pair if rc = 2 (OK), else (rc, error messages)
+        '''
         self.TransactionEvent('start-build',NONE)
+        self.yumbase.dsCallback = DepSolveCallback(self) # cancel checkpoint while resolving
         rc, msgs = self.yumbase.buildTransaction()
         if rc == 2: # OK
             output = self._get_transaction_list()
         else:
             output = msgs
         self.TransactionEvent('end-build',NONE)
-        return json.dumps((rc,output))
+        return rc, output
 
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
@@ -666,14 +897,20 @@ class YumDaemon(YumDaemonBase):
             return self.working_ended(0)
         except Errors.YumGPGCheckError, errmsg: # GPG Key import needed
             return self.working_ended(1)       # return 1 to tell the client we need a ask the user for gpg import confirmation and run again           
+        except YumCancelledError:
+            self.TransactionEvent('fail',NONE)
+            self._reset_yumbase()
+            raise
         except Errors.YumBaseError, e:
-            self._can_quit = True
             if str(e) == "Didn't install any keys": #FIXME: This is crap, find a better way
                 return self.working_ended(1)       # return 1 to tell the client we need a ask the user for gpg import confirmation and run again
             self.TransactionEvent('fail',NONE)
             self._reset_yumbase()
+            self._check_cancel() # the download was aborted by cancel
             return self.working_ended(2)
             #raise YumTransactionError(str(e))
+        finally:
+            self._can_quit = True
 
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
@@ -694,6 +931,64 @@ class YumDaemon(YumDaemonBase):
         result = self._search(fields, keys, match_all, newest_only, tags)
         return self.working_ended(result)
 
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetCacheStats(self, sender=None):
+        '''
+        Get the usage (entries, size, hits, misses etc.) of the daemon caches
+        :param sender:
+        :return: dict with cache name -> cache stats (JSON)
+        '''
+        self.working_start(sender)
+        value = to_json(self._get_cache_stats())
+        return self.working_ended(value)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetStats(self, sender=None):
+        '''
+        Get the statistics for the DBus methods (number of calls, errors and latency)
+        :param sender:
+        :return: dict with method name -> stats (JSON)
+        '''
+        return to_json(self._get_stats())
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='s',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def StartProfiling(self, mode, sender=None):
+        '''
+        Start profiling the method calls, the results is written when StopProfiling is called
+        :param mode: cprofile (a .prof file per method) or sample (collapsed stacks per method)
+        :type mode: string (s)
+        :return: the directory the results is written to
+        '''
+        self.check_permission(sender)
+        if not mode in profiler.MODES:
+            raise YumNotImplementedError('Profiling mode %s is not supported' % mode)
+        return self._start_profiling(mode)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='',
+                                          out_signature='as',
+                                          sender_keyword='sender')
+    def StopProfiling(self, sender=None):
+        '''
+        Stop profiling the method calls and write the results
+        :return: list of the files written
+        '''
+        self.check_permission(sender)
+        return self._stop_profiling()
+
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='',
@@ -724,6 +1019,22 @@ class YumDaemon(YumDaemonBase):
         pkg_ids = self._get_group_pkgs(grp_id, grp_flt)
         return self.working_ended(pkg_ids)
 
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='s',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetAllGroupPackages(self, grp_flt, sender=None ):
+        '''
+        Get packages in all groups by grp_flt
+        :param grp_flt: Group Filter (all or default)
+        :param sender:
+        :return: JSON string with a grp_id -> [pkg_id, ...] dict
+        '''
+        self.working_start(sender)
+        value = to_json(self._get_all_group_pkgs(grp_flt))
+        return self.working_ended(value)
+
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='sb',
@@ -854,22 +1165,100 @@ class YumDaemon(YumDaemonBase):
     def _set_option(self, option, value):
         if hasattr(self.yumbase.conf, option):
             setattr(self.yumbase.conf, option, value)
+            self._yumbase_changed = True
             self.logger.debug(_("Setting Yum Option %s = %s") % (option, value))
             for repo in self.yumbase.repos.repos.values():
                 if repo.isEnabled():
                     if hasattr(repo, option):
                         setattr(repo, option, value)
                         self.logger.debug("Setting Yum Option %s = %s (%s)" % (option, value, repo.id), __name__)
+            self._reset_caches() # the cached package lists, indexes etc. can depend on the option
             return True
         else:
             return False
 
 
-    def _get_history_by_days(self, start, end):
+    def _get_history_by_days(self, start, end, offset=0, limit=0):
         '''
         Get the yum history transaction member located in a date interval from today
         :param start: start days from today
         :param end: end days from today
+        :param offset: number of transactions to skip
+        :param limit: max. number of transactions to return (0 = no limit)
+        '''
+        try:
+            rows = self._query_history_by_days(start, end, offset, limit)
+        except sqlite3.Error, e: # no history database, fallback to the yum history api
+            self.logger.debug('history query failed, using yum history : %s' % str(e))
+            rows = [(ht.tid, ht.end_timestamp) for ht in self._get_history_trans_by_days(start, end)]
+            if limit > 0:
+                rows = rows[offset:offset+limit]
+            else:
+                rows = rows[offset:]
+        return [(tid, datetime.fromtimestamp(tm).isoformat()) for tid, tm in rows]
+
+    def _query_history_by_days(self, start, end, offset=0, limit=0):
+        '''
+        return a list of (tid, end timestamp) for the transactions located in a date interval from today
+        (newest first), queried from the history database using an index on the end timestamp.
+        The result is cached until a new transaction is added or a transaction moves in or out of the interval
+        :param start: start days from today
+        :param end: end days from today
+        :param offset: number of transactions to skip
+        :param limit: max. number of transactions to return (0 = no limit)
+        '''
+        cur = self._get_history_cursor()
+        cur.execute('SELECT MAX(tid) FROM trans_end')
+        max_tid = cur.fetchone()[0]
+        now = time.time()
+        cache_key = (start, end, offset, limit)
+        cached = self._history_cache.get(cache_key)
+        if cached and cached[0] == max_tid and now < cached[1]:
+            return cached[2]
+        # the same bounds as the days of datetime.now() - end time (start <= days <= end)
+        upper = now - start * 86400
+        lower = now - (end + 1) * 86400
+        cur.execute('''SELECT tid, timestamp FROM trans_end WHERE timestamp <= ? AND timestamp > ?
+                       ORDER BY tid DESC LIMIT ? OFFSET ?''', (upper, lower, limit if limit > 0 else -1, offset))
+        rows = cur.fetchall()
+        # the result is valid until the oldest transaction leaves the interval or the next one enters it
+        cur.execute('SELECT MIN(timestamp) FROM trans_end WHERE timestamp <= ? AND timestamp > ?', (upper, lower))
+        oldest_tm = cur.fetchone()[0]
+        expire = (oldest_tm if oldest_tm is not None else now) + (end + 1) * 86400
+        cur.execute('SELECT MIN(timestamp) FROM trans_end WHERE timestamp > ?', (upper,))
+        next_tm = cur.fetchone()[0]
+        if next_tm is not None:
+            expire = min(expire, next_tm + start * 86400)
+        if len(self._history_cache) >= HISTORY_CACHE_SIZE:
+            self._history_cache = {}
+        self._history_cache[cache_key] = (max_tid, expire, rows)
+        return rows
+
+    def _get_history_cursor(self):
+        '''
+        return a cursor for the yum history database, the indexes used by the history queries
+        is created the first time
+        '''
+        history = self.yumbase.history
+        cur = history._get_cursor()
+        if cur is None:
+            raise sqlite3.Error('history database is not available')
+        if self._history_indexed is not history:
+            self._history_indexed = history
+            try:
+                for index in HISTORY_INDEXES:
+                    cur.execute('CREATE INDEX IF NOT EXISTS %s' % index)
+                history._commit()
+            except sqlite3.Error, e: # read-only database, query without the indexes
+                self.logger.debug('could not create history index : %s' % str(e))
+        return cur
+
+    def _get_history_trans_by_days(self, start, end):
+        '''
+        Get the yum history transaction member located in a date interval from today
+        (using the yum history api, loading all transactions)
+        :param start: start days from today
+        :param end: end days from today
         '''
         now = datetime.now()
         history = self.yumbase.history.old()
@@ -885,7 +1274,7 @@ class YumDaemon(YumDaemonBase):
             elif delta.days > end: # after end days
                 break
             result.append(ht)
-        return self._get_id_time_list(result)
+        return result
 
     def _history_search(self, pattern):
         '''
@@ -911,6 +1300,89 @@ class YumDaemon(YumDaemonBase):
             result.append(elem)
         return result
 
+    def _get_history_packages_bulk(self, tids, offset=0, limit=0):
+        '''
+        return a list of (tid, pkg_id, tx_state, installed_state) for the packages in a list of
+        yum history transactions (newest transaction first)
+        :param tids: list of history transaction ids
+        :param offset: number of packages to skip
+        :param limit: max. number of packages to return (0 = no limit)
+        '''
+        if not tids:
+            return []
+        try:
+            return self._query_history_packages(tids, offset, limit)
+        except sqlite3.Error, e: # fallback to the yum history api
+            self.logger.debug('history query failed, using yum history : %s' % str(e))
+        result = []
+        for tid in sorted(set([int(tid) for tid in tids]), reverse=True):
+            for (pkg_id, state, state_installed) in self._get_history_transaction_pkgs(tid):
+                result.append((tid, pkg_id, state, state_installed))
+        if limit > 0:
+            return result[offset:offset+limit]
+        return result[offset:]
+
+    def _query_history_packages(self, tids, offset, limit):
+        '''
+        return a list of (tid, pkg_id, tx_state, installed_state) for the packages in a list of
+        yum history transactions, queried from the history database in one pass
+        '''
+        cur = self._get_history_cursor()
+        sql = '''SELECT t.tid, p.name, p.epoch, p.version, p.release, p.arch, t.state, r.yumdb_val, v.yumdb_val
+                 FROM trans_data_pkgs t JOIN pkgtups p ON p.pkgtupid = t.pkgtupid
+                 LEFT JOIN pkg_yumdb r ON r.pkgtupid = t.pkgtupid AND r.yumdb_key = 'from_repo'
+                 LEFT JOIN pkg_yumdb v ON v.pkgtupid = t.pkgtupid AND v.yumdb_key = 'releasever'
+                 WHERE t.tid IN (%s)
+                 ORDER BY t.tid DESC, p.name, p.arch, p.epoch, p.version, p.release
+                 LIMIT ? OFFSET ?''' % ','.join([str(int(tid)) for tid in set(tids)])
+        cur.execute(sql, (limit if limit > 0 else -1, offset))
+        releasever = self.yumbase.conf.yumvar.get('releasever')
+        result = []
+        for (tid, n, e, v, r, a, state, from_repo, pkg_releasever) in cur.fetchall():
+            # the same repo as YumHistoryPackage.ui_from_repo
+            if from_repo is None:
+                repo = '<history>'
+            elif pkg_releasever is not None and pkg_releasever != releasever:
+                repo = '@%s/%s' % (from_repo, pkg_releasever)
+            else:
+                repo = '@' + from_repo
+            result.append((tid, ",".join([n, e, v, r, a, repo]), state, self._get_history_state_installed(state)))
+        return result
+
+    def _get_history_state_installed(self, state):
+        '''
+        return if a package is installed after a transaction with a given history state,
+        the same as the state_installed of the yum history packages (None = unchanged)
+        '''
+        code = HISTORY_STATES.get(state)
+        if code in TS_INSTALL_STATES:
+            return True
+        if code in TS_REMOVE_STATES:
+            return False
+        return None
+
+    def _get_history_packages_summary(self, tids):
+        '''
+        return a list of (tid, {tx_state : number of packages}) for a list of yum history transactions
+        :param tids: list of history transaction ids
+        '''
+        tids = [int(tid) for tid in tids]
+        counts = dict([(tid, {}) for tid in tids])
+        if not tids:
+            return []
+        try:
+            cur = self._get_history_cursor()
+            cur.execute('''SELECT tid, state, COUNT(*) FROM trans_data_pkgs WHERE tid IN (%s)
+                           GROUP BY tid, state''' % ','.join([str(tid) for tid in set(tids)]))
+            for (tid, state, count) in cur.fetchall():
+                counts[tid][state] = count
+        except sqlite3.Error, e: # fallback to the yum history api
+            self.logger.debug('history query failed, using yum history : %s' % str(e))
+            for tid in set(tids):
+                for (pkg_id, state, state_installed) in self._get_history_transaction_pkgs(tid):
+                    counts[tid][state] = counts[tid].get(state, 0) + 1
+        return [(tid, counts[tid]) for tid in tids]
+
     def _get_transaction_list(self):
         '''
         Generate a list of the current transaction
@@ -980,68 +1452,203 @@ class YumDaemon(YumDaemonBase):
     
 
     def check_permission(self, sender):
-        ''' Check for senders permission to run root stuff'''
-        if sender in self.authorized_sender:
+        '''
+        Check for senders permission to run root stuff
+        the method calls is authorized by PolicyKit (async) before they are handled (see _dispatch),
+        so it only checks the running call from the sender has been authorized
+        '''
+        if not sender: raise ValueError('sender == None')
+        if getattr(self._auth_call, 'sender', None) != sender:
+            raise AccessDeniedError('Session is not authorized')
+
+    def _get_polkit(self):
+        obj = self.bus.get_object('org.freedesktop.PolicyKit1', '/org/freedesktop/PolicyKit1/Authority')
+        return dbus.Interface(obj, 'org.freedesktop.PolicyKit1.Authority')
+
+    def _is_authorized(self, sender, action):
+        '''
+        Check if the sender has a cached authorization for an action
+        '''
+        expires = self._auth_cache.get((sender, action))
+        if expires is None:
+            return False
+        if expires < time.time():
+            self._auth_cache.pop((sender, action), None)
+            return False
+        return True
+
+    def _add_authorized(self, sender, action):
+        self._auth_cache[(sender, action)] = time.time() + self._auth_ttl
+
+    def _check_permission_async(self, sender, action, reply_cb, error_cb):
+        '''
+        check senders permissions using PolicyKit1, without blocking the main loop
+        while the user is answering the authentication dialog.
+        reply_cb() is called if the sender is authorized, else error_cb(error)
+        the checks for the same sender & action is done by a single PolicyKit call
+        '''
+        key = (sender, action)
+        if key in self._auth_pending:
+            self._auth_pending[key].append((reply_cb, error_cb))
             return
-        else:
-            self._check_permission(sender)
-            self.authorized_sender.add(sender)
+        self._auth_pending[key] = [(reply_cb, error_cb)]
 
+        def on_reply(result):
+            (granted, _, details) = result
+            if granted:
+                self._add_authorized(sender, action)
+                auth_done(None)
+            else:
+                auth_done(AccessDeniedError('Session is not authorized'))
 
-    def _check_permission(self, sender):
+        def on_error(err):
+            self.logger.error('PolicyKit check failed for %s : %s' % (sender, str(err)))
+            auth_done(AccessDeniedError('Session is not authorized'))
+
+        def auth_done(error):
+            for reply_cb, error_cb in self._auth_pending.pop(key, []):
+                if error:
+                    error_cb(error)
+                else:
+                    reply_cb()
+
+        self._get_polkit().CheckAuthorization(
+                ('system-bus-name', {'name': sender}), action, {}, dbus.UInt32(1), '', timeout=600,
+                reply_handler=on_reply, error_handler=on_error)
+
+    def _dispatch(self, message_cb, obj, connection, message):
         '''
-        check senders permissions using PolicyKit1
-        :param sender:
+        The method calls (except the standard DBus interfaces and NO_AUTH_METHODS) is authorized by
+        PolicyKit (async) before it is handled, the reply for the call is sent when the authorization is done.
         '''
-        if not sender: raise ValueError('sender == None')
+        sender = message.get_sender()
+        interface = message.get_interface() or ''
+        if interface.startswith('org.freedesktop.DBus') or message.get_member() in NO_AUTH_METHODS:
+            YumDaemonBase._dispatch(self, message_cb, obj, connection, message)
+            return
 
-        obj = dbus.SystemBus().get_object('org.freedesktop.PolicyKit1', '/org/freedesktop/PolicyKit1/Authority')
-        obj = dbus.Interface(obj, 'org.freedesktop.PolicyKit1.Authority')
-        (granted, _, details) = obj.CheckAuthorization(
-                ('system-bus-name', {'name': sender}), DAEMON_ORG, {}, dbus.UInt32(1), '', timeout=600)
-        if not granted:
-            raise AccessDeniedError('Session is not authorized')
+        def authorized_cb(obj, connection, message):
+            self._auth_call.sender = sender
+            try:
+                message_cb(obj, connection, message)
+            finally:
+                self._auth_call.sender = None
+
+        if self._is_authorized(sender, DAEMON_ORG):
+            YumDaemonBase._dispatch(self, authorized_cb, obj, connection, message)
+        else:
+            def on_denied(error):
+                connection.send_message(dbus.lowlevel.ErrorMessage(message, error._dbus_error_name, str(error)))
+            self._check_permission_async(sender, DAEMON_ORG,
+                                         lambda: YumDaemonBase._dispatch(self, authorized_cb, obj, connection, message),
+                                         on_denied)
+
+    def _on_name_owner_changed(self, name, old_owner, new_owner):
+        '''
+        Remove the cached authorizations and the cursors for a client, when it disconnects from the bus
+        '''
+        YumDaemonBase._on_name_owner_changed(self, name, old_owner, new_owner)
+        if not new_owner:
+            for key in self._auth_cache.keys():
+                if key[0] in (name, old_owner):
+                    del self._auth_cache[key]
 
     def _get_yumbase(self, repos=[]):
         '''
         Get a YumBase object to work with
         '''
+        if self._yumbase: # close the current YumBase, so its rpmdb, files & yum lock is released
+            self._reset_yumbase()
+        self._reset_caches()
+        self._warm_released = False
         self._yumbase = DaemonYumBase(self)
         # make yum silent
         self._yumbase.preconf.errorlevel=0
         self._yumbase.preconf.debuglevel=0
         #self._yumbase.doConfigSetup()
-        # setup the download callback handler
-        self._yumbase.repos.setProgressBar( DownloadCallback(self) )
         if repos:
             self._enable_repos_from_list(repos)            
-        # Disable parallel down for this repo, we dont support it
-        for repo in self._yumbase.repos.listEnabled():
-            repo._async = False
+        # setup the download callback handlers and parallel downloads
+        self._setup_downloads()
 
         self._yumbase.doLock()
         self.logger.debug(' --> YUM LOCKED: Lockfile = %s' % self._yumbase._lockfile)
-        ygh = self._yumbase.doPackageLists("updates") # make sure the basic stuff is up and running
+        # the package lists can be served from the snapshot, if it is made from the current metadata
+        # (the snapshot key is made from the repomd checksums, so expired metadata is refreshed by yum)
+        if not self._load_snapshot():
+            ygh = self._yumbase.doPackageLists("updates") # make sure the basic stuff is up and running
 
-    def _reset_yumbase(self):
+    def _warm_up(self):
         '''
-        destroy the current YumBase object
+        Reopen a released YumBase, and get the yum lock again
         '''
-        if self._yumbase:
-            self._yumbase.close()
-            self._yumbase.closeRpmDB()
-            self._yumbase.doUnlock()
-            self.logger.debug(' --> YUM UNLOCKED : Lockfile = %s' % self._yumbase._lockfile)
-            del self._yumbase
-            self._yumbase = None
+        reused = YumDaemonBase._warm_up(self)
+        if reused:
+            self._yumbase.doLock()
+        return reused
 
 
+#------------------------------------------------------------------------------ Version 2 interface
+class YumDaemonV2(create_v2_class(DAEMON_INTERFACE_V2, DAEMON_PATH_V2)):
+    '''
+    Version 2 of the DBus API, with the transaction methods only found in the system daemon
+    '''
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE_V2,
+                                          in_signature='',
+                                          out_signature='a((ssssss)s)',
+                                          sender_keyword='sender')
+    def GetTransaction(self, sender=None):
+        '''
+        Return the members of the current transaction as (package, ts_state) pairs
+        '''
+        self.daemon.working_start(sender)
+        value = []
+        for txmbr in self.daemon.yumbase.tsInfo:
+            pkg = self.daemon._get_pkg_tuple(self.daemon._get_id(txmbr.po))
+            value.append((pkg, txmbr.ts_state))
+        return self.daemon.working_ended(value)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE_V2,
+                                          in_signature='',
+                                          out_signature='(iasa(sa((ssssss)da(ssssss))))',
+                                          sender_keyword='sender')
+    def BuildTransaction(self, sender=None):
+        '''
+        Resolve dependencies of current transaction
+        return (rc, error messages, [(action, [(package, size, [obsoleted package, ...]), ...]), ...])
+        rc = 2 is ok, else failure and the error messages is set
+        '''
+        self.daemon.working_start(sender)
+        rc, output = self.daemon._build_transaction_result()
+        if rc == 2:
+            msgs = []
+            result = []
+            for action, pkgs in output:
+                pkg_list = []
+                for (id, size, obs_ids) in pkgs:
+                    if not isinstance(size, float): # the size of skipped packages is a formatted string
+                        size = 0.0
+                    obs = [self.daemon._get_pkg_tuple(obs_id) for obs_id in obs_ids]
+                    pkg_list.append((self.daemon._get_pkg_tuple(id), size, obs))
+                result.append((action, pkg_list))
+        else:
+            msgs = [str(msg) for msg in output]
+            result = []
+        value = (rc, dbus.Array(msgs, signature='s'), dbus.Array(result, signature='(sa((ssssss)da(ssssss)))'))
+        return self.daemon.working_ended(value)
+
 
 def main():
     parser = argparse.ArgumentParser(description='Yum D-Bus Daemon')
     parser.add_argument('-v', '--verbose', action='store_true')
     parser.add_argument('-d', '--debug', action='store_true')
     parser.add_argument('--notimeout', action='store_true')
+    parser.add_argument('--noworker', action='store_true', help='handle the method calls in the main loop')
+    parser.add_argument('--preload', action='store_true', help='load the yum metadata at startup')
+    parser.add_argument('--profile', choices=profiler.MODES, help='profile the method calls (cprofile or sample)')
     args = parser.parse_args()
     if args.verbose:
         if args.debug:
@@ -1050,12 +1657,24 @@ def main():
             doTextLoggerSetup(logroot='yumdaemon')
 
     # setup the DBus mainloop
+    if not args.noworker:
+        gobject.threads_init()
+        dbus.mainloop.glib.threads_init()
     dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
     mainloop = gobject.MainLoop()
     yd = YumDaemon(mainloop)
+    if not args.noworker:
+        yd._setup_worker()
+    if args.preload or yd._config['preload']:
+        yd._setup_preload()
+    if args.profile:
+        yd._start_profiling(args.profile)
     if not args.notimeout:
         yd._setup_watchdog()
+    yd._setup_stats_export()
     mainloop.run()
+    yd._stop_profiling() # write the results, if profiling is still running
+    yd._export_stats() # write the stats from the last calls
 
 if __name__ == '__main__':
     main()